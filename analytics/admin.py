@@ -0,0 +1,36 @@
+from django.contrib import admin
+from .models import DailySales, DailyProductSales, DailyDiscountUsage, RelatedProduct, RollupWatermark
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'orders_count', 'gross_revenue', 'net_revenue', 'discount_total', 'payments_amount', 'enrollments_count')
+    date_hierarchy = 'day'
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'product', 'category', 'orders_count', 'revenue', 'enrollments_count')
+    list_filter = ('category',)
+    list_select_related = ('product', 'category')
+    date_hierarchy = 'day'
+
+
+@admin.register(DailyDiscountUsage)
+class DailyDiscountUsageAdmin(admin.ModelAdmin):
+    list_display = ('day', 'discount_code', 'orders_count', 'net_revenue', 'discount_total')
+    list_select_related = ('discount_code',)
+    date_hierarchy = 'day'
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value', 'updated_at')
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'related', 'score', 'support')
+    list_select_related = ('product', 'related')
+    raw_id_fields = ('product', 'related')
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from analytics.rollups import refresh
+
+
+class Command(BaseCommand):
+    help = "Refresh the daily sales rollups for days touched since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Recompute every day from this date (YYYY-MM-DD), ignoring the watermark.")
+        parser.add_argument('--until', help="Last day to recompute when --since is given (defaults to --since).")
+
+    def handle(self, *args, since, until, **options):
+        days = None
+        if since:
+            first, last = parse_date(since), parse_date(until or since)
+            if first is None or last is None or last < first:
+                raise CommandError("Invalid --since/--until range.")
+            days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+
+        refreshed = refresh(days)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(refreshed)} day(s)."))
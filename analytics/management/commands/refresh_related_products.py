@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from analytics.related import np, refresh
+
+
+class Command(BaseCommand):
+    help = "Recompute \"students also bought\" neighbours for products whose baskets changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every product.")
+
+    def handle(self, *args, full, **options):
+        if np is None:
+            self.stderr.write("NumPy is not installed; using the slower pure-Python counter.")
+        summary = refresh(full=full)
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['products']} product(s), {summary['neighbours']} neighbour(s) stored ({summary['engine']})."
+        ))
@@ -0,0 +1,93 @@
+from decimal import Decimal
+from django.db import models
+from products.models import Category, Product
+from users.models import DiscountCode
+
+
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    orders_count = models.PositiveIntegerField(default=0)
+    items_count = models.PositiveIntegerField(default=0)
+    gross_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    net_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    payments_count = models.PositiveIntegerField(default=0)
+    payments_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    enrollments_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = 'فروش روزانه'
+        verbose_name_plural = 'فروش روزانه'
+
+    def __str__(self):
+        return f"فروش {self.day}"
+
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    enrollments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['day', 'product']
+        indexes = [models.Index(fields=['category', 'day'])]
+        verbose_name = 'فروش روزانه دوره'
+        verbose_name_plural = 'فروش روزانه دوره‌ها'
+
+    def __str__(self):
+        return f"{self.product_id} در {self.day}"
+
+
+class DailyDiscountUsage(models.Model):
+    day = models.DateField()
+    discount_code = models.ForeignKey(DiscountCode, on_delete=models.CASCADE, related_name='daily_usage')
+    orders_count = models.PositiveIntegerField(default=0)
+    gross_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    net_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['day', 'discount_code']
+        verbose_name = 'استفاده روزانه از کد تخفیف'
+        verbose_name_plural = 'استفاده روزانه از کدهای تخفیف'
+
+    def __str__(self):
+        return f"{self.discount_code_id} در {self.day}"
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'نشانگر به‌روزرسانی'
+        verbose_name_plural = 'نشانگرهای به‌روزرسانی'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class RelatedProduct(models.Model):
+    """Top-K "students also bought" neighbours of a product, rebuilt by analytics/related.py."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    support = models.PositiveIntegerField(help_text='تعداد دانشجویان مشترک')
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'rank']
+        verbose_name = 'دوره مرتبط'
+        verbose_name_plural = 'دوره‌های مرتبط'
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
@@ -0,0 +1,186 @@
+"""
+"Students also bought" neighbours.
+
+Each student's active enrollments form a basket. For product ``i``, the
+co-occurrence count ``C[i, j]`` is the number of students enrolled in both
+``i`` and ``j``. The score is the cosine similarity ``C[i, j] / sqrt(n_i * n_j)``,
+where ``n`` is a product's student count. The best ``RELATED_TOP_K``
+neighbours with at least ``RELATED_MIN_SUPPORT`` shared students are stored
+in ``RelatedProduct``.
+
+Enrollments are streamed in user order with a server-side cursor. Products are
+processed in blocks of ``RELATED_BLOCK_ROWS`` rows, so memory is bounded by
+block size × number of products, not by the number of enrollments. With
+NumPy each batch of baskets becomes a 0/1 matrix ``X``, and the block's counts
+are accumulated as ``X[:, block].T @ X``. Without NumPy a plain loop gives the
+same result, more slowly.
+
+An incremental refresh recomputes only the products in baskets that changed
+since the last run (new enrollments or newly paid orders). Other products keep
+their rows even though the student counts in their scores have moved a
+little, so run ``--full`` now and then (it also drops neighbours of refunded
+enrollments).
+"""
+import math
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from products.models import Product
+from users.models import CourseEnrollment
+from .models import RelatedProduct, RollupWatermark
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+WATERMARK_NAME = 'related_products'
+WATERMARK_OVERLAP = timedelta(minutes=5)
+# Upper bound on the cells of one dense basket matrix (~64 MB of float32).
+MAX_BATCH_CELLS = 2 ** 24
+
+
+def _enrollments():
+    return CourseEnrollment.objects.filter(is_active=True)
+
+
+def _baskets(rows=None, chunk_size=10000):
+    """Product ids of each student, optionally only students enrolled in one of ``rows``."""
+    queryset = _enrollments()
+    if rows is not None:
+        queryset = queryset.filter(user_id__in=_enrollments().filter(product_id__in=rows).values('user_id'))
+    pairs = queryset.order_by('user_id', 'product_id').values_list('user_id', 'product_id').iterator(chunk_size=chunk_size)
+    for _, group in groupby(pairs, key=itemgetter(0)):
+        yield [product_id for _, product_id in group]
+
+
+def _ranked(candidates, k):
+    """``candidates`` is ``[(score, support, product_id)]``; best first, ties by support then id."""
+    candidates.sort(key=lambda c: (-c[0], -c[1], c[2]))
+    return [(product_id, score, support) for score, support, product_id in candidates[:k]]
+
+
+def _neighbours_python(rows, students, baskets, k, min_support):
+    row_set = set(rows)
+    counts = {row: {} for row in rows}
+    for basket in baskets:
+        for i in basket:
+            if i in row_set:
+                row_counts = counts[i]
+                for j in basket:
+                    row_counts[j] = row_counts.get(j, 0) + 1
+    result = {}
+    for i in rows:
+        candidates = [
+            (support / math.sqrt(students[i] * students[j]), support, j)
+            for j, support in counts[i].items() if j != i and support >= min_support
+        ]
+        result[i] = _ranked(candidates, k)
+    return result
+
+
+def _neighbours_numpy(rows, students, baskets, k, min_support):
+    columns = sorted(students)
+    position = {product_id: n for n, product_id in enumerate(columns)}
+    row_columns = np.array([position[i] for i in rows])
+    counts = np.zeros((len(rows), len(columns)), dtype=np.int64)
+    batch_size = max(64, min(4096, MAX_BATCH_CELLS // max(len(columns), 1)))
+
+    def accumulate(batch):
+        users = np.repeat(np.arange(len(batch)), [len(basket) for basket in batch])
+        cells = np.fromiter((position[p] for basket in batch for p in basket), dtype=np.int64, count=len(users))
+        matrix = np.zeros((len(batch), len(columns)), dtype=np.float32)
+        matrix[users, cells] = 1
+        # Exact: every product of the batch is at most len(batch) <= 4096.
+        counts[:] += (matrix[:, row_columns].T @ matrix).astype(np.int64)
+
+    batch = []
+    for basket in baskets:
+        batch.append(basket)
+        if len(batch) == batch_size:
+            accumulate(batch)
+            batch = []
+    if batch:
+        accumulate(batch)
+
+    n = np.array([students[product_id] for product_id in columns], dtype=np.float64)
+    column_ids = np.array(columns)
+    result = {}
+    for r, i in enumerate(rows):
+        row = counts[r]
+        keep = np.flatnonzero(row >= min_support)
+        keep = keep[column_ids[keep] != i]
+        support = row[keep]
+        score = support / np.sqrt(students[i] * n[keep])
+        order = np.lexsort((column_ids[keep], -support, -score))[:k]
+        result[i] = [
+            (int(column_ids[keep][o]), float(score[o]), int(support[o])) for o in order
+        ]
+    return result
+
+
+def _store(neighbours):
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=list(neighbours)).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score, support=support)
+            for product_id, ranked in neighbours.items()
+            for rank, (related_id, score, support) in enumerate(ranked, start=1)
+        ], batch_size=1000)
+
+
+def build(product_ids=None, use_numpy=None):
+    """Recompute the neighbours of ``product_ids`` (default: every product). Returns a summary dict."""
+    k = getattr(settings, 'RELATED_TOP_K', 10)
+    min_support = max(1, getattr(settings, 'RELATED_MIN_SUPPORT', 2))
+    block_rows = getattr(settings, 'RELATED_BLOCK_ROWS', 2000)
+    use_numpy = np is not None if use_numpy is None else use_numpy
+    neighbours_of = _neighbours_numpy if use_numpy else _neighbours_python
+
+    students = dict(_enrollments().values('product_id').annotate(n=Count('id')).values_list('product_id', 'n'))
+    existing = set(Product.objects.values_list('pk', flat=True))
+    rows = sorted(existing if product_ids is None else set(product_ids) & existing)
+    # Products nobody is enrolled in have no neighbours; only their old rows need clearing.
+    empty = {i: [] for i in rows if i not in students}
+    rows = [i for i in rows if i in students]
+    if empty:
+        _store(empty)
+
+    stored = 0
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        everyone = product_ids is None and len(rows) <= block_rows
+        neighbours = neighbours_of(block, students, _baskets(None if everyone else block), k, min_support)
+        _store(neighbours)
+        stored += sum(len(ranked) for ranked in neighbours.values())
+    return {
+        'products': len(rows) + len(empty),
+        'neighbours': stored,
+        'engine': 'numpy' if use_numpy else 'python',
+    }
+
+
+def changed_products(since):
+    """Products in the basket of any student whose enrollments changed since ``since``."""
+    touched = _enrollments().filter(Q(enrolled_at__gte=since) | Q(order__payments__paid_at__gte=since))
+    return set(
+        _enrollments().filter(user_id__in=touched.values('user_id')).values_list('product_id', flat=True).distinct()
+    )
+
+
+def refresh(full=False):
+    now = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    if full or watermark is None:
+        summary = build()
+    else:
+        summary = build(changed_products(watermark.value - WATERMARK_OVERLAP))
+    RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': now})
+    return summary
@@ -0,0 +1,136 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from users.models import Order, OrderItem, PaymentHistory, CourseEnrollment
+from .models import DailySales, DailyProductSales, DailyDiscountUsage, RollupWatermark
+
+
+WATERMARK_NAME = 'sales'
+# Rows committed slightly out of created_at order are still picked up by the next run.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+ZERO = Decimal('0.00')
+# List price of the items; OrderItem.price is what was charged after the discount.
+GROSS = Sum(F('price') + F('discount'))
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _dates(queryset, field):
+    return set(
+        queryset.annotate(day=TruncDate(field)).values_list('day', flat=True).distinct()
+    )
+
+
+# Payments change after they are created (settled, refunded), so they are
+# picked up by updated_at and mark every day their totals count towards,
+# including their order's: orders only count once paid.
+PAYMENT_DAY_FIELDS = ('created_at', 'paid_at', 'order__created_at')
+
+
+def touched_days(since=None):
+    querysets = [
+        (Order.objects.all(), 'created_at'),
+        (CourseEnrollment.objects.all(), 'enrolled_at'),
+    ]
+    days = set()
+    for queryset, field in querysets:
+        if since is not None:
+            queryset = queryset.filter(**{f'{field}__gte': since})
+        days |= _dates(queryset, field)
+    payments = PaymentHistory.objects.all() if since is None else PaymentHistory.objects.filter(updated_at__gte=since)
+    for field in PAYMENT_DAY_FIELDS:
+        days |= _dates(payments.filter(**{f'{field}__isnull': False}), field)
+    return days
+
+
+def _paid(order_ref):
+    return Exists(PaymentHistory.objects.filter(order=OuterRef(order_ref), status='completed'))
+
+
+def rollup_day(day):
+    """Sales of the orders placed on ``day`` that have been paid (checkout creates them before payment)."""
+    start, end = day_bounds(day)
+    orders = Order.objects.filter(_paid('pk'), created_at__gte=start, created_at__lt=end)
+    items = OrderItem.objects.filter(order__in=orders)
+
+    products = {}
+    for row in items.values('product_id', 'product__category_id').annotate(
+        orders=Count('order_id', distinct=True), revenue=Sum('price')
+    ):
+        products[row['product_id']] = DailyProductSales(
+            day=day, product_id=row['product_id'], category_id=row['product__category_id'],
+            orders_count=row['orders'], revenue=row['revenue'] or ZERO,
+        )
+    enrollments = CourseEnrollment.objects.filter(
+        Q(order__isnull=True) | _paid('order'), enrolled_at__gte=start, enrolled_at__lt=end,
+    )
+    for row in enrollments.values('product_id', 'product__category_id').annotate(count=Count('id')):
+        entry = products.setdefault(row['product_id'], DailyProductSales(
+            day=day, product_id=row['product_id'], category_id=row['product__category_id'],
+        ))
+        entry.enrollments_count = row['count']
+
+    gross_by_code = dict(
+        items.filter(order__discount_code__isnull=False)
+        .values_list('order__discount_code_id').annotate(gross=GROSS)
+    )
+    discounts = [
+        DailyDiscountUsage(
+            day=day, discount_code_id=row['discount_code_id'], orders_count=row['orders'],
+            gross_revenue=gross_by_code.get(row['discount_code_id']) or ZERO,
+            net_revenue=row['net'] or ZERO,
+            discount_total=(gross_by_code.get(row['discount_code_id']) or ZERO) - (row['net'] or ZERO),
+        )
+        for row in orders.filter(discount_code__isnull=False).values('discount_code_id').annotate(
+            orders=Count('id'), net=Sum('total')
+        )
+    ]
+
+    order_totals = orders.aggregate(count=Count('id'), net=Sum('total'))
+    item_totals = items.aggregate(count=Count('id'), gross=GROSS)
+    payment_totals = PaymentHistory.objects.filter(status='completed').filter(
+        Q(paid_at__gte=start, paid_at__lt=end)
+        | Q(paid_at__isnull=True, created_at__gte=start, created_at__lt=end)
+    ).aggregate(count=Count('id'), amount=Sum('amount'))
+    gross = item_totals['gross'] or ZERO
+    net = order_totals['net'] or ZERO
+
+    with transaction.atomic():
+        DailyProductSales.objects.filter(day=day).delete()
+        DailyProductSales.objects.bulk_create(products.values())
+        DailyDiscountUsage.objects.filter(day=day).delete()
+        DailyDiscountUsage.objects.bulk_create(discounts)
+        DailySales.objects.update_or_create(day=day, defaults={
+            'orders_count': order_totals['count'],
+            'items_count': item_totals['count'],
+            'gross_revenue': gross,
+            'net_revenue': net,
+            'discount_total': gross - net,
+            'payments_count': payment_totals['count'],
+            'payments_amount': payment_totals['amount'] or ZERO,
+            'enrollments_count': sum(p.enrollments_count for p in products.values()),
+        })
+
+
+def refresh(days=None):
+    """Recompute the given days, or every day touched since the stored watermark."""
+    if days is not None:
+        for day in sorted(days):
+            rollup_day(day)
+        return sorted(days)
+
+    started = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    days = sorted(touched_days(watermark.value - WATERMARK_OVERLAP if watermark else None))
+    for day in days:
+        rollup_day(day)
+    RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': started})
+    return days
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+from .models import DailySales
+
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = [
+            'day', 'orders_count', 'items_count', 'gross_revenue', 'net_revenue',
+            'discount_total', 'payments_count', 'payments_amount', 'enrollments_count',
+        ]
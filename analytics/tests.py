@@ -0,0 +1,161 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, Product
+from users.models import CourseEnrollment, CustomUser, DiscountCode, Order, OrderItem, PaymentHistory
+from users.tokens import UserRefreshToken
+from payments.services import apply_status
+from . import related, rollups
+from .models import DailyDiscountUsage, DailyProductSales, DailySales, RelatedProduct
+
+
+class AnalyticsTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='برنامه‌نویسی')
+        self.products = [
+            Product.objects.create(
+                category=self.category, title=f'دوره {n}', description='-', price=Decimal('100.00'),
+                duration='1h', course_type='offline',
+            )
+            for n in range(4)
+        ]
+        self.users = [CustomUser.objects.create_user(f'0912000010{n}') for n in range(5)]
+
+    def order(self, user, products, discount_code=None, total=None, status='completed'):
+        subtotal = sum((p.price for p in products), Decimal('0.00'))
+        order = Order.objects.create(user=user, discount_code=discount_code, total=subtotal if total is None else total)
+        for product in products:
+            # Items share the discount in proportion to their price, as checkout stores them.
+            discount = (subtotal - order.total) * product.price / subtotal
+            OrderItem.objects.create(order=order, product=product, price=product.price - discount, discount=discount)
+            CourseEnrollment.objects.create(user=user, product=product, order=order, is_active=status == 'completed')
+        PaymentHistory.objects.create(
+            order=order, amount=order.total, status=status, payment_method='fake', transaction_id=f'order-{order.pk}',
+            paid_at=timezone.now() if status == 'completed' else None,
+        )
+        return order
+
+
+class RollupTests(AnalyticsTestCase):
+    def test_day_totals(self):
+        code = DiscountCode.objects.create(code='OFF20', discount_type='percent', value=Decimal('20'))
+        self.order(self.users[0], self.products[:2], discount_code=code, total=Decimal('160.00'))
+        self.order(self.users[1], self.products[:1])
+        today = timezone.localdate()
+        self.assertEqual(rollups.refresh(), [today])
+
+        day = DailySales.objects.get(day=today)
+        self.assertEqual((day.orders_count, day.items_count, day.enrollments_count), (2, 3, 3))
+        self.assertEqual((day.gross_revenue, day.net_revenue, day.discount_total), (
+            Decimal('300.00'), Decimal('260.00'), Decimal('40.00'),
+        ))
+        first = DailyProductSales.objects.get(day=today, product=self.products[0])
+        self.assertEqual((first.orders_count, first.revenue, first.enrollments_count), (2, Decimal('180.00'), 2))
+        usage = DailyDiscountUsage.objects.get(day=today, discount_code=code)
+        self.assertEqual((usage.orders_count, usage.discount_total), (1, Decimal('40.00')))
+
+    def test_unpaid_and_failed_checkouts_are_left_out(self):
+        self.order(self.users[0], self.products[:1])
+        self.order(self.users[1], self.products[1:2], status='pending')
+        failed = self.order(self.users[2], self.products[2:3], status='pending')
+        apply_status('fake', f'order-{failed.pk}', 'failed')
+        rollups.refresh()
+        day = DailySales.objects.get(day=timezone.localdate())
+        self.assertEqual((day.orders_count, day.gross_revenue, day.enrollments_count), (1, Decimal('100.00'), 1))
+        self.assertEqual(DailyProductSales.objects.count(), 1)
+
+    def test_late_payment_recomputes_the_order_day(self):
+        order = self.order(self.users[0], self.products[:1], status='pending')
+        yesterday = timezone.now() - timedelta(days=1)
+        Order.objects.filter(pk=order.pk).update(created_at=yesterday)
+        CourseEnrollment.objects.filter(order=order).update(enrolled_at=yesterday)
+        PaymentHistory.objects.filter(order=order).update(created_at=yesterday)
+        rollups.refresh()
+        self.assertEqual(DailySales.objects.get(day=timezone.localdate(yesterday)).orders_count, 0)
+
+        apply_status('fake', f'order-{order.pk}', 'completed')
+        self.assertIn(timezone.localdate(yesterday), rollups.refresh())
+        self.assertEqual(DailySales.objects.get(day=timezone.localdate(yesterday)).orders_count, 1)
+
+    def test_rerunning_a_day_does_not_double_count(self):
+        self.order(self.users[0], self.products[:2])
+        today = timezone.localdate()
+        rollups.refresh()
+        rollups.refresh(days=[today])
+        self.assertEqual(DailyProductSales.objects.filter(day=today).count(), 2)
+        self.assertEqual(DailySales.objects.get(day=today).orders_count, 1)
+
+    def test_watermark_picks_up_new_orders(self):
+        self.order(self.users[0], self.products[:1])
+        rollups.refresh()
+        self.order(self.users[1], self.products[1:2])
+        self.assertEqual(rollups.refresh(), [timezone.localdate()])
+        self.assertEqual(DailySales.objects.get().orders_count, 2)
+
+    def test_watermark_picks_up_payment_status_changes(self):
+        order = self.order(self.users[0], self.products[:1])
+        yesterday = timezone.now() - timedelta(days=1)
+        PaymentHistory.objects.filter(order=order).update(created_at=yesterday, paid_at=yesterday)
+        payment = PaymentHistory.objects.get(order=order)
+        rollups.refresh()
+        self.assertEqual(DailySales.objects.get(day=timezone.localdate(yesterday)).payments_count, 1)
+
+        payment.status = 'refunded'
+        payment.save()
+        self.assertIn(timezone.localdate(yesterday), rollups.refresh())
+        self.assertEqual(DailySales.objects.get(day=timezone.localdate(yesterday)).payments_count, 0)
+
+
+class ViewTests(AnalyticsTestCase):
+    def test_bad_category_is_rejected(self):
+        staff = CustomUser.objects.create_user('09120000200', is_staff=True)
+        response = self.client.get(
+            reverse('analytics-products'), {'category': 'abc'},
+            HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(staff).access_token}',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RELATED_TOP_K=2, RELATED_MIN_SUPPORT=2, RELATED_BLOCK_ROWS=2)
+class RelatedTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        a, b, c, d = self.products
+        for user, basket in zip(self.users, [[a, b, c], [a, b], [a, b, d], [a, c], [c, d]]):
+            self.order(user, basket)
+
+    def neighbours(self):
+        return {
+            product.pk: [(row.related_id, row.support) for row in RelatedProduct.objects.filter(product=product)]
+            for product in self.products
+        }
+
+    def test_neighbours(self):
+        related.build(use_numpy=False)
+        a, b, c, d = (product.pk for product in self.products)
+        neighbours = self.neighbours()
+        self.assertEqual(neighbours[a], [(b, 3), (c, 2)])
+        # d shares only one student with a, b and c each: below the minimum support.
+        self.assertEqual(neighbours[d], [])
+
+    @skipIf(related.np is None, 'NumPy is not installed')
+    def test_numpy_matches_python(self):
+        related.build(use_numpy=False)
+        expected = list(RelatedProduct.objects.values_list('product_id', 'rank', 'related_id', 'support'))
+        scores = list(RelatedProduct.objects.values_list('score', flat=True))
+        related.build(use_numpy=True)
+        self.assertEqual(list(RelatedProduct.objects.values_list('product_id', 'rank', 'related_id', 'support')), expected)
+        for score, expected_score in zip(RelatedProduct.objects.values_list('score', flat=True), scores):
+            self.assertAlmostEqual(score, expected_score)
+
+    def test_refunded_enrollments_are_dropped(self):
+        related.build()
+        CourseEnrollment.objects.filter(user=self.users[0]).update(is_active=False)
+        related.build()
+        a, b = self.products[0].pk, self.products[1].pk
+        self.assertEqual(self.neighbours()[a], [(b, 2)])
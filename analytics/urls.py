@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import DailySalesView, ProductSalesView, CategorySalesView, DiscountUsageView
+
+urlpatterns = [
+    path('daily/', DailySalesView.as_view(), name='analytics-daily'),
+    path('products/', ProductSalesView.as_view(), name='analytics-products'),
+    path('categories/', CategorySalesView.as_view(), name='analytics-categories'),
+    path('discounts/', DiscountUsageView.as_view(), name='analytics-discounts'),
+]
@@ -0,0 +1,87 @@
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import DailySales, DailyProductSales, DailyDiscountUsage
+from .serializers import DailySalesSerializer
+
+
+def filter_days(queryset, request):
+    for param, lookup in (('since', 'day__gte'), ('until', 'day__lte')):
+        value = request.query_params.get(param)
+        if value:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({param: 'Invalid date, expected YYYY-MM-DD.'})
+            queryset = queryset.filter(**{lookup: day})
+    return queryset
+
+
+class DailySalesView(generics.ListAPIView):
+    serializer_class = DailySalesSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        return filter_days(DailySales.objects.all(), self.request)
+
+
+class ProductSalesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        rows = filter_days(DailyProductSales.objects.all(), request)
+        category = request.query_params.get('category')
+        if category:
+            if not category.isdigit():
+                raise ValidationError({'category': 'Invalid category id.'})
+            rows = rows.filter(category_id=int(category))
+        rows = rows.values('product_id', 'product__title').annotate(
+            orders=Sum('orders_count'), revenue=Sum('revenue'), enrollments=Sum('enrollments_count')
+        ).order_by('-revenue')
+        return Response([{
+            'product_id': r['product_id'],
+            'title': r['product__title'],
+            'orders': r['orders'],
+            'revenue': str(r['revenue']),
+            'enrollments': r['enrollments'],
+        } for r in rows])
+
+
+class CategorySalesView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        rows = filter_days(DailyProductSales.objects.all(), request).values(
+            'category_id', 'category__name'
+        ).annotate(
+            orders=Sum('orders_count'), revenue=Sum('revenue'), enrollments=Sum('enrollments_count')
+        ).order_by('-revenue')
+        return Response([{
+            'category_id': r['category_id'],
+            'name': r['category__name'],
+            'items_sold': r['orders'],
+            'revenue': str(r['revenue']),
+            'enrollments': r['enrollments'],
+        } for r in rows])
+
+
+class DiscountUsageView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        rows = filter_days(DailyDiscountUsage.objects.all(), request).values(
+            'discount_code_id', 'discount_code__code'
+        ).annotate(
+            orders=Sum('orders_count'), gross=Sum('gross_revenue'),
+            net=Sum('net_revenue'), discount=Sum('discount_total')
+        ).order_by('-orders')
+        return Response([{
+            'discount_code_id': r['discount_code_id'],
+            'code': r['discount_code__code'],
+            'orders': r['orders'],
+            'gross_revenue': str(r['gross']),
+            'net_revenue': str(r['net']),
+            'discount_total': str(r['discount']),
+        } for r in rows])
@@ -0,0 +1,89 @@
+"""
+Concurrent sync-vs-async comparison through Django's ASGI handler.
+
+``AsyncClient`` drives the full ASGI request path in-process, so sync views
+run in the thread pool exactly as they would under an ASGI server while async
+views stay on the event loop. Each pair of URL names is exercised with the
+same number of concurrent clients.
+"""
+import asyncio
+import statistics
+import threading
+import time
+
+from django.test import AsyncClient
+from django.urls import reverse
+
+from products.models import Product
+from users.models import CustomUser
+from users.tokens import UserRefreshToken
+from .runner import percentile
+from .seed import bench_phone
+
+
+PAIRS = [
+    ('me', 'me-async', None),
+    ('course-page', 'course-page-async', 'offline-product'),
+]
+
+
+async def _measure(client, path, headers, concurrency, requests_per_client):
+    latencies = []
+    failures = 0
+    peak_threads = threading.active_count()
+    running = True
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    async def worker():
+        nonlocal failures
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    sampler = asyncio.ensure_future(sample_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    total = time.perf_counter() - started
+    running = False
+    await sampler
+    return {
+        'requests': len(latencies),
+        'failures': failures,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / total, 2),
+        'peak_threads': peak_threads,
+    }
+
+
+def run(concurrency, requests_per_client):
+    user = CustomUser.objects.get(phone=bench_phone(0))
+    token = UserRefreshToken.for_user(user).access_token
+    product_id = Product.objects.filter(course_type='offline').order_by('pk').values_list('pk', flat=True).first()
+    client = AsyncClient()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    async def main():
+        results = {}
+        for sync_name, async_name, argument in PAIRS:
+            args = [product_id] if argument else []
+            for name in (sync_name, async_name):
+                results[name] = await _measure(
+                    client, reverse(name, args=args), headers, concurrency, requests_per_client
+                )
+        return results
+
+    return {
+        'meta': {'concurrency': concurrency, 'requests_per_client': requests_per_client},
+        'scenarios': asyncio.run(main()),
+    }
@@ -0,0 +1,105 @@
+"""
+Per-request latency under different connection management modes.
+
+The test client never fires the ``request_started``/``request_finished``
+handlers that close or recycle connections, so each iteration calls
+``close_old_connections()`` itself, as a server would after the response.
+Modes:
+
+* ``no-reuse``: ``CONN_MAX_AGE=0``, a new connection for every request.
+* ``persistent``: one connection kept for the whole run.
+* ``pool``: Django's psycopg 3 pool; PostgreSQL with ``psycopg[pool]`` only.
+
+SQLite connections are nearly free to open, so the modes only diverge
+noticeably on PostgreSQL.
+"""
+import statistics
+import time
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.test.utils import override_settings
+
+from kelaasor_advance import performance
+from .runner import percentile
+
+
+MODES = ['no-reuse', 'persistent', 'pool']
+
+
+def pool_unavailable(connection):
+    if connection.vendor != 'postgresql':
+        return f"pooling is not supported on {connection.vendor}"
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return "psycopg[pool] is not installed"
+    return None
+
+
+def configure(connection, mode, pool_size):
+    connection.close()
+    if connection.vendor == 'postgresql':
+        connection.close_pool()
+    settings_dict = connection.settings_dict
+    settings_dict['OPTIONS'].pop('pool', None)
+    settings_dict['CONN_MAX_AGE'] = {'no-reuse': 0, 'persistent': None, 'pool': 0}[mode]
+    if mode == 'pool':
+        settings_dict['OPTIONS']['pool'] = {'min_size': pool_size, 'max_size': pool_size}
+
+
+@override_settings(API_THROTTLING=False)
+def run_mode(scenario_class, mode, iterations, warmup, pool_size):
+    connection = connections[DEFAULT_DB_ALIAS]
+    configure(connection, mode, pool_size)
+    scenario = scenario_class()
+    scenario.setup()
+    close_old_connections()
+
+    latencies, failures, opened_before = [], 0, 0
+    for iteration in range(warmup + iterations):
+        if iteration == warmup:
+            opened_before = performance.CONNECTIONS_OPENED.get(DEFAULT_DB_ALIAS, 0)
+        scenario.prepare(iteration)
+        started = time.perf_counter()
+        response = scenario.run(iteration)
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+        if iteration < warmup:
+            continue
+        if response.status_code != scenario.expected_status:
+            failures += 1
+        latencies.append(elapsed)
+
+    result = {
+        'failures': failures,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'connections_opened': performance.CONNECTIONS_OPENED.get(DEFAULT_DB_ALIAS, 0) - opened_before,
+    }
+    stats = performance.pool_stats(DEFAULT_DB_ALIAS)
+    if stats is not None:
+        result['pool_wait_ms'] = round(stats['wait_seconds'] * 1000, 3)
+    return result
+
+
+def run(scenarios, iterations, warmup=5, pool_size=4):
+    connection = connections[DEFAULT_DB_ALIAS]
+    original = {**connection.settings_dict, 'OPTIONS': {**connection.settings_dict['OPTIONS']}}
+    skipped = pool_unavailable(connection)
+    results = {'meta': {'database': connection.vendor, 'iterations': iterations}, 'scenarios': {}}
+    if skipped:
+        results['meta']['pool_skipped'] = skipped
+    try:
+        for name, scenario_class in scenarios.items():
+            results['scenarios'][name] = {
+                mode: run_mode(scenario_class, mode, iterations, warmup, pool_size)
+                for mode in MODES
+                if not (mode == 'pool' and skipped)
+            }
+    finally:
+        connection.close()
+        if connection.vendor == 'postgresql':
+            connection.close_pool()
+        connection.settings_dict.update(original)
+    return results
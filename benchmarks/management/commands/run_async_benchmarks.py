@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from benchmarks import concurrency
+from benchmarks.seed import seed
+
+
+class Command(BaseCommand):
+    help = "Compare sync and async versions of the composite endpoints under concurrent ASGI load."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=20, help="Requests per concurrent client.")
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--existing-db', action='store_true')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = None
+        if not options['existing_db']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+            seed(scale=options['scale'])
+        try:
+            results = concurrency.run(options['concurrency'], options['requests'])
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+        self.stdout.write(json.dumps(results, indent=2))
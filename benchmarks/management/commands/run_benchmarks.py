@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from benchmarks.runner import compare, load_baseline, run
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the API benchmark scenarios and report latency percentiles, throughput and "
+        "queries per request as JSON. By default a throwaway test database is created and seeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all). Choices: {', '.join(SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--seed', dest='random_seed', type=int, default=42)
+        parser.add_argument('--existing-db', action='store_true', help="Run against the configured database, already seeded with seed_benchmark_data.")
+        parser.add_argument('--output', help="Write the JSON results to this path instead of stdout.")
+        parser.add_argument('--baseline', default='benchmarks/baseline.json')
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 latency growth as a fraction of the baseline.")
+        parser.add_argument('--update-baseline', action='store_true')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = {name: SCENARIOS[name] for name in options['scenarios'] or SCENARIOS}
+
+        setup_test_environment()
+        old_config = None
+        if not options['existing_db']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+            seed(scale=options['scale'], seed=options['random_seed'])
+        try:
+            results = run(scenarios, options['iterations'], options['warmup'])
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as fh:
+                fh.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(f"No baseline at {options['baseline']}; skipping comparison.")
+            return
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
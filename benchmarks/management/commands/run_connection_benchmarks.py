@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from benchmarks import connections
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.seed import seed
+
+
+class Command(BaseCommand):
+    help = "Compare per-request latency without connection reuse, with persistent connections and with pooling."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', default=['product-list', 'orders'])
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--pool-size', type=int, default=4)
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--existing-db', action='store_true')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = {name: SCENARIOS[name] for name in options['scenarios']}
+
+        setup_test_environment()
+        old_config = None
+        if not options['existing_db']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+            seed(scale=options['scale'])
+        try:
+            results = connections.run(scenarios, options['iterations'], options['warmup'], options['pool_size'])
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+        self.stdout.write(json.dumps(results, indent=2))
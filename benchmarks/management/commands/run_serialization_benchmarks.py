@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from benchmarks.seed import seed
+from benchmarks.serialization import run
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ModelSerializer + JSONRenderer against the values() projections + FastJSONRenderer "
+        "for the product, notification and order lists, in milliseconds per 1,000 rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows loaded per case.")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--scale', type=int, default=20, help="Seed scale; 20 gives 1,000 products.")
+        parser.add_argument('--seed', dest='random_seed', type=int, default=42)
+        parser.add_argument('--existing-db', action='store_true', help="Run against the configured database, already seeded with seed_benchmark_data.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = None
+        if not options['existing_db']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+            seed(scale=options['scale'], seed=options['random_seed'])
+        try:
+            results = run(options['rows'], options['repeat'])
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+        self.stdout.write(json.dumps(results, indent=2))
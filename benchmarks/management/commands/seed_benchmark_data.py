@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.seed import PHONE_PREFIX, seed
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Seed a deterministic benchmark dataset (users, catalog, carts, orders, notifications, tickets)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--seed', dest='random_seed', type=int, default=42)
+
+    def handle(self, *args, scale, random_seed, **options):
+        if CustomUser.objects.filter(phone__startswith=PHONE_PREFIX).exists():
+            raise CommandError("Benchmark data already exists in this database.")
+        counts = seed(scale=scale, seed=random_seed)
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(self.style.SUCCESS("Benchmark data seeded."))
@@ -0,0 +1,41 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from kelaasor_advance.warmup import STEPS, import_profile, project_apps, warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the worker warm-up (kelaasor_advance/warmup.py) and report each step's time, "
+        "optionally with an import-time profile of a fresh process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--step', action='append', dest='steps', choices=list(STEPS), help="Only this step (repeatable).")
+        parser.add_argument('--import-profile', action='store_true', help="Also profile imports with python -X importtime.")
+        parser.add_argument('--top', type=int, default=15, help="Rows per import-profile table.")
+
+    def handle(self, *args, **options):
+        for name, (seconds, count) in warm_up(options['steps']).items():
+            status = 'failed' if count is None else f'{count} item(s)'
+            self.stdout.write(f"{name:<12} {seconds * 1000:8.1f} ms  {status}")
+        if options['import_profile']:
+            self.report_imports(import_profile(), options['top'])
+
+    def report_imports(self, rows, top):
+        total = sum(self_us for _, self_us, _ in rows)
+        self.stdout.write(f"\nImports: {len(rows)} modules, {total / 1000:.1f} ms")
+
+        packages = defaultdict(int)
+        for module, self_us, _ in rows:
+            packages[module.split('.')[0]] += self_us
+        self.stdout.write("\nBy top-level package (self time):")
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {self_us / 1000:8.1f} ms  {package}")
+
+        local = {config.name.split('.')[0] for config in project_apps()} | {'kelaasor_advance'}
+        self.stdout.write("\nProject modules (cumulative, self):")
+        project = [row for row in rows if row[0].split('.')[0] in local]
+        for module, self_us, cumulative_us in sorted(project, key=lambda row: -row[2])[:top]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:8.1f} ms  {module}")
@@ -0,0 +1,101 @@
+import json
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from kelaasor_advance.performance import QueryRecorder
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# The scenarios repeat one request from one client far beyond any API rate limit,
+# and checkout needs a gateway whatever DEBUG was at settings import.
+@override_settings(
+    API_THROTTLING=False, PAYMENT_FAKE_GATEWAY=True,
+    PAYMENT_GATEWAYS={'fake': 'payments.gateways.FakeGateway'}, PAYMENT_GATEWAY='fake',
+)
+def run_scenario(scenario_class, iterations, warmup=5):
+    scenario = scenario_class()
+    scenario.setup()
+    latencies, queries, failures = [], [], 0
+    for iteration in range(warmup + iterations):
+        scenario.prepare(iteration)
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            started = time.perf_counter()
+            response = scenario.run(iteration)
+            elapsed = time.perf_counter() - started
+        if iteration < warmup:
+            continue
+        if response.status_code != scenario.expected_status:
+            failures += 1
+        latencies.append(elapsed)
+        queries.append(recorder.count)
+
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'failures': failures,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'throughput_rps': round(iterations / total, 2) if total else 0.0,
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else 0.0,
+    }
+
+
+def run(scenarios, iterations, warmup=5):
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+        },
+        'scenarios': {
+            name: run_scenario(scenario_class, iterations, warmup)
+            for name, scenario_class in scenarios.items()
+        },
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of ``results`` against ``baseline``.
+
+    Query counts are deterministic and must not grow at all; latency may
+    grow by up to ``tolerance`` (a fraction) before it counts as a regression.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}"
+            )
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['failures'] > previous['failures']:
+            regressions.append(f"{name}: failures {previous['failures']} -> {current['failures']}")
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
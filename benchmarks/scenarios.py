@@ -0,0 +1,229 @@
+"""
+Benchmark scenarios driving the real URLconf through the Django test client.
+
+Each scenario prepares its state outside the timed section in ``prepare()``
+and issues exactly one request in ``run()``.
+"""
+from datetime import timedelta
+
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Product
+from users.models import CustomUser, OTP, Cart, CartItem, CourseEnrollment
+from users.tokens import UserRefreshToken
+from .seed import PHONE_PREFIX, bench_phone
+
+
+def authenticate(client, user):
+    client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {UserRefreshToken.for_user(user).access_token}"
+
+
+class Scenario:
+    name = None
+    method = 'get'
+    expected_status = 200
+
+    def __init__(self):
+        self.client = Client()
+
+    def setup(self):
+        pass
+
+    def prepare(self, iteration):
+        pass
+
+    def url(self, iteration):
+        raise NotImplementedError
+
+    def data(self, iteration):
+        return None
+
+    def run(self, iteration):
+        request = getattr(self.client, self.method)
+        data = self.data(iteration)
+        if data is None:
+            return request(self.url(iteration))
+        if self.method == 'get':
+            return request(self.url(iteration), data)
+        return request(self.url(iteration), data, content_type='application/json')
+
+
+class AuthenticatedScenario(Scenario):
+    def setup(self):
+        self.user = CustomUser.objects.get(phone=bench_phone(0))
+        authenticate(self.client, self.user)
+
+
+class SendOTPScenario(Scenario):
+    name = 'send-otp'
+    method = 'post'
+    expected_status = 201
+
+    def url(self, iteration):
+        return reverse('send-otp')
+
+    def data(self, iteration):
+        return {'phone': f"0991{iteration:07d}"}
+
+
+class VerifyOTPScenario(Scenario):
+    name = 'verify-otp'
+    method = 'post'
+
+    def prepare(self, iteration):
+        OTP.objects.create(
+            phone=self.phone(iteration), code='123456', expires_at=timezone.now() + timedelta(minutes=5)
+        )
+
+    def phone(self, iteration):
+        return f"0992{iteration:07d}"
+
+    def url(self, iteration):
+        return reverse('verify-otp')
+
+    def data(self, iteration):
+        return {'phone': self.phone(iteration), 'code': '123456'}
+
+
+class ProductListScenario(Scenario):
+    name = 'product-list'
+
+    def url(self, iteration):
+        return reverse('product-list')
+
+
+class ProductSearchScenario(Scenario):
+    name = 'product-list-search'
+
+    def url(self, iteration):
+        return reverse('product-list')
+
+    def data(self, iteration):
+        return {'search': 'django', 'course_type': 'offline', 'ordering': '-price'}
+
+
+class MeScenario(AuthenticatedScenario):
+    name = 'me'
+
+    def url(self, iteration):
+        return reverse('me')
+
+
+class AsyncMeScenario(AuthenticatedScenario):
+    name = 'me-async'
+
+    def url(self, iteration):
+        return reverse('me-async')
+
+
+class CoursePageScenario(AuthenticatedScenario):
+    name = 'course-page'
+    url_name = 'course-page'
+
+    def setup(self):
+        super().setup()
+        self.product_ids = list(
+            Product.objects.filter(course_type='offline').order_by('pk').values_list('pk', flat=True)
+        )
+
+    def url(self, iteration):
+        return reverse(self.url_name, args=[self.product_ids[iteration % len(self.product_ids)]])
+
+
+class AsyncCoursePageScenario(CoursePageScenario):
+    name = 'course-page-async'
+    url_name = 'course-page-async'
+
+
+class HomeFeedScenario(AuthenticatedScenario):
+    name = 'home-feed'
+
+    def url(self, iteration):
+        return reverse('home-feed')
+
+
+class CartScenario(AuthenticatedScenario):
+    name = 'cart'
+
+    def url(self, iteration):
+        return reverse('cart')
+
+
+class CartAddScenario(AuthenticatedScenario):
+    name = 'cart-add'
+    method = 'post'
+    expected_status = 201
+
+    def setup(self):
+        super().setup()
+        owned = CourseEnrollment.objects.filter(user=self.user).values_list('product_id', flat=True)
+        self.product_ids = list(Product.objects.exclude(pk__in=owned).values_list('pk', flat=True))
+        self.cart, _ = Cart.objects.get_or_create(user=self.user)
+
+    def prepare(self, iteration):
+        CartItem.objects.filter(cart=self.cart).delete()
+
+    def url(self, iteration):
+        return reverse('cart-add')
+
+    def data(self, iteration):
+        return {'product_id': self.product_ids[iteration % len(self.product_ids)]}
+
+
+class CheckoutScenario(Scenario):
+    name = 'checkout'
+    method = 'post'
+    expected_status = 201
+
+    def setup(self):
+        self.users = list(
+            CustomUser.objects.filter(phone__startswith=PHONE_PREFIX).exclude(phone=bench_phone(0)).order_by('pk')
+        )
+
+    def prepare(self, iteration):
+        user = self.users[iteration % len(self.users)]
+        cart, _ = Cart.objects.get_or_create(user=user)
+        if not cart.items.exists():
+            owned = CourseEnrollment.objects.filter(user=user).values_list('product_id', flat=True)
+            CartItem.objects.create(cart=cart, product=Product.objects.exclude(pk__in=owned).order_by('pk').first())
+        authenticate(self.client, user)
+
+    def url(self, iteration):
+        return reverse('checkout')
+
+    def data(self, iteration):
+        return {}
+
+
+class OrdersScenario(AuthenticatedScenario):
+    name = 'orders'
+
+    def url(self, iteration):
+        return reverse('orders-list')
+
+
+class NotificationsScenario(AuthenticatedScenario):
+    name = 'notifications'
+
+    def url(self, iteration):
+        return reverse('notifications-list')
+
+
+class TicketsScenario(AuthenticatedScenario):
+    name = 'tickets'
+
+    def url(self, iteration):
+        return reverse('tickets-list')
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in [
+        SendOTPScenario, VerifyOTPScenario, ProductListScenario, ProductSearchScenario,
+        MeScenario, AsyncMeScenario, CoursePageScenario, AsyncCoursePageScenario, HomeFeedScenario,
+        CartScenario, CartAddScenario, CheckoutScenario, OrdersScenario,
+        NotificationsScenario, TicketsScenario,
+    ]
+}
@@ -0,0 +1,163 @@
+"""
+Deterministic data generator for the benchmark suite.
+
+``seed(scale)`` creates a fixed population derived from ``scale`` and the
+random ``seed``; the same arguments always produce the same rows, so runs on
+different machines and branches measure the same workload.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Category, Instructor, Product, Chapter, Video
+from support.models import Ticket, TicketMessage
+from users.models import (
+    CustomUser, UserProfile, Cart, CartItem, Order, OrderItem, PaymentHistory,
+    CourseEnrollment, Notification, DiscountCode
+)
+
+
+BATCH_SIZE = 1000
+PHONE_PREFIX = '0990'
+SEARCH_WORDS = ['python', 'django', 'react', 'data', 'network', 'security', 'design', 'devops']
+
+
+def bench_phone(index):
+    return f"{PHONE_PREFIX}{index:07d}"
+
+
+def population(scale):
+    return {
+        'users': 200 * scale,
+        'categories': 8,
+        'instructors': 10 * scale,
+        'products': 50 * scale,
+        'chapters_per_course': 5,
+        'videos_per_chapter': 6,
+        'cart_items': 2,
+        'orders_per_user': 2,
+        'notifications_per_user': 10,
+        'tickets_per_user': 1,
+    }
+
+
+@transaction.atomic
+def seed(scale=1, seed=42):
+    rng = random.Random(seed)
+    counts = population(scale)
+    now = timezone.now()
+
+    categories = Category.objects.bulk_create([
+        Category(name=f"bench-{word}", description=f"{word} courses")
+        for word in SEARCH_WORDS[:counts['categories']]
+    ])
+    instructors = Instructor.objects.bulk_create([
+        Instructor(name=f"Instructor {i}", email=f"instructor{i}@bench.local")
+        for i in range(counts['instructors'])
+    ])
+    products = Product.objects.bulk_create([
+        Product(
+            category=rng.choice(categories),
+            title=f"{rng.choice(SEARCH_WORDS).title()} course {i}",
+            description=" ".join(rng.choice(SEARCH_WORDS) for _ in range(200)),
+            price=Decimal(rng.randrange(100, 5000) * 1000),
+            duration=f"{rng.randrange(5, 80)}h",
+            course_type='offline' if i % 2 else 'online',
+            start_date=(now + timedelta(days=rng.randrange(-30, 60))).date(),
+        )
+        for i in range(counts['products'])
+    ], batch_size=BATCH_SIZE)
+    through = Product.instructors.through
+    through.objects.bulk_create([
+        through(product_id=p.pk, instructor_id=i.pk)
+        for p in products for i in rng.sample(instructors, 2)
+    ], batch_size=BATCH_SIZE)
+
+    offline = [p for p in products if p.course_type == 'offline']
+    chapters = Chapter.objects.bulk_create([
+        Chapter(product=p, title=f"Chapter {n}", order=n)
+        for p in offline for n in range(counts['chapters_per_course'])
+    ], batch_size=BATCH_SIZE)
+    Video.objects.bulk_create([
+        Video(
+            product_id=c.product_id, chapter=c, title=f"{c.title} video {n}", order=n,
+            duration=rng.randrange(120, 1800), video_url=f"https://cdn.bench.local/{c.pk}/{n}.mp4",
+            is_preview=n == 0,
+        )
+        for c in chapters for n in range(counts['videos_per_chapter'])
+    ], batch_size=BATCH_SIZE)
+
+    users = CustomUser.objects.bulk_create([
+        CustomUser(phone=bench_phone(i), first_name=f"User{i}", is_phone_verified=True)
+        for i in range(counts['users'])
+    ], batch_size=BATCH_SIZE)
+    UserProfile.objects.bulk_create([
+        UserProfile(user=u, city='Tehran', address=f"Street {u.pk}", birth_date=now.date() - timedelta(days=9000))
+        for u in users
+    ], batch_size=BATCH_SIZE)
+    carts = Cart.objects.bulk_create([Cart(user=u) for u in users], batch_size=BATCH_SIZE)
+
+    DiscountCode.objects.bulk_create([
+        DiscountCode(code=f"BENCH{n}", discount_type='percent', value=Decimal(10 + n)) for n in range(5)
+    ])
+
+    orders = []
+    for user in users:
+        for _ in range(counts['orders_per_user']):
+            orders.append(Order(user=user, total=Decimal('0.00')))
+    orders = Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+    order_items, enrollments, purchased = [], [], {}
+    for order in orders:
+        owned = purchased.setdefault(order.user_id, set())
+        for product in rng.sample(products, 2):
+            if product.pk in owned:
+                continue
+            owned.add(product.pk)
+            order.total += product.price
+            order_items.append(OrderItem(order=order, product=product, price=product.price))
+            enrollments.append(CourseEnrollment(user_id=order.user_id, product=product, order=order))
+    Order.objects.bulk_update(orders, ['total'], batch_size=BATCH_SIZE)
+    OrderItem.objects.bulk_create(order_items, batch_size=BATCH_SIZE)
+    CourseEnrollment.objects.bulk_create(enrollments, batch_size=BATCH_SIZE)
+    PaymentHistory.objects.bulk_create([
+        PaymentHistory(order=o, amount=o.total, status='completed', payment_method='bench',
+                       transaction_id=f"bench-{o.pk}", paid_at=now)
+        for o in orders
+    ], batch_size=BATCH_SIZE)
+
+    cart_items = []
+    for cart in carts:
+        owned = purchased.get(cart.user_id, set())
+        available = [p for p in products if p.pk not in owned]
+        for product in rng.sample(available, counts['cart_items']):
+            cart_items.append(CartItem(cart=cart, product=product))
+    CartItem.objects.bulk_create(cart_items, batch_size=BATCH_SIZE)
+
+    Notification.objects.bulk_create([
+        Notification(
+            user=u, title=f"Notification {n}", message="bench notification",
+            notification_type=rng.choice(Notification.NOTIFICATION_TYPE_CHOICES)[0], is_read=n % 3 == 0,
+        )
+        for u in users for n in range(counts['notifications_per_user'])
+    ], batch_size=BATCH_SIZE)
+
+    tickets = Ticket.objects.bulk_create([
+        Ticket(user=u, title=f"Ticket {n}", message="bench ticket", related_product=rng.choice(products))
+        for u in users for n in range(counts['tickets_per_user'])
+    ], batch_size=BATCH_SIZE)
+    TicketMessage.objects.bulk_create([
+        TicketMessage(ticket=t, sender_is_user=n % 2 == 0, message=f"message {n}", is_notified=True)
+        for t in tickets for n in range(3)
+    ], batch_size=BATCH_SIZE)
+
+    return {
+        'users': len(users),
+        'products': len(products),
+        'chapters': len(chapters),
+        'orders': len(orders),
+        'enrollments': len(enrollments),
+        'tickets': len(tickets),
+    }
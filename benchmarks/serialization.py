@@ -0,0 +1,94 @@
+"""
+Serialization cost of the large list endpoints, per 1,000 rows.
+
+``before`` is the ModelSerializer path rendered with DRF's ``JSONRenderer``;
+``after`` is the ``values()`` projection rendered with ``FastJSONRenderer``.
+Rows are loaded once outside the timed section, so only building the payload
+and encoding it is measured. Orders have no serializer; their ``before`` is
+the per-order loop the view used to run and includes its queries.
+"""
+import statistics
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from kelaasor_advance import renderers
+from products.models import Product
+from products.serializers import ProductListProjection, ProductListSerializer
+from users.models import Notification, Order
+from users.serializers import NotificationProjection, NotificationSerializer, OrderProjection
+
+
+def _orders_loop(orders):
+    data = []
+    for o in orders:
+        items = [{'product': it.product.title, 'price': str(it.price)} for it in o.items.all()]
+        data.append({'id': o.id, 'total': str(o.total), 'created_at': o.created_at, 'items': items})
+    return data
+
+
+def cases(limit):
+    products = list(Product.objects.select_related('category')[:limit])
+    product_projection = ProductListProjection()
+    product_rows = list(Product.objects.values(*product_projection.columns())[:limit])
+
+    notifications = list(Notification.objects.order_by('-created_at')[:limit])
+    notification_projection = NotificationProjection()
+    notification_rows = list(
+        Notification.objects.order_by('-created_at').values(*notification_projection.columns())[:limit]
+    )
+
+    orders = list(Order.objects.order_by('-created_at')[:limit])
+    order_ids = [o.pk for o in orders]
+
+    return {
+        'products': (
+            len(products),
+            lambda: ProductListSerializer(products, many=True).data,
+            lambda: product_projection.project_rows(product_rows),
+        ),
+        'notifications': (
+            len(notifications),
+            lambda: NotificationSerializer(notifications, many=True).data,
+            lambda: notification_projection.project_rows(notification_rows),
+        ),
+        'orders': (
+            len(orders),
+            lambda: _orders_loop(orders),
+            lambda: OrderProjection().project(Order.objects.filter(pk__in=order_ids).order_by('-created_at')),
+        ),
+    }
+
+
+def _time(build, renderer, repeat):
+    build_times, render_times = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = build()
+        built = time.perf_counter()
+        renderer.render(data)
+        render_times.append(time.perf_counter() - built)
+        build_times.append(built - started)
+    return statistics.median(build_times), statistics.median(render_times)
+
+
+def run(limit=1000, repeat=20):
+    results = {'meta': {'orjson': renderers.orjson is not None, 'repeat': repeat}, 'cases': {}}
+    for name, (rows, before, after) in cases(limit).items():
+        if not rows:
+            continue
+        scale = 1000 / rows
+        entry = {'rows': rows}
+        for label, build, renderer in [
+            ('before', before, JSONRenderer()),
+            ('after', after, renderers.FastJSONRenderer()),
+        ]:
+            build_time, render_time = _time(build, renderer, repeat)
+            entry[label] = {
+                'serialize_ms_per_1k': round(build_time * scale * 1000, 3),
+                'render_ms_per_1k': round(render_time * scale * 1000, 3),
+                'total_ms_per_1k': round((build_time + render_time) * scale * 1000, 3),
+            }
+        entry['speedup'] = round(entry['before']['total_ms_per_1k'] / entry['after']['total_ms_per_1k'], 2)
+        results['cases'][name] = entry
+    return results
@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kelaasor_advance.settings')
+# Read by settings.py: no persistent connections by default under ASGI.
+os.environ.setdefault('DJANGO_ASGI', 'True')
 
 application = get_asgi_application()
+
+from kelaasor_advance import invalidation  # noqa: E402
+from kelaasor_advance.warmup import warm_up_on_start  # noqa: E402
+
+warm_up_on_start()
+invalidation.start()
@@ -0,0 +1,39 @@
+"""
+System checks for settings that only work on a cache shared by all workers.
+
+LocMemCache (the default) and DummyCache keep nothing across processes, so
+state that one worker writes and another must read needs a Redis or
+Memcached alias. These run with ``manage.py check`` and before ``migrate``
+and ``runserver``.
+"""
+from django.conf import settings
+from django.core import checks
+
+
+PER_PROCESS_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def per_process_cache(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PER_PROCESS_BACKENDS
+
+
+def shared_cache_error(alias, setting, purpose, id):
+    return checks.Error(
+        f"{setting} uses the cache '{alias}', which is per process; {purpose}.",
+        hint=f"Point {setting} at a Redis or Memcached cache alias.",
+        id=id,
+    )
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    errors = []
+    alias = getattr(settings, 'REPLICA_PIN_CACHE', 'default')
+    if getattr(settings, 'DATABASE_REPLICAS', []) and per_process_cache(alias):
+        errors.append(shared_cache_error(
+            alias, 'REPLICA_PIN_CACHE', 'other workers would not see read-your-writes pins', 'kelaasor.E001',
+        ))
+    return errors
@@ -0,0 +1,167 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Aliases listed in ``DATABASE_REPLICAS`` serve reads; writes always go to
+``default``. Inside a request, reads use a replica only for safe methods, and
+only when the user has not written recently: ``ReplicaRoutingMiddleware``
+leaves a short-lived marker in ``REPLICA_PIN_CACHE`` after every successful
+unsafe request and pins that user's reads to the primary until it expires.
+That cache must be shared by all workers, or the next request may land on a
+worker that never saw the marker; the middleware refuses to start otherwise. Outside requests only
+catalog models are read from replicas. Anything running inside a transaction
+on ``default`` stays there. A replica that cannot be connected to is skipped
+for ``REPLICA_RETRY_SECONDS``, and reads fall back to ``default`` when none is
+left.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+from .checks import per_process_cache
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+CATALOG_MODELS = {
+    'products.product', 'products.category', 'products.instructor',
+    'products.chapter', 'products.video', 'products.coursefile',
+}
+# Stale reads of these break login or OTP verification right after a write.
+PRIMARY_ONLY_MODELS = {'sessions.session', 'users.otp'}
+
+logger = logging.getLogger(__name__)
+
+_request = ContextVar('replica_routing_request', default=None)
+_down = {}
+
+
+def pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pick_replica(aliases):
+    """A random replica of ``aliases`` that accepts connections, else ``default``."""
+    now = time.monotonic()
+    candidates = [alias for alias in aliases if _down.get(alias, 0) <= now]
+    for alias in random.sample(candidates, len(candidates)):
+        try:
+            # Only connects when this thread has no connection to it yet.
+            connections[alias].ensure_connection()
+        except DatabaseError as exc:
+            _down[alias] = now + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+            logger.warning('Replica %s is unreachable, reading from the primary: %s', alias, exc)
+            continue
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+def resolved_user(request):
+    """``request.user`` if it is already loaded; never triggers a query."""
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user
+
+
+def pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+
+
+def pin_to_primary(user_id):
+    pin_cache().set(pin_key(user_id), 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+class RoutingState:
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self.pinned = None
+
+    def is_pinned(self):
+        if self.pinned is None:
+            user = resolved_user(self.request)
+            if user is None or not user.is_authenticated:
+                return False
+            self.pinned = pin_cache().get(pin_key(user.pk)) is not None
+        return self.pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        label = model._meta.label_lower
+        if label in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        state = _request.get()
+        if state is None:
+            return pick_replica(aliases) if label in CATALOG_MODELS else DEFAULT_DB_ALIAS
+        if not state.safe or state.is_pinned():
+            return DEFAULT_DB_ALIAS
+        return pick_replica(aliases)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        alias = getattr(settings, 'REPLICA_PIN_CACHE', 'default')
+        if replicas() and per_process_cache(alias):
+            raise ImproperlyConfigured(
+                f"DATABASE_REPLICAS needs REPLICA_PIN_CACHE on a cache shared by all workers, not '{alias}'."
+            )
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _request.set(RoutingState(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _request.set(RoutingState(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        self.pin(request, response)
+        return response
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not replicas():
+            return
+        user = resolved_user(request)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
@@ -0,0 +1,301 @@
+"""
+Cross-process invalidation of in-process caches.
+
+Saves and deletes of the models in ``INVALIDATION_MODELS`` are published as
+small change events: model label, primary key, a per-model version number
+and the extra fields configured for the model. Code that changes rows with
+``update()`` or ``bulk_create()`` calls ``publish()`` itself. A cache
+subscribes with ``@receiver(label)`` and is called with a ``Change``.
+``Change.pk`` is None when the change covers several rows; with empty
+``fields`` as well, any row of the model may have changed.
+
+Events are sent once the transaction commits. Each one bumps a version row
+in ``users.CacheVersion`` and, on PostgreSQL, goes out with ``NOTIFY``. A
+model has ``INVALIDATION_VERSION_SHARDS`` rows, picked by primary key, and
+each bump commits on its own, so busy models don't queue on one row. The
+publishing process applies its own events right away. Every other process
+runs a listener thread (``start()``, called from wsgi.py/asgi.py) on its own
+connection, which ``LISTEN``s for events and also reads the version table
+every ``INVALIDATION_POLL_SECONDS``. A version gap on any of them, or a version
+ahead of the last event seen, counts as a change to the whole model. That covers events
+missed while the listener was reconnecting, and databases without
+LISTEN/NOTIFY, where polling is all there is.
+
+With ``INVALIDATION_BUS`` off, events only reach the publishing process.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections import defaultdict, namedtuple
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'kelaasor_invalidation'
+
+Change = namedtuple('Change', 'label pk version fields')
+
+_receivers = defaultdict(list)
+_versions = {}
+_lock = threading.Lock()
+_pending = threading.local()
+_scheduled = threading.local()
+_flushers = {}
+_origin = uuid.uuid4().hex[:12]
+_listener = None
+
+
+def receiver(*labels):
+    """Register ``func(change)`` for changes to the models ``labels`` (``'app.model'``)."""
+    def decorator(func):
+        for label in labels:
+            _receivers[label.lower()].append(func)
+        return func
+    return decorator
+
+
+def _dispatch(label, pk, version, fields, row=None):
+    if version is not None:
+        row = row or label
+        with _lock:
+            known = _versions.get(row)
+            _versions[row] = version if known is None else max(known, version)
+        if known is not None and version > known + 1:
+            # The missed events may have touched any row, whatever this one says.
+            pk, fields = None, {}
+    change = Change(label, pk, version, fields)
+    for func in _receivers.get(label, ()):
+        try:
+            func(change)
+        except Exception:
+            logger.exception('Invalidation receiver %s failed for %s', func.__qualname__, change)
+
+
+# Publishing
+
+class _Callback:
+    def __init__(self, func):
+        self.func = func
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.func()
+
+
+def on_commit_once(func, using=DEFAULT_DB_ALIAS):
+    """Run ``func`` once the current transaction on ``using`` commits, however often it is asked to."""
+    # Only Django's commit hooks hold the callback; a rollback drops them, and the weak
+    # reference with them, so the next transaction schedules its own.
+    ref = _scheduled.__dict__.get((func, using))
+    callback = ref() if ref is not None else None
+    if callback is None or callback.done:
+        callback = _Callback(func)
+        _scheduled.__dict__[func, using] = weakref.ref(callback)
+        transaction.on_commit(callback, using=using, robust=True)
+
+
+def publish(label, pk=None, fields=None, using=DEFAULT_DB_ALIAS):
+    """Send a change event once the current transaction on ``using`` commits."""
+    pending = _pending.__dict__.setdefault(using, {})
+    fields = fields or {}
+    pending[label.lower(), pk, tuple(sorted(fields.items()))] = None
+    flush = _flushers.get(using)
+    if flush is None:
+        flush = _flushers[using] = partial(_flush, using)
+    on_commit_once(flush, using)
+
+
+def _version_row(label, pk):
+    shards = getattr(settings, 'INVALIDATION_VERSION_SHARDS', 16)
+    if pk is None or shards <= 1:
+        return label
+    return f'{label}#{zlib.crc32(str(pk).encode()) % shards}'
+
+
+def _bump(cursor, table, label, count):
+    for _ in range(2):
+        cursor.execute(f'UPDATE {table} SET version = version + %s WHERE name = %s RETURNING version', [count, label])
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        cursor.execute(f'INSERT INTO {table} (name, version) VALUES (%s, 0) ON CONFLICT (name) DO NOTHING', [label])
+    raise RuntimeError(f'Could not bump the cache version of {label}')
+
+
+def _flush(using):
+    pending = _pending.__dict__.pop(using, None)
+    if not pending:
+        return
+    if not getattr(settings, 'INVALIDATION_BUS', True):
+        # This process only.
+        for label, pk, fields in pending:
+            _dispatch(label, pk, None, dict(fields))
+        return
+    by_row = defaultdict(list)
+    for label, pk, fields in pending:
+        by_row[_version_row(label, pk)].append((label, pk, dict(fields)))
+    connection = connections[using]
+    table = connection.ops.quote_name(apps.get_model('users', 'CacheVersion')._meta.db_table)
+    events = []
+    # Runs after the commit, in autocommit: each row is locked for its own UPDATE only,
+    # and always in the same order.
+    with connection.cursor() as cursor:
+        for row in sorted(by_row):
+            changes = by_row[row]
+            last = _bump(cursor, table, row, len(changes))
+            first = last - len(changes) + 1
+            events.extend((label, pk, first + n, fields, row) for n, (label, pk, fields) in enumerate(changes))
+        if connection.vendor == 'postgresql':
+            payloads = [
+                json.dumps({'m': label, 'pk': pk, 'v': version, 'f': fields, 'r': row, 'o': _origin}, separators=(',', ':'))
+                for label, pk, version, fields, row in events
+            ]
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload', [CHANNEL, payloads])
+    for event in events:
+        _dispatch(*event)
+
+
+def _on_model_change(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    fields = {name: getattr(instance, name) for name in settings.INVALIDATION_MODELS.get(sender._meta.label, ())}
+    publish(sender._meta.label_lower, instance.pk, fields, using=using)
+
+
+def watch():
+    """Publish saves and deletes of ``INVALIDATION_MODELS``; called from ``UsersConfig.ready``."""
+    for label in getattr(settings, 'INVALIDATION_MODELS', {}):
+        model = apps.get_model(label)
+        post_save.connect(_on_model_change, sender=model, dispatch_uid=f'invalidation:{label}')
+        post_delete.connect(_on_model_change, sender=model, dispatch_uid=f'invalidation:{label}')
+
+
+# Listening
+
+def poll(cursor, table):
+    """Apply versions that moved without an event reaching this process."""
+    cursor.execute(f'SELECT name, version FROM {table}')
+    for row, version in cursor.fetchall():
+        with _lock:
+            known = _versions.get(row)
+            if known is None or version <= known:
+                # First look: a baseline, since this process's caches were filled after it.
+                _versions.setdefault(row, version)
+                continue
+        _dispatch(row.partition('#')[0], None, version, {}, row)
+
+
+def _receive(payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning('Ignoring malformed invalidation event %r', payload)
+        return
+    if event.get('o') != _origin:
+        _dispatch(event['m'], event.get('pk'), event['v'], event.get('f') or {}, event.get('r'))
+
+
+def _wait(raw, timeout):
+    """Payloads of the notifications that arrive within ``timeout`` seconds."""
+    if hasattr(raw, 'poll'):
+        # psycopg2
+        if select.select([raw], [], [], timeout) == ([], [], []):
+            return []
+        raw.poll()
+        payloads = [notify.payload for notify in raw.notifies]
+        del raw.notifies[:]
+        return payloads
+    # psycopg 3
+    return [notify.payload for notify in raw.notifies(timeout=timeout)]
+
+
+class Listener(threading.Thread):
+    def __init__(self, alias):
+        super().__init__(name='cache-invalidation', daemon=True)
+        self.alias = alias
+        self.stopped = threading.Event()
+
+    def connect(self):
+        # A connection of its own, never taken from the pool: it stays open for good.
+        wrapper = connections.create_connection(self.alias)
+        options = {key: value for key, value in wrapper.settings_dict.get('OPTIONS', {}).items() if key != 'pool'}
+        wrapper.settings_dict = {**wrapper.settings_dict, 'OPTIONS': options}
+        wrapper.ensure_connection()
+        return wrapper
+
+    def run(self):
+        interval = getattr(settings, 'INVALIDATION_POLL_SECONDS', 10)
+        table = connections[self.alias].ops.quote_name(apps.get_model('users', 'CacheVersion')._meta.db_table)
+        try:
+            self.listen(table, interval)
+        finally:
+            # Receivers query through this thread's own connections; give them back.
+            connections.close_all()
+
+    def listen(self, table, interval):
+        while not self.stopped.is_set():
+            wrapper = None
+            try:
+                wrapper = self.connect()
+                listening = wrapper.vendor == 'postgresql'
+                with wrapper.cursor() as cursor:
+                    if listening:
+                        cursor.execute(f'LISTEN {CHANNEL}')
+                    poll(cursor, table)
+                    polled_at = time.monotonic()
+                    while not self.stopped.is_set():
+                        if listening:
+                            for payload in _wait(wrapper.connection, max(0.0, polled_at + interval - time.monotonic())):
+                                _receive(payload)
+                        else:
+                            self.stopped.wait(interval)
+                        if time.monotonic() - polled_at >= interval:
+                            poll(cursor, table)
+                            polled_at = time.monotonic()
+            except Exception:
+                logger.exception('Cache invalidation listener failed; reconnecting.')
+                self.stopped.wait(5)
+            finally:
+                if wrapper is not None:
+                    try:
+                        wrapper.close()
+                    except Exception:
+                        pass
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start():
+    """Start this process's listener thread, unless ``INVALIDATION_BUS`` is off or it already runs."""
+    global _listener
+    if not getattr(settings, 'INVALIDATION_BUS', True):
+        return None
+    if _listener is None or not _listener.is_alive():
+        _listener = Listener(router.db_for_write(apps.get_model('users', 'CacheVersion')))
+        _listener.start()
+    return _listener
+
+
+def _after_fork():
+    # Threads don't survive fork; a preforked worker starts its own listener.
+    global _listener, _lock, _origin
+    _lock = threading.Lock()
+    _origin = uuid.uuid4().hex[:12]
+    running, _listener = _listener is not None, None
+    if running:
+        start()
+
+
+os.register_at_fork(after_in_child=_after_fork)
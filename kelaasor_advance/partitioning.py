@@ -0,0 +1,383 @@
+"""
+Monthly range partitions on ``created_at`` for the append-only tables
+(``PARTITIONED_MODELS``), PostgreSQL only. ``manage.py manage_partitions``
+runs the steps below; schedule it daily.
+
+* ``convert()`` turns the plain table that syncdb created into a partitioned
+  one, copying the rows over in one transaction. It holds an exclusive lock on
+  the table meanwhile, so run it once, in a maintenance window.
+* ``ensure()`` creates the partitions for this month and the next
+  ``PARTITION_PREMAKE_MONTHS``. A row outside every partition lands in
+  ``<table>_default`` and is moved when its month's partition is created.
+* ``archive()`` writes each partition older than the model's
+  ``PARTITION_RETENTION_MONTHS`` (models without one are never archived)
+  to ``PARTITION_ARCHIVE_DIR`` as gzipped CSV
+  with a JSON manifest, then detaches and drops it. A trigger makes the
+  partition read-only during the copy, so the parent is only locked for the
+  detach itself; writes to an archiving month fail instead of being lost.
+* ``restore()`` loads an archive back as its month's partition.
+
+PostgreSQL needs the partition key in every unique index. The primary key
+becomes ``(id, created_at)``; ids still come from the one identity sequence.
+Other unique indexes, such as ``PaymentHistory.transaction_id``, become plain
+indexes plus a ``<table>_<columns>_keys`` table that a trigger fills on every
+insert, so a duplicate still fails with an IntegrityError. Keys outlive their
+rows: an archived payment's transaction id stays taken, and restoring the
+payment doesn't clash.
+
+Queries filtered on ``created_at`` only scan the matching partitions, e.g.
+the notification list pages (``Notification.objects.newest_first()``).
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+PARTITIONED_MODELS = ('users.Notification', 'support.TicketMessage', 'users.PaymentHistory')
+PARTITION_KEY = 'created_at'
+MONTH_SUFFIX = re.compile(r'_(\d{4})(\d{2})$')
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def get_models(labels=None):
+    return [apps.get_model(label) for label in labels or PARTITIONED_MODELS]
+
+
+def current_month(now=None):
+    now = timezone.localtime(now)
+    return now.year, now.month
+
+
+def shift(month, months):
+    year, index = divmod(month[0] * 12 + month[1] - 1 + months, 12)
+    return year, index + 1
+
+
+def month_bounds(month):
+    return (
+        timezone.make_aware(datetime(*month, 1)),
+        timezone.make_aware(datetime(*shift(month, 1), 1)),
+    )
+
+
+def month_range(first, last):
+    while first <= last:
+        yield first
+        first = shift(first, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_{month[0]:04d}{month[1]:02d}'
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns(model):
+    return ', '.join(_quote(field.column) for field in model._meta.concrete_fields)
+
+
+def _check_vendor():
+    if connection.vendor != 'postgresql':
+        raise PartitioningError('Table partitioning needs PostgreSQL.')
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table])
+    return cursor.fetchone() is not None
+
+
+def _require_partitioned(cursor, table):
+    if not is_partitioned(cursor, table):
+        raise PartitioningError(f'{table} is not partitioned yet; run manage_partitions --convert.')
+
+
+def partitions(cursor, table):
+    """``{(year, month): partition name}`` of the monthly partitions attached to ``table``."""
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(%s)', [table],
+    )
+    result = {}
+    for (name,) in cursor.fetchall():
+        match = MONTH_SUFFIX.search(name)
+        if match and name == f'{table}{match.group(0)}':
+            result[int(match.group(1)), int(match.group(2))] = name
+    return result
+
+
+def _create_partition(cursor, model, month):
+    """Create and attach ``month``'s partition, taking over its rows from the default partition."""
+    table = model._meta.db_table
+    name = partition_name(table, month)
+    start, end = month_bounds(month)
+    columns = _columns(model)
+    # Attaching a filled table only needs SHARE UPDATE EXCLUSIVE on the parent;
+    # CREATE TABLE ... PARTITION OF would block every reader.
+    cursor.execute(f'CREATE TABLE {_quote(name)} (LIKE {_quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {_quote(table + "_default")} '
+        f'WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING {columns}) '
+        f'INSERT INTO {_quote(name)} ({columns}) SELECT {columns} FROM moved', [start, end],
+    )
+    cursor.execute(f'ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(name)} FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return name
+
+
+def convert(model, now=None):
+    """Replace ``model``'s table with a partitioned one holding the same rows. False if it already is."""
+    _check_vendor()
+    table = model._meta.db_table
+    new_table = f'{table}__partitioned'
+    columns = _columns(model)
+    premake = getattr(settings, 'PARTITION_PREMAKE_MONTHS', 3)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return False
+        cursor.execute(f'LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE')
+        # Indexes and foreign keys are recreated under their old names after the swap.
+        cursor.execute(
+            'SELECT indisunique, pg_get_indexdef(indexrelid), ARRAY(SELECT attname FROM pg_attribute '
+            'WHERE attrelid = indrelid AND attnum = ANY(indkey)) FROM pg_index '
+            'WHERE indrelid = %s::regclass AND NOT indisprimary ORDER BY indexrelid', [table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(
+            f'CREATE TABLE {_quote(new_table)} (LIKE {_quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE ({PARTITION_KEY})'
+        )
+        cursor.execute(f'SELECT min({PARTITION_KEY}), max(id) FROM {_quote(table)}')
+        oldest, last_id = cursor.fetchone()
+        this_month = current_month(now)
+        for month in month_range(current_month(oldest) if oldest else this_month, shift(this_month, premake)):
+            start, end = month_bounds(month)
+            cursor.execute(
+                f'CREATE TABLE {_quote(partition_name(table, month))} PARTITION OF {_quote(new_table)} '
+                f'FOR VALUES FROM (%s) TO (%s)', [start, end],
+            )
+        cursor.execute(f'CREATE TABLE {_quote(table + "_default")} PARTITION OF {_quote(new_table)} DEFAULT')
+        cursor.execute(f'INSERT INTO {_quote(new_table)} ({columns}) SELECT {columns} FROM {_quote(table)}')
+        if last_id is not None:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [new_table, last_id])
+
+        cursor.execute(f'DROP TABLE {_quote(table)}')
+        cursor.execute(f'ALTER TABLE {_quote(new_table)} RENAME TO {_quote(table)}')
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        cursor.execute(f'ALTER SEQUENCE {cursor.fetchone()[0]} RENAME TO {_quote(table + "_id_seq")}')
+        cursor.execute(f'ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(table + "_pkey")} PRIMARY KEY (id, {PARTITION_KEY})')
+        for unique, definition, index_columns in indexes:
+            if unique and PARTITION_KEY not in definition.split(' USING ', 1)[1]:
+                definition = definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1)
+                _guard_unique(cursor, table, index_columns)
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}')
+    return True
+
+
+def _guard_unique(cursor, table, columns):
+    """Keep ``columns`` unique across every partition through a table of the keys in use."""
+    guard = f'{table}_{"_".join(columns)}_keys'
+    names = ', '.join(_quote(column) for column in columns)
+    new = ', '.join(f'NEW.{_quote(column)}' for column in columns)
+    old = ', '.join(f'OLD.{_quote(column)}' for column in columns)
+    matches = ' AND '.join(f'{_quote(column)} = NEW.{_quote(column)}' for column in columns)
+    cursor.execute(
+        f'CREATE TABLE {_quote(guard)} AS SELECT {names}, id AS row_id FROM {_quote(table)} WHERE '
+        + ' AND '.join(f'{_quote(column)} IS NOT NULL' for column in columns)
+    )
+    cursor.execute(f'ALTER TABLE {_quote(guard)} ADD PRIMARY KEY ({names})')
+    # Each key belongs to the row that first had it. The same row may come back (moved to
+    # another partition, or restored); any other row with the key is refused, and a
+    # concurrent insert of it waits for the first transaction to decide.
+    cursor.execute(
+        f'CREATE FUNCTION {_quote(guard)}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+        'IF ' + ' OR '.join(f'NEW.{_quote(column)} IS NULL' for column in columns) + ' THEN RETURN NULL; END IF; '
+        f"IF TG_OP = 'UPDATE' AND ({new}) IS NOT DISTINCT FROM ({old}) THEN RETURN NULL; END IF; "
+        f'INSERT INTO {_quote(guard)} ({names}, row_id) VALUES ({new}, NEW.id) ON CONFLICT DO NOTHING; '
+        f'IF NOT FOUND AND NOT EXISTS (SELECT 1 FROM {_quote(guard)} WHERE {matches} AND row_id = NEW.id) THEN '
+        f"RAISE EXCEPTION 'duplicate key in %', TG_TABLE_NAME USING ERRCODE = 'unique_violation'; "
+        'END IF; RETURN NULL; END $$'
+    )
+    cursor.execute(
+        f'CREATE TRIGGER {_quote(guard)} AFTER INSERT OR UPDATE OF {names} ON {_quote(table)} '
+        f'FOR EACH ROW EXECUTE FUNCTION {_quote(guard)}()'
+    )
+
+
+def ensure(model, now=None):
+    """Create the missing partitions from this month to ``PARTITION_PREMAKE_MONTHS`` ahead, and
+    for any month that has rows waiting in the default partition. Returns the new partition names."""
+    _check_vendor()
+    table = model._meta.db_table
+    this_month = current_month(now)
+    wanted = set(month_range(this_month, shift(this_month, getattr(settings, 'PARTITION_PREMAKE_MONTHS', 3))))
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        _require_partitioned(cursor, table)
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', {PARTITION_KEY} AT TIME ZONE %s) FROM {_quote(table + '_default')}",
+            [settings.TIME_ZONE],
+        )
+        wanted.update((month.year, month.month) for (month,) in cursor.fetchall())
+        existing = partitions(cursor, table)
+        for month in sorted(wanted - set(existing)):
+            created.append(_create_partition(cursor, model, month))
+    return created
+
+
+def _copy_out(cursor, sql, stream):
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, stream)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            for data in copy:
+                stream.write(data)
+
+
+def _copy_in(cursor, sql, stream):
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, stream)
+    else:
+        with cursor.copy(sql) as copy:
+            while data := stream.read(1 << 16):
+                copy.write(data)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        while data := stream.read(1 << 20):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as stream:
+        json.dump(data, stream, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def archive_dir(model, directory=None):
+    return os.path.join(directory or settings.PARTITION_ARCHIVE_DIR, model._meta.db_table)
+
+
+def _lock_timeout(cursor):
+    # Give up rather than queue every query on the table behind a long transaction.
+    cursor.execute(f"SET LOCAL lock_timeout = '{settings.PARTITION_LOCK_TIMEOUT}'")
+
+
+def _freeze(cursor, name):
+    """Make a partition refuse writes, so it can be copied out without locking the parent.
+    Neither statement blocks readers."""
+    with transaction.atomic():
+        _lock_timeout(cursor)
+        cursor.execute(
+            'CREATE OR REPLACE FUNCTION kelaasor_archiving() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            "RAISE EXCEPTION 'partition % is being archived', TG_TABLE_NAME USING ERRCODE = 'read_only_sql_transaction'; "
+            'END $$'
+        )
+        cursor.execute(
+            f'CREATE OR REPLACE TRIGGER kelaasor_archiving BEFORE INSERT OR UPDATE OR DELETE ON {_quote(name)} '
+            'FOR EACH ROW EXECUTE FUNCTION kelaasor_archiving()'
+        )
+        cursor.execute(f'ALTER TABLE {_quote(name)} ENABLE TRIGGER kelaasor_archiving')
+
+
+def _thaw(cursor, name):
+    cursor.execute(f'ALTER TABLE {_quote(name)} DISABLE TRIGGER kelaasor_archiving')
+
+
+def archive(model, now=None, directory=None):
+    """Move the partitions past the model's retention to files. Returns ``[{partition, rows, manifest}]``."""
+    _check_vendor()
+    table = model._meta.db_table
+    retention = settings.PARTITION_RETENTION_MONTHS.get(model._meta.label)
+    if retention is None:
+        return []
+    cutoff = shift(current_month(now), -retention)
+    folder = archive_dir(model, directory)
+    columns = [field.column for field in model._meta.concrete_fields]
+    archived = []
+    with connection.cursor() as cursor:
+        _require_partitioned(cursor, table)
+        for month, name in sorted(partitions(cursor, table).items()):
+            if month >= cutoff:
+                continue
+            os.makedirs(folder, exist_ok=True)
+            data_path = os.path.join(folder, f'{name}.csv.gz')
+            manifest_path = os.path.join(folder, f'{name}.json')
+            # Copy the frozen partition out while the parent stays open for reads and writes;
+            # only the detach and drop below take its ACCESS EXCLUSIVE lock.
+            _freeze(cursor, name)
+            try:
+                with transaction.atomic():
+                    cursor.execute(f'SELECT count(*) FROM {_quote(name)}')
+                    rows = cursor.fetchone()[0]
+                    with open(data_path + '.tmp', 'wb') as raw:
+                        with gzip.GzipFile(fileobj=raw, mode='wb') as stream:
+                            _copy_out(cursor, f'COPY {_quote(name)} ({_columns(model)}) TO STDOUT WITH (FORMAT csv, HEADER true)', stream)
+                        raw.flush()
+                        os.fsync(raw.fileno())
+                os.replace(data_path + '.tmp', data_path)
+                _write_json(manifest_path, {
+                    'model': model._meta.label,
+                    'table': table,
+                    'partition': name,
+                    'month': list(month),
+                    'columns': columns,
+                    'rows': rows,
+                    'file': os.path.basename(data_path),
+                    'sha256': _sha256(data_path),
+                    'archived_at': timezone.now().isoformat(),
+                })
+                with transaction.atomic():
+                    _lock_timeout(cursor)
+                    cursor.execute(f'ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}')
+                    cursor.execute(f'DROP TABLE {_quote(name)}')
+            except Exception:
+                _thaw(cursor, name)
+                raise
+            archived.append({'partition': name, 'rows': rows, 'manifest': manifest_path})
+    return archived
+
+
+def restore(manifest_path):
+    """Load an archived partition back in. It is archived again on the next run unless the
+    model's retention now covers it."""
+    _check_vendor()
+    with open(manifest_path) as stream:
+        manifest = json.load(stream)
+    model = apps.get_model(manifest['model'])
+    month = tuple(manifest['month'])
+    data_path = os.path.join(os.path.dirname(manifest_path), manifest['file'])
+    if _sha256(data_path) != manifest['sha256']:
+        raise PartitioningError(f'{data_path} does not match its manifest checksum.')
+    columns = ', '.join(_quote(column) for column in manifest['columns'])
+    with transaction.atomic(), connection.cursor() as cursor:
+        _require_partitioned(cursor, model._meta.db_table)
+        if month in partitions(cursor, model._meta.db_table):
+            raise PartitioningError(f'{manifest["partition"]} is already attached.')
+        name = _create_partition(cursor, model, month)
+        with gzip.open(data_path, 'rb') as stream:
+            _copy_in(cursor, f'COPY {_quote(name)} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)', stream)
+    return manifest
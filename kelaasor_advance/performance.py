@@ -0,0 +1,264 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` samples a fraction of requests (``PERF_SAMPLE_RATE``)
+and, for sampled requests, installs a DB ``execute_wrapper`` that records every
+statement. Each sampled request gets a ``Server-Timing`` header and one
+structured log line tagged with the resolved URL name; the totals also feed
+in-process histograms served in Prometheus text format by ``metrics_view``.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger('kelaasor_advance.performance')
+slow_query_logger = logging.getLogger('kelaasor_advance.performance.slow_queries')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callable collecting (sql, seconds) for one request."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    @property
+    def duplicates(self):
+        return len(self.queries) - len({sql for sql, _ in self.queries})
+
+    def slowest(self, limit):
+        return sorted(self.queries, key=lambda q: q[1], reverse=True)[:limit]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label, (counts, total, observed) in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{view="{label}",le="+Inf"}} {observed}')
+                lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+                lines.append(f'{self.name}_count{{view="{label}"}} {observed}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('kelaasor_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS)
+DB_DURATION = Histogram('kelaasor_db_duration_seconds', 'Time spent in database queries per request.', DURATION_BUCKETS)
+QUERY_COUNT = Histogram('kelaasor_db_queries', 'Database queries per request.', COUNT_BUCKETS)
+DUPLICATE_QUERIES = Histogram('kelaasor_db_duplicate_queries', 'Repeated SQL statements per request.', COUNT_BUCKETS)
+HISTOGRAMS = [REQUEST_DURATION, DB_DURATION, QUERY_COUNT, DUPLICATE_QUERIES]
+
+CONNECTIONS_OPENED = {}
+_connections_lock = threading.Lock()
+
+
+def _count_connection(sender, connection, **kwargs):
+    with _connections_lock:
+        CONNECTIONS_OPENED[connection.alias] = CONNECTIONS_OPENED.get(connection.alias, 0) + 1
+
+
+connection_created.connect(_count_connection)
+
+
+def pool_stats(alias):
+    """psycopg_pool statistics for ``alias``, or None when it is not pooled."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+        return None
+    pool = connection.pool
+    stats = pool.get_stats()
+    return {
+        'size': stats.get('pool_size', 0),
+        'available': stats.get('pool_available', 0),
+        'max_size': pool.max_size,
+        'waiting': stats.get('requests_waiting', 0),
+        'requests': stats.get('requests_num', 0),
+        'wait_seconds': stats.get('requests_wait_ms', 0) / 1000,
+        'errors': stats.get('requests_errors', 0),
+        'connect_seconds': stats.get('connections_ms', 0) / 1000,
+    }
+
+
+def render_connection_metrics():
+    lines = [
+        "# HELP kelaasor_db_connections_total Connections opened, or checked out of the pool, per alias.",
+        "# TYPE kelaasor_db_connections_total counter",
+    ]
+    with _connections_lock:
+        opened = dict(CONNECTIONS_OPENED)
+    for alias, count in sorted(opened.items()):
+        lines.append(f'kelaasor_db_connections_total{{alias="{alias}"}} {count}')
+
+    series = [
+        ('kelaasor_db_pool_size', 'gauge', 'Connections currently held by the pool.', 'size'),
+        ('kelaasor_db_pool_available', 'gauge', 'Idle connections in the pool.', 'available'),
+        ('kelaasor_db_pool_waiting', 'gauge', 'Requests waiting for a connection.', 'waiting'),
+        ('kelaasor_db_pool_requests_total', 'counter', 'Connection requests served by the pool.', 'requests'),
+        ('kelaasor_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.', 'wait_seconds'),
+        ('kelaasor_db_pool_request_errors_total', 'counter', 'Connection requests that failed or timed out.', 'errors'),
+        ('kelaasor_db_pool_connect_seconds_total', 'counter', 'Time spent opening new connections.', 'connect_seconds'),
+    ]
+    stats = {alias: pool_stats(alias) for alias in connections}
+    stats = {alias: value for alias, value in stats.items() if value is not None}
+    if not stats:
+        return lines
+    for name, kind, help_text, key in series:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{alias="{alias}"}} {value[key]}' for alias, value in sorted(stats.items())]
+    lines += [
+        "# HELP kelaasor_db_pool_saturation Share of max_size checked out (0-1).",
+        "# TYPE kelaasor_db_pool_saturation gauge",
+    ]
+    for alias, value in sorted(stats.items()):
+        in_use = value['size'] - value['available']
+        lines.append(f'kelaasor_db_pool_saturation{{alias="{alias}"}} {in_use / value["max_size"]:.3f}')
+    return lines
+
+
+def render_prometheus():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.extend(render_connection_metrics())
+    return "\n".join(lines) + "\n"
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 0)
+        self.slow_query_seconds = getattr(settings, 'PERF_SLOW_QUERY_MS', 100) / 1000
+        self.top_queries = getattr(settings, 'PERF_TOP_QUERIES', 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        self.record(request, response, recorder, elapsed)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = await self.get_response(request)
+        elapsed = time.perf_counter() - started
+        self.record(request, response, recorder, elapsed)
+        return response
+
+    def record(self, request, response, recorder, elapsed):
+        name = view_name(request)
+        db_time = recorder.duration
+        REQUEST_DURATION.observe(name, elapsed)
+        DB_DURATION.observe(name, db_time)
+        QUERY_COUNT.observe(name, recorder.count)
+        DUPLICATE_QUERIES.observe(name, recorder.duplicates)
+
+        response['Server-Timing'] = ", ".join([
+            f'total;dur={elapsed * 1000:.1f}',
+            f'db;dur={db_time * 1000:.1f};desc="{recorder.count} queries"',
+            f'app;dur={(elapsed - db_time) * 1000:.1f}',
+        ])
+        slowest = recorder.slowest(self.top_queries)
+        logger.info(json.dumps({
+            'event': 'request',
+            'view': name,
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'db_ms': round(db_time * 1000, 2),
+            'queries': recorder.count,
+            'duplicate_queries': recorder.duplicates,
+            'slowest': [{'sql': sql, 'ms': round(seconds * 1000, 2)} for sql, seconds in slowest],
+        }))
+        for sql, seconds in slowest:
+            if seconds >= self.slow_query_seconds:
+                slow_query_logger.warning(json.dumps({
+                    'event': 'slow_query', 'view': name, 'ms': round(seconds * 1000, 2), 'sql': sql,
+                }))
+
+
+def metrics_view(request):
+    token = getattr(settings, 'PERF_METRICS_TOKEN', None)
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        authorized = True
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4')
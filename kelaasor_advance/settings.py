@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
+import json
 import os
 from dotenv import load_dotenv
 
@@ -49,11 +51,17 @@ INSTALLED_APPS = [
     'products',
     'users',
     'support',
+    'analytics',
+    'payments',
+    'progress',
+    'benchmarks',
 ]
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    'kelaasor_advance.performance.PerformanceMiddleware',
+    'kelaasor_advance.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,9 +102,55 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Persistent connections: reuse one connection per worker thread for up
+        # to DB_CONN_MAX_AGE seconds (0 closes after every request), checking it
+        # is still usable before each request. Off by default under ASGI (set by
+        # asgi.py), where threads come and go with async views and streams and
+        # each would keep its own connection open; use DB_POOL there.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0' if os.getenv('DJANGO_ASGI') == 'True' else '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {},
     }
 }
 
+# Connection pool shared by all threads of a worker (Django's psycopg 3 pool,
+# from `psycopg[binary,pool]` in requirements.txt). Replaces
+# persistent connections; CONN_HEALTH_CHECKS makes the pool check connections
+# before handing them out.
+if os.getenv('DB_POOL') == 'True':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+    }
+
+# Read replicas: one alias per host in DB_REPLICA_HOSTS, same credentials as
+# default, and any full DATABASES entries given in DB_REPLICA_DATABASES as a
+# JSON object of alias -> settings (e.g. a second SQLite file to try the
+# routing locally). See kelaasor_advance/db_router.py for what is routed to them.
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    _alias = f'replica_{_index}'
+    DATABASES[_alias] = {
+        **DATABASES['default'], 'HOST': _host.strip(), 'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(_alias)
+for _alias, _entry in json.loads(os.getenv('DB_REPLICA_DATABASES') or '{}').items():
+    DATABASES[_alias] = {'TEST': {'MIRROR': 'default'}, **_entry}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['kelaasor_advance.db_router.ReplicaRouter']
+# Seconds a user's reads stay on the primary after one of their writes.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+# Where the pins live; must be shared by all workers when replicas are used.
+REPLICA_PIN_CACHE = os.getenv('REPLICA_PIN_CACHE', 'default')
+# Seconds an unreachable replica is skipped before it is tried again.
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -148,8 +202,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -157,4 +211,181 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
-}
\ No newline at end of file
+    'DEFAULT_THROTTLE_CLASSES': [
+        'kelaasor_advance.throttling.UserOrIPThrottle',
+    ],
+    # Sliding-window limits (kelaasor_advance/throttling.py): a short burst window and a sustained one.
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': ['60/10s', '1200/h'],
+        'user': ['100/10s', '5000/h'],
+        'catalog_anon': ['30/10s', '600/h'],
+        'catalog_user': ['60/10s', '2000/h'],
+        'otp_ip': ['10/m', '60/h'],
+        'otp_send_phone': ['3/10m', '10/d'],
+        'otp_verify_phone': ['5/10m', '20/d'],
+    },
+    # Client IP for the IP throttles. 0 uses REMOTE_ADDR and ignores X-Forwarded-For,
+    # which clients can set to anything. Behind proxies, set NUM_PROXIES to the
+    # number of our own proxies in front of Django (e.g. 1 for one nginx hop).
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+}
+
+API_THROTTLING = os.getenv('API_THROTTLING', 'True') == 'True'
+# Units a catalog search costs against the catalog limits; a plain listing costs 1.
+THROTTLE_SEARCH_COST = int(os.getenv('THROTTLE_SEARCH_COST', '5'))
+# Must be a cache shared by all workers (Redis/Memcached) in production.
+THROTTLE_CACHE = os.getenv('THROTTLE_CACHE', 'default')
+
+# Opt-in orjson renderer/parser; falls back to DRF's stdlib json when orjson is missing.
+FAST_JSON = os.getenv('FAST_JSON') == 'True'
+if FAST_JSON:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'kelaasor_advance.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+        'kelaasor_advance.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ]
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('JWT_ACCESS_MINUTES', '5'))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', '7'))),
+    'ROTATE_REFRESH_TOKENS': True,
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+# Read-only requests take the user's claim fields and is_active from the cache
+# (users/authentication.py). Saves and deletes drop the entry at once; this
+# bounds how long a queryset update() can go unseen.
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', '60'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Idempotency-Key results for POST endpoints, stored in the database
+# (users/idempotency.py); `manage.py flush_idempotency_keys` deletes expired ones.
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '30'))
+
+# "Students also bought" (analytics/related.py, `manage.py refresh_related_products`).
+RELATED_TOP_K = int(os.getenv('RELATED_TOP_K', '10'))
+RELATED_MIN_SUPPORT = int(os.getenv('RELATED_MIN_SUPPORT', '2'))
+RELATED_BLOCK_ROWS = int(os.getenv('RELATED_BLOCK_ROWS', '2000'))
+
+# Course start reminders go out this long before Product.start_date (users/lifecycle.py).
+COURSE_REMINDER_LEAD_HOURS = int(os.getenv('COURSE_REMINDER_LEAD_HOURS', '24'))
+
+# Discount code index reload interval (users/pricing.py); changes made through
+# the ORM's save/delete reload it immediately.
+PRICING_INDEX_MAX_AGE = int(os.getenv('PRICING_INDEX_MAX_AGE', '300'))
+
+# Payments (payments/gateways.py). PAYMENT_GATEWAY is used for new checkouts
+# (empty: checkout is refused); every gateway that may still have pending
+# payments must stay listed. The fake gateway settles any payment for free, so
+# it and its pay page are only enabled with DEBUG or PAYMENT_FAKE_GATEWAY=True.
+PAYMENT_FAKE_GATEWAY = os.getenv('PAYMENT_FAKE_GATEWAY', str(DEBUG)) == 'True'
+PAYMENT_GATEWAYS = {}
+if PAYMENT_FAKE_GATEWAY:
+    PAYMENT_GATEWAYS['fake'] = 'payments.gateways.FakeGateway'
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'fake' if PAYMENT_FAKE_GATEWAY else '')
+# HMAC key of gateway callbacks; required unless DEBUG (payments/checks.py).
+PAYMENT_WEBHOOK_SECRET = os.getenv('PAYMENT_WEBHOOK_SECRET', '')
+
+# Notification push (users/realtime.py). LocalBroker only reaches streams in the
+# same process; with several ASGI workers use users.realtime.RedisBroker.
+NOTIFICATION_BROKER = os.getenv('NOTIFICATION_BROKER', 'users.realtime.LocalBroker')
+NOTIFICATION_BROKER_URL = os.getenv('NOTIFICATION_BROKER_URL', '')
+NOTIFICATION_STREAM_KEEPALIVE = int(os.getenv('NOTIFICATION_STREAM_KEEPALIVE', '15'))
+NOTIFICATION_STREAM_MAX_SECONDS = int(os.getenv('NOTIFICATION_STREAM_MAX_SECONDS', '300'))
+NOTIFICATION_LONGPOLL_TIMEOUT = int(os.getenv('NOTIFICATION_LONGPOLL_TIMEOUT', '25'))
+
+# Video progress heartbeats are buffered in the cache and flushed once per window
+# by `manage.py flush_video_progress --loop N` (progress/services.py). With a
+# per-process cache they are written to the database directly instead.
+PROGRESS_FLUSH_SECONDS = int(os.getenv('PROGRESS_FLUSH_SECONDS', '60'))
+PROGRESS_STATE_TTL = int(os.getenv('PROGRESS_STATE_TTL', str(7 * 86400)))
+PROGRESS_ACCESS_RECHECK_SECONDS = int(os.getenv('PROGRESS_ACCESS_RECHECK_SECONDS', '600'))
+PROGRESS_COMPLETE_RATIO = float(os.getenv('PROGRESS_COMPLETE_RATIO', '0.9'))
+# Fastest playback speed the player offers; bounds how fast watched time can grow.
+PROGRESS_MAX_PLAYBACK_RATE = float(os.getenv('PROGRESS_MAX_PLAYBACK_RATE', '2.0'))
+
+# Monthly partitions of the append-only tables (kelaasor_advance/partitioning.py,
+# `manage.py manage_partitions`, PostgreSQL only). Partitions older than the
+# retention are archived to PARTITION_ARCHIVE_DIR as gzipped CSV and dropped.
+# Payment records are kept in the database unless a retention is set for them.
+PARTITION_PREMAKE_MONTHS = int(os.getenv('PARTITION_PREMAKE_MONTHS', '3'))
+PARTITION_RETENTION_MONTHS = {
+    'users.Notification': int(os.getenv('NOTIFICATION_RETENTION_MONTHS', '6')),
+    'support.TicketMessage': int(os.getenv('TICKET_MESSAGE_RETENTION_MONTHS', '24')),
+}
+if os.getenv('PAYMENT_HISTORY_RETENTION_MONTHS'):
+    PARTITION_RETENTION_MONTHS['users.PaymentHistory'] = int(os.environ['PAYMENT_HISTORY_RETENTION_MONTHS'])
+PARTITION_ARCHIVE_DIR = os.getenv('PARTITION_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'archive'))
+# How long archiving waits for a table lock before giving up until the next run.
+PARTITION_LOCK_TIMEOUT = os.getenv('PARTITION_LOCK_TIMEOUT', '5s')
+# Notifications per page of the notification list, which is paged by
+# created_at, so each page reads the newest partitions it needs.
+NOTIFICATION_PAGE_SIZE = int(os.getenv('NOTIFICATION_PAGE_SIZE', '50'))
+
+# Prime URL patterns, DRF views and serializers, connections and the local
+# caches when wsgi.py/asgi.py is loaded, before the worker takes requests
+# (kelaasor_advance/warmup.py).
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'True') == 'True'
+
+# Cross-process invalidation of in-process caches (kelaasor_advance/invalidation.py).
+# Saves and deletes of these models are published to every worker, with the
+# listed fields; through LISTEN/NOTIFY on PostgreSQL, and each worker also polls
+# the version table every INVALIDATION_POLL_SECONDS.
+INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'True') == 'True'
+INVALIDATION_MODELS = {
+    'products.Product': [],
+    'products.Category': [],
+    'users.DiscountCode': [],
+    'users.CourseEnrollment': ['user_id'],
+    'users.Order': ['user_id'],
+    'users.CustomUser': [],
+}
+INVALIDATION_POLL_SECONDS = float(os.getenv('INVALIDATION_POLL_SECONDS', '10'))
+# Version rows per model, so concurrent saves of one model don't all bump the same row.
+INVALIDATION_VERSION_SHARDS = int(os.getenv('INVALIDATION_VERSION_SHARDS', '16'))
+
+# Precompiled catalog served by the product endpoints (products/catalog.py).
+# Build it with `manage.py build_catalog_snapshot`; catalog edits rebuild it on
+# every node (each keeps its own file).
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT') == 'True'
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', str(BASE_DIR / 'var' / 'catalog.snapshot'))
+CATALOG_SNAPSHOT_CHECK_SECONDS = float(os.getenv('CATALOG_SNAPSHOT_CHECK_SECONDS', '2'))
+
+
+# Request performance instrumentation
+
+PERF_SAMPLE_RATE = float(os.getenv('PERF_SAMPLE_RATE', '0'))
+PERF_SLOW_QUERY_MS = float(os.getenv('PERF_SLOW_QUERY_MS', '100'))
+PERF_TOP_QUERIES = 5
+PERF_METRICS_TOKEN = os.getenv('PERF_METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'kelaasor_advance.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.db import connections, router, transaction
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from products.models import Product
+from users.models import CustomUser
+from . import db_router
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'], REPLICA_PIN_CACHE='pins',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}, 'pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'kelaasor-test-pins'),
+    }},
+)
+class ReplicaRouterTests(SimpleTestCase):
+    """Two SQLite aliases next to ``default``: a reachable replica and one whose folder is missing."""
+
+    # Outside a test transaction, so reads are free to leave ``default``.
+    databases = {'default'}
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        for alias, name in [('replica', 'replica.sqlite3'), ('broken_replica', os.path.join('gone', 'db.sqlite3'))]:
+            settings_dict = {
+                **connections['default'].settings_dict, 'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {},
+                'NAME': os.path.join(folder, name),
+            }
+            connections[alias] = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+            self.addCleanup(self.drop_connection, alias)
+        patch = mock.patch.dict(db_router._down, clear=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        db_router.pin_cache().clear()
+        self.user = CustomUser(pk=1, phone='09120000001')
+
+    def drop_connection(self, alias):
+        connections[alias].close()
+        del connections[alias]
+
+    def request(self, method='get', user=None, status=200):
+        """Run a request through the middleware; returns the alias its product read went to."""
+        request = getattr(RequestFactory(), method)('/')
+        if user is not None:
+            request.user = user
+        used = []
+
+        def view(request):
+            used.append(Product.objects.all().db)
+            return HttpResponse(status=status)
+
+        db_router.ReplicaRoutingMiddleware(view)(request)
+        return used[0]
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.request(), 'replica')
+        self.assertEqual(router.db_for_read(Product), 'replica')
+
+    def test_writes_and_transactions_stay_on_the_primary(self):
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertEqual(self.request('post'), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_write_pins_the_user_to_the_primary(self):
+        self.request('post', user=self.user)
+        self.assertEqual(self.request(user=self.user), 'default')
+        self.assertEqual(self.request(user=CustomUser(pk=2, phone='09120000002')), 'replica')
+
+    def test_failed_write_does_not_pin(self):
+        self.request('post', user=self.user, status=400)
+        self.assertEqual(self.request(user=self.user), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=['broken_replica'])
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        self.assertEqual(self.request(), 'default')
+        with mock.patch.object(connections['broken_replica'], 'ensure_connection') as ensure_connection:
+            self.assertEqual(self.request(), 'default')
+        ensure_connection.assert_not_called()
+
+    @override_settings(DATABASE_REPLICAS=['broken_replica', 'replica'])
+    def test_reads_skip_an_unreachable_replica(self):
+        self.assertEqual({self.request() for _ in range(5)}, {'replica'})
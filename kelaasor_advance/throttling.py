@@ -0,0 +1,203 @@
+"""
+Sliding-window throttles on the shared cache.
+
+Each scope has one or more limits such as ``'10/10s'`` (the burst allowance)
+and ``'120/h'`` (the sustained rate), configured in
+``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``. A limit is tracked with two
+fixed-window counters, the current and the previous window; the previous one
+is weighted by how much of it still overlaps the sliding window. A check is
+one ``get_many`` plus one ``incr`` per limit regardless of traffic, and the
+counters only ever move through ``incr``, so concurrent workers cannot
+overwrite each other's counts.
+
+Requests can cost more than one unit (see ``CatalogThrottle``). Denied
+requests get DRF's 429 with a ``Retry-After`` header from ``wait()``. Plain
+Django async views, which DRF does not wrap, call ``athrottle()`` themselves.
+
+The cache must be shared between workers (Redis or Memcached) for the
+limits to hold across processes; with the default LocMemCache every worker
+counts on its own.
+"""
+import math
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+RATE_RE = re.compile(r'^(\d+)/(\d*)([a-z]+)$')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'30/10s'`` -> ``(30, 10)``; the unit may also be written out (``'100/hour'``)."""
+    match = RATE_RE.match(rate.strip())
+    if match is None or match.group(3)[0] not in PERIODS:
+        raise ValueError(f'Invalid throttle rate: {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    scope = None
+    cache_alias = 'default'
+    key_prefix = 'throttle'
+
+    def get_ident_key(self, request, view):
+        """The value to count requests against, or None to not throttle this request."""
+        raise NotImplementedError
+
+    def get_cost(self, request, view):
+        return 1
+
+    def get_limits(self):
+        rates = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if not rates:
+            return []
+        if isinstance(rates, str):
+            rates = [rates]
+        return [parse_rate(rate) for rate in rates]
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not getattr(settings, 'API_THROTTLING', True):
+            return True
+        limits = self.get_limits()
+        ident = self.get_ident_key(request, view)
+        if not limits or ident is None:
+            return True
+        cache = caches[getattr(settings, 'THROTTLE_CACHE', self.cache_alias)]
+        cost = self.get_cost(request, view)
+        now = time.time()
+
+        windows, keys = [], []
+        for limit, period in limits:
+            index, elapsed = divmod(now, period)
+            current = f'{self.key_prefix}:{self.scope}:{ident}:{period}:{int(index)}'
+            previous = f'{self.key_prefix}:{self.scope}:{ident}:{period}:{int(index) - 1}'
+            windows.append((limit, period, elapsed, current, previous))
+            keys += [current, previous]
+        counts = cache.get_many(keys)
+
+        waits = []
+        for limit, period, elapsed, current, previous in windows:
+            used, carried = counts.get(current, 0), counts.get(previous, 0)
+            weight = 1 - elapsed / period
+            if carried * weight + used + cost > limit:
+                waits.append(self._wait(limit, period, elapsed, used, carried, cost))
+        if waits:
+            self.retry_after = max(waits)
+            return False
+
+        for limit, period, elapsed, current, previous in windows:
+            try:
+                cache.incr(current, cost)
+            except ValueError:
+                # First hit in this window; another worker may create it between the calls.
+                if not cache.add(current, cost, period * 2):
+                    cache.incr(current, cost)
+        return True
+
+    def _wait(self, limit, period, elapsed, used, carried, cost):
+        if cost > limit:
+            return period
+        if carried and used + cost <= limit:
+            # Wait until enough of the previous window has slid out.
+            excess = carried * (1 - elapsed / period) + used + cost - limit
+            return min(excess / carried * period, period - elapsed)
+        # This window alone is over the limit; it only starts fading once the next window begins.
+        return period - elapsed + (used + cost - limit) / used * period
+
+    def wait(self):
+        if self.retry_after is None:
+            return None
+        return max(1, math.ceil(self.retry_after))
+
+
+class IPThrottle(SlidingWindowThrottle):
+    """Per client IP (``NUM_PROXIES`` decides how much of X-Forwarded-For to trust)."""
+    scope = 'ip'
+
+    def get_ident_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserOrIPThrottle(SlidingWindowThrottle):
+    """Per user when authenticated, otherwise per IP, each with its own scope."""
+    user_scope = 'user'
+    anon_scope = 'anon'
+
+    def allow_request(self, request, view):
+        self.scope = self.user_scope if request.user and request.user.is_authenticated else self.anon_scope
+        return super().allow_request(request, view)
+
+    def get_ident_key(self, request, view):
+        if self.scope == self.user_scope:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class CatalogThrottle(UserOrIPThrottle):
+    """Catalog listing: a search is charged ``THROTTLE_SEARCH_COST`` units instead of one."""
+    user_scope = 'catalog_user'
+    anon_scope = 'catalog_anon'
+
+    def get_cost(self, request, view):
+        if request.query_params.get('search', '').strip():
+            return getattr(settings, 'THROTTLE_SEARCH_COST', 5)
+        return 1
+
+
+class PhoneThrottle(SlidingWindowThrottle):
+    """Per phone number in the request body, so one number cannot be hammered from many IPs."""
+    scope = 'phone'
+
+    def get_ident_key(self, request, view):
+        phone = request.data.get('phone') if hasattr(request.data, 'get') else None
+        if not isinstance(phone, str) or not phone.strip():
+            return None
+        return f'phone:{phone.strip()[:32]}'
+
+
+class OTPSendPhoneThrottle(PhoneThrottle):
+    scope = 'otp_send_phone'
+
+
+class OTPVerifyPhoneThrottle(PhoneThrottle):
+    scope = 'otp_verify_phone'
+
+
+class OTPIPThrottle(IPThrottle):
+    scope = 'otp_ip'
+
+
+def _throttle(request, user, throttle_classes):
+    drf_request = Request(request)
+    drf_request._user = user or AnonymousUser()
+    waits = []
+    for throttle in [cls() for cls in throttle_classes or api_settings.DEFAULT_THROTTLE_CLASSES]:
+        if not throttle.allow_request(drf_request, None):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+    wait = max((w for w in waits if w is not None), default=None)
+    response = JsonResponse({'detail': str(Throttled(wait).detail)}, status=429)
+    if wait is not None:
+        response['Retry-After'] = str(wait)
+    return response
+
+
+async def athrottle(request, user, throttle_classes=None):
+    """Apply the API throttles (default: ``DEFAULT_THROTTLE_CLASSES``) in a plain Django async view.
+
+    Returns the 429 response to send, or None when the request may go on.
+    """
+    return await sync_to_async(_throttle)(request, user, throttle_classes)
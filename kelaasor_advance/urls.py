@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from .performance import metrics_view
 
 def api_root(request):
     return JsonResponse({
@@ -26,17 +27,39 @@ def api_root(request):
             'products': {
                 'categories': '/api/products/categories/',
                 'products': '/api/products/products/',
+                'related': '/api/products/products/<id>/related/',
             },
             'users': {
                 'send_otp': '/api/users/send-otp/',
                 'verify_otp': '/api/users/verify-otp/',
+                'token_refresh': '/api/users/token/refresh/',
+                'logout': '/api/users/logout/',
                 'me': '/api/users/me/',
+                'home': '/api/users/home/',
                 'cart': '/api/users/cart/',
                 'add_to_cart': '/api/users/cart/add/',
                 'checkout': '/api/users/cart/checkout/',
+                'price_preview': '/api/users/cart/price-preview/',
+                'notifications_stream': '/api/users/notifications/stream/',
+                'notifications_poll': '/api/users/notifications/poll/',
             },
             'support': {
                 'tickets': '/api/support/tickets/',
+            },
+            'analytics': {
+                'daily': '/api/analytics/daily/',
+                'products': '/api/analytics/products/',
+                'categories': '/api/analytics/categories/',
+                'discounts': '/api/analytics/discounts/',
+            },
+            'payments': {
+                'status': '/api/payments/<transaction_id>/',
+                'webhook': '/api/payments/webhook/<gateway>/',
+            },
+            'progress': {
+                'heartbeat': '/api/progress/heartbeat/',
+                'video': '/api/progress/videos/<video_id>/',
+                'course': '/api/progress/courses/<product_id>/',
             }
         },
         
@@ -45,9 +68,13 @@ def api_root(request):
 urlpatterns = [
     path('', api_root, name='api-root'),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('api/products/', include('products.urls')),
     path('api/users/', include('users.urls')),
     path('api/support/', include('support.urls')),
+    path('api/analytics/', include('analytics.urls')),
+    path('api/payments/', include('payments.urls')),
+    path('api/progress/', include('progress.urls')),
 ]
 
 
@@ -0,0 +1,185 @@
+"""
+Warm-up run by ``wsgi.py`` / ``asgi.py`` before a worker serves traffic
+(``WARMUP_ON_START``), and by ``manage.py warm_up`` for a timing report.
+
+A cold worker otherwise pays on its first requests for: compiling the URL
+patterns, DRF's lazy imports of renderer/parser/authentication/throttle
+classes, ``ModelSerializer`` field introspection and the translation catalogs
+it loads, django-filter form building, opening database and cache
+connections, and filling the per-process catalog snapshot and discount index.
+
+Every step is best effort: a failure is logged and startup continues.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from importlib import import_module
+from importlib.util import find_spec
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpRequest
+from django.urls import URLResolver, get_resolver
+from rest_framework.serializers import BaseSerializer
+
+from products import catalog
+from users import pricing
+
+
+logger = logging.getLogger(__name__)
+
+
+def project_apps():
+    base_dir = str(settings.BASE_DIR)
+    return [
+        config for config in apps.get_app_configs()
+        if config.path.startswith(base_dir) and not config.path.startswith(os.path.join(base_dir, '.venv'))
+    ]
+
+
+def _patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def warm_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    count = 0
+    for pattern in _patterns(resolver.url_patterns):
+        pattern.pattern.regex
+        count += 1
+    return count
+
+
+def warm_views():
+    """Instantiate the DRF policy classes of every API view, which imports them on first use."""
+    request = HttpRequest()
+    request.method = 'GET'
+    count = 0
+    for pattern in _patterns(get_resolver().url_patterns):
+        cls = getattr(pattern.callback, 'cls', None)
+        if cls is None or not hasattr(cls, 'get_renderers'):
+            continue
+        view = cls(**getattr(pattern.callback, 'initkwargs', {}))
+        view.request, view.args, view.kwargs = request, (), {}
+        try:
+            view.get_renderers()
+            view.get_parsers()
+            view.get_authenticators()
+            view.get_permissions()
+            view.get_throttles()
+            view.get_content_negotiator()
+            for backend in getattr(view, 'filter_backends', ()):
+                backend()
+            filterset_class = getattr(view, 'filterset_class', None)
+            if filterset_class is not None:
+                filterset_class(queryset=filterset_class._meta.model._default_manager.none()).form
+        except Exception:
+            logger.debug('Skipped warming %s', cls.__name__, exc_info=True)
+            continue
+        count += 1
+    return count
+
+
+def warm_serializers():
+    count = 0
+    for config in project_apps():
+        name = f'{config.name}.serializers'
+        if find_spec(name) is None:
+            continue
+        module = import_module(name)
+        for value in vars(module).values():
+            if not (isinstance(value, type) and issubclass(value, BaseSerializer) and value.__module__ == name):
+                continue
+            try:
+                value().fields
+            except Exception:
+                # Abstract bases and serializers that need constructor arguments.
+                logger.debug('Skipped warming %s.%s', name, value.__name__, exc_info=True)
+                continue
+            count += 1
+    return count
+
+
+def warm_connections():
+    for alias in connections:
+        connections[alias].ensure_connection()
+    for alias in settings.CACHES:
+        caches[alias].get('warmup')
+    return len(settings.DATABASES) + len(settings.CACHES)
+
+
+def warm_caches():
+    snapshot = catalog.current()
+    if snapshot is not None:
+        snapshot.product_list(snapshot.select())
+    return len(pricing.get_index().by_code)
+
+
+STEPS = {
+    'urls': warm_urls,
+    'views': warm_views,
+    'serializers': warm_serializers,
+    'connections': warm_connections,
+    'caches': warm_caches,
+}
+
+
+def warm_up(steps=None):
+    """Run the warm-up steps; returns ``{step: (seconds, count or None)}``."""
+    timings = {}
+    for name in steps or STEPS:
+        start = time.perf_counter()
+        try:
+            count = STEPS[name]()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            count = None
+        timings[name] = (time.perf_counter() - start, count)
+    logger.info('Warm-up done: %s', ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, (seconds, _) in timings.items()))
+    return timings
+
+
+def warm_up_on_start():
+    if not getattr(settings, 'WARMUP_ON_START', False):
+        return
+    # A worker forked after warming (e.g. gunicorn --preload) must not share the parent's sockets.
+    os.register_at_fork(before=connections.close_all)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        warm_up()
+    else:
+        # Imported from inside an event loop (uvicorn): the ORM refuses to run there.
+        thread = threading.Thread(target=warm_up, name='warm-up')
+        thread.start()
+        thread.join()
+
+
+def import_profile():
+    """Import times of a fresh interpreter running ``django.setup()`` and loading the URLconf.
+    Returns ``[(module, self_us, cumulative_us)]`` in import order."""
+    code = 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, cwd=str(settings.BASE_DIR), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+        if self_us.strip().isdigit():
+            rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
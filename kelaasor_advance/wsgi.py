@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kelaasor_advance.settings')
 
 application = get_wsgi_application()
+
+from kelaasor_advance import invalidation  # noqa: E402
+from kelaasor_advance.warmup import warm_up_on_start  # noqa: E402
+
+warm_up_on_start()
+invalidation.start()
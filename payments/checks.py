@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.security)
+def check_payment_settings(app_configs, **kwargs):
+    errors = []
+    if not settings.DEBUG and not getattr(settings, 'PAYMENT_WEBHOOK_SECRET', ''):
+        errors.append(checks.Error(
+            "PAYMENT_WEBHOOK_SECRET is empty; anyone could sign gateway webhooks.",
+            hint="Set PAYMENT_WEBHOOK_SECRET to the key shared with the payment gateway.",
+            id='payments.E001',
+        ))
+    gateway = getattr(settings, 'PAYMENT_GATEWAY', '')
+    if gateway and gateway not in settings.PAYMENT_GATEWAYS:
+        errors.append(checks.Error(
+            f"PAYMENT_GATEWAY '{gateway}' is not in PAYMENT_GATEWAYS.",
+            hint="The fake gateway needs DEBUG or PAYMENT_FAKE_GATEWAY=True.",
+            id='payments.E002',
+        ))
+    return errors
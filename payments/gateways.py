@@ -0,0 +1,102 @@
+"""
+Payment gateway adapters.
+
+A gateway turns a pending ``PaymentHistory`` into somewhere to send the user
+(``create_payment``), authenticates the gateway's callbacks
+(``parse_webhook``) and answers status queries in batches for the
+reconciliation worker (``fetch_statuses``). Statuses are always one of
+``pending``, ``completed`` or ``failed``.
+"""
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from users.models import PaymentHistory
+
+
+class GatewayError(Exception):
+    pass
+
+
+@dataclass
+class PaymentIntent:
+    transaction_id: str
+    redirect_url: str
+
+
+class BaseGateway:
+    name = None
+
+    def create_payment(self, payment):
+        raise NotImplementedError
+
+    def parse_webhook(self, request):
+        """Return ``(transaction_id, status)`` or raise GatewayError."""
+        raise NotImplementedError
+
+    def fetch_statuses(self, transaction_ids):
+        """Return ``{transaction_id: status}`` for the ids the gateway knows about."""
+        raise NotImplementedError
+
+
+def sign(body, secret):
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def webhook_secret():
+    """``PAYMENT_WEBHOOK_SECRET``; an empty one is refused outside DEBUG, since anyone could sign with it."""
+    secret = getattr(settings, 'PAYMENT_WEBHOOK_SECRET', '')
+    if not secret and not settings.DEBUG:
+        raise GatewayError('Webhook secret is not configured.')
+    return secret
+
+
+class FakeGateway(BaseGateway):
+    """In-process gateway for development and tests.
+
+    The "hosted payment page" is the ``fake-pay`` view; visiting it settles the
+    payment, so it only answers with ``PAYMENT_FAKE_GATEWAY``. The page settles
+    the ``PaymentHistory`` row directly, so the row is this gateway's record and
+    the reconciliation worker reads it from any process.
+    """
+    name = 'fake'
+
+    def create_payment(self, payment):
+        return PaymentIntent(payment.transaction_id, reverse('fake-pay', args=[payment.transaction_id]))
+
+    def webhook_body(self, transaction_id, status):
+        """The signed callback this gateway would deliver, as ``(body, signature)``."""
+        body = json.dumps({'transaction_id': transaction_id, 'status': status}).encode()
+        return body, sign(body, webhook_secret())
+
+    def parse_webhook(self, request):
+        expected = sign(request.body, webhook_secret())
+        if not hmac.compare_digest(expected, request.headers.get('X-Signature', '')):
+            raise GatewayError('Invalid signature.')
+        try:
+            payload = json.loads(request.body)
+            return payload['transaction_id'], payload['status']
+        except (ValueError, KeyError, TypeError):
+            raise GatewayError('Malformed payload.')
+
+    def fetch_statuses(self, transaction_ids):
+        return dict(
+            PaymentHistory.objects.filter(payment_method=self.name, transaction_id__in=transaction_ids)
+            .values_list('transaction_id', 'status')
+        )
+
+
+def get_gateway(name=None):
+    name = name or settings.PAYMENT_GATEWAY
+    if not name:
+        raise GatewayError('No payment gateway is configured.')
+    try:
+        path = settings.PAYMENT_GATEWAYS[name]
+    except KeyError:
+        raise GatewayError(f'Unknown payment gateway: {name}')
+    return import_string(path)()
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from payments.services import reconcile
+
+
+class Command(BaseCommand):
+    help = "Settle pending payments by asking their gateway, failing the ones pending for too long."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int, default=10, help="Only look at payments pending for at least this long.")
+        parser.add_argument('--expire-minutes', type=int, default=60, help="Fail payments still pending after this long.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help="Keep running, sleeping this long between passes.")
+
+    def handle(self, *args, **options):
+        while True:
+            counts = reconcile(
+                stale_after=timedelta(minutes=options['stale_minutes']),
+                expire_after=timedelta(minutes=options['expire_minutes']),
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(", ".join(f"{key}: {value}" for key, value in counts.items()))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
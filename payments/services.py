@@ -0,0 +1,140 @@
+"""
+Payment state transitions.
+
+Checkout creates the order, inactive enrollments and a ``pending`` payment in
+one short transaction, then asks the gateway for a redirect after commit.
+``apply_status`` is the only way a payment leaves ``pending``: webhooks and the
+reconciliation worker both go through it, it locks the payment row, and it
+does nothing for payments that are already settled, so repeated deliveries
+are harmless. Gateways are never called while a transaction is open.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from kelaasor_advance import invalidation
+from users import pricing
+from users.models import CourseEnrollment, DiscountCode, Notification, PaymentHistory
+from .gateways import GatewayError, get_gateway
+
+
+logger = logging.getLogger(__name__)
+
+SETTLED = ('completed', 'failed')
+
+
+def new_transaction_id():
+    return uuid.uuid4().hex
+
+
+def start_payment(payment):
+    """Return the gateway's PaymentIntent; call only after the checkout transaction committed."""
+    return get_gateway(payment.payment_method).create_payment(payment)
+
+
+def apply_status(gateway, transaction_id, status):
+    """Settle a pending payment made through ``gateway``.
+
+    Returns the payment, or None when that gateway has no such transaction.
+    """
+    with transaction.atomic():
+        payment = (
+            PaymentHistory.objects.select_for_update().select_related('order')
+            .filter(payment_method=gateway, transaction_id=transaction_id).first()
+        )
+        if payment is None or payment.status != 'pending' or status not in SETTLED:
+            if payment is not None and payment.status == 'failed' and status == 'completed':
+                logger.warning(
+                    'Payment %s via %s completed after it had failed (order %s cancelled); it needs a refund.',
+                    transaction_id, gateway, payment.order_id,
+                )
+            return payment
+        if status == 'completed':
+            _confirm(payment)
+        else:
+            _fail(payment)
+        # The enrollments changed with update()/delete(), which send no signals.
+        invalidation.publish('users.courseenrollment', fields={'user_id': payment.order.user_id})
+    return payment
+
+
+def _confirm(payment):
+    payment.status = 'completed'
+    payment.paid_at = timezone.now()
+    payment.save(update_fields=['status', 'paid_at', 'updated_at'])
+    CourseEnrollment.objects.filter(order_id=payment.order_id, is_active=False).update(is_active=True)
+    Notification.objects.create(
+        user_id=payment.order.user_id,
+        title='سفارش ثبت شد',
+        message=f'سفارش شماره {payment.order_id} با موفقیت ثبت شد.',
+        notification_type='order_confirmed',
+    )
+
+
+def _fail(payment):
+    payment.status = 'failed'
+    payment.save(update_fields=['status', 'updated_at'])
+    # Free the courses so they can be bought again, and give back the discount use.
+    CourseEnrollment.objects.filter(order_id=payment.order_id, is_active=False).delete()
+    if payment.order.discount_code_id:
+        DiscountCode.objects.filter(pk=payment.order.discount_code_id, used_count__gt=0).update(
+            used_count=F('used_count') - 1
+        )
+        pricing.invalidate()
+    Notification.objects.create(
+        user_id=payment.order.user_id,
+        title='پرداخت ناموفق',
+        message=f'پرداخت سفارش شماره {payment.order_id} انجام نشد.',
+        notification_type='general',
+    )
+
+
+def reconcile(stale_after=timedelta(minutes=10), expire_after=timedelta(hours=1), batch_size=100):
+    """Ask the gateways about payments stuck in ``pending`` and settle them.
+
+    Payments are read in primary-key batches; each batch costs one status
+    query per gateway. A payment the gateway still reports as pending (or does
+    not know) after ``expire_after`` is failed.
+    """
+    now = timezone.now()
+    pending = (
+        PaymentHistory.objects.filter(status='pending', created_at__lt=now - stale_after)
+        .exclude(transaction_id=None).order_by('pk')
+    )
+    counts = {'completed': 0, 'failed': 0, 'expired': 0, 'pending': 0, 'skipped': 0}
+    last_pk = 0
+    while True:
+        batch = list(
+            pending.filter(pk__gt=last_pk).values_list('pk', 'transaction_id', 'payment_method', 'created_at')[:batch_size]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        by_gateway = defaultdict(list)
+        for _, transaction_id, method, created_at in batch:
+            by_gateway[method].append((transaction_id, created_at))
+
+        for method, rows in by_gateway.items():
+            try:
+                statuses = get_gateway(method).fetch_statuses([transaction_id for transaction_id, _ in rows])
+            except GatewayError as exc:
+                logger.warning('Skipping %s pending payment(s) for %r: %s', len(rows), method, exc)
+                counts['skipped'] += len(rows)
+                continue
+            for transaction_id, created_at in rows:
+                status = statuses.get(transaction_id, 'pending')
+                if status not in SETTLED:
+                    if created_at >= now - expire_after:
+                        counts['pending'] += 1
+                        continue
+                    status = 'failed'
+                    counts['expired'] += 1
+                else:
+                    counts[status] += 1
+                apply_status(method, transaction_id, status)
+    return counts
@@ -0,0 +1,205 @@
+import datetime
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, Product
+from users import pricing
+from users.models import (
+    Cart, CartItem, CourseEnrollment, CustomUser, DiscountCode, Notification, Order, PaymentHistory, UserProfile,
+)
+from users.tokens import UserRefreshToken
+from .gateways import FakeGateway, GatewayError, get_gateway, sign
+from .services import apply_status, reconcile
+
+
+FAKE = {
+    'DEBUG': False,
+    'PAYMENT_FAKE_GATEWAY': True,
+    'PAYMENT_GATEWAYS': {'fake': 'payments.gateways.FakeGateway', 'other': 'payments.gateways.FakeGateway'},
+    'PAYMENT_GATEWAY': 'fake',
+    'PAYMENT_WEBHOOK_SECRET': 'test-secret',
+    'API_THROTTLING': False,
+}
+
+
+@override_settings(**FAKE)
+class PaymentTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000000')
+        UserProfile.objects.create(user=self.user, city='تهران', address='خیابان', birth_date=datetime.date(1990, 1, 1))
+        self.cart = Cart.objects.create(user=self.user)
+        category = Category.objects.create(name='برنامه‌نویسی')
+        self.product = Product.objects.create(
+            category=category, title='جنگو', description='-', price=Decimal('1000.00'),
+            duration='10h', course_type='offline',
+        )
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {UserRefreshToken.for_user(self.user).access_token}'}
+
+    def post_checkout(self):
+        CartItem.objects.create(cart=self.cart, product=self.product)
+        return self.client.post(reverse('checkout'), {}, content_type='application/json', **self.auth)
+
+    def checkout(self):
+        response = self.post_checkout()
+        self.assertEqual(response.status_code, 201, response.content)
+        return PaymentHistory.objects.get(transaction_id=response.json()['transaction_id'])
+
+    def webhook(self, gateway, transaction_id, status, secret='test-secret'):
+        body = json.dumps({'transaction_id': transaction_id, 'status': status}).encode()
+        signature = sign(body, secret)
+        return self.client.post(
+            reverse('payment-webhook', args=[gateway]), body, content_type='application/json', HTTP_X_SIGNATURE=signature,
+        )
+
+
+class CheckoutTests(PaymentTestCase):
+    def test_items_store_their_share_of_the_discount(self):
+        other = Product.objects.create(
+            category=self.product.category, title='فلسک', description='-', price=Decimal('500.00'),
+            duration='10h', course_type='offline',
+        )
+        CartItem.objects.create(cart=self.cart, product=other)
+        DiscountCode.objects.create(code='CART', discount_type='amount', value=Decimal('300'))
+        CartItem.objects.create(cart=self.cart, product=self.product)
+        with mock.patch.object(pricing, '_index', None):
+            response = self.client.post(reverse('checkout'), {'discount_code': 'CART'}, content_type='application/json', **self.auth)
+        order = Order.objects.get(pk=response.json()['order_id'])
+        items = {item.product_id: (item.price, item.discount) for item in order.items.all()}
+        self.assertEqual(items, {
+            self.product.pk: (Decimal('800.00'), Decimal('200.00')), other.pk: (Decimal('400.00'), Decimal('100.00')),
+        })
+        self.assertEqual(order.total, sum(price for price, _ in items.values()))
+
+    def test_enrollment_stays_inactive_until_payment_is_confirmed(self):
+        payment = self.checkout()
+        enrollment = CourseEnrollment.objects.get(user=self.user, product=self.product)
+        self.assertFalse(enrollment.is_active)
+        self.assertEqual(payment.status, 'pending')
+
+        apply_status('fake', payment.transaction_id, 'completed')
+        enrollment.refresh_from_db()
+        self.assertTrue(enrollment.is_active)
+
+    def test_failed_payment_frees_the_course(self):
+        payment = self.checkout()
+        apply_status('fake', payment.transaction_id, 'failed')
+        self.assertFalse(CourseEnrollment.objects.filter(user=self.user, product=self.product).exists())
+
+    @override_settings(PAYMENT_GATEWAY='')
+    def test_checkout_is_refused_without_a_gateway(self):
+        response = self.post_checkout()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Order.objects.exists())
+
+
+class ApplyStatusTests(PaymentTestCase):
+    def test_repeated_and_conflicting_deliveries_settle_once(self):
+        payment = self.checkout()
+        apply_status('fake', payment.transaction_id, 'completed')
+        apply_status('fake', payment.transaction_id, 'completed')
+        apply_status('fake', payment.transaction_id, 'failed')
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(Notification.objects.filter(user=self.user, notification_type='order_confirmed').count(), 1)
+        self.assertTrue(CourseEnrollment.objects.get(user=self.user, product=self.product).is_active)
+
+    def test_completion_after_failure_is_logged(self):
+        payment = self.checkout()
+        apply_status('fake', payment.transaction_id, 'failed')
+        with self.assertLogs('payments.services', 'WARNING'):
+            apply_status('fake', payment.transaction_id, 'completed')
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+
+    def test_other_gateway_cannot_settle_the_payment(self):
+        payment = self.checkout()
+        self.assertIsNone(apply_status('other', payment.transaction_id, 'completed'))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+
+class WebhookTests(PaymentTestCase):
+    def test_signed_webhook_settles_the_payment(self):
+        payment = self.checkout()
+        response = self.webhook('fake', payment.transaction_id, 'completed')
+        self.assertEqual(response.status_code, 200)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+
+    def test_bad_signature_is_rejected(self):
+        payment = self.checkout()
+        response = self.webhook('fake', payment.transaction_id, 'completed', secret='wrong')
+        self.assertEqual(response.status_code, 400)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    def test_wrong_gateway_is_not_found(self):
+        payment = self.checkout()
+        response = self.webhook('other', payment.transaction_id, 'completed')
+        self.assertEqual(response.status_code, 404)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    def test_unknown_transaction_is_not_found(self):
+        self.assertEqual(self.webhook('fake', 'no-such-transaction', 'completed').status_code, 404)
+
+    def test_unknown_gateway_is_rejected(self):
+        self.assertEqual(self.webhook('nope', 'x', 'completed').status_code, 400)
+
+    @override_settings(PAYMENT_WEBHOOK_SECRET='')
+    def test_empty_secret_is_refused_outside_debug(self):
+        payment = self.checkout()
+        response = self.webhook('fake', payment.transaction_id, 'completed', secret='')
+        self.assertEqual(response.status_code, 400)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+
+class FakeGatewayTests(PaymentTestCase):
+    def test_fake_pay_settles_fake_payments(self):
+        payment = self.checkout()
+        response = self.client.get(reverse('fake-pay', args=[payment.transaction_id]))
+        self.assertEqual(response.status_code, 200)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+
+    def test_fake_pay_ignores_other_gateways(self):
+        payment = self.checkout()
+        PaymentHistory.objects.filter(pk=payment.pk).update(payment_method='other')
+        response = self.client.get(reverse('fake-pay', args=[payment.transaction_id]))
+        self.assertEqual(response.status_code, 404)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    def test_fake_pay_is_off_unless_enabled(self):
+        payment = self.checkout()
+        with override_settings(PAYMENT_FAKE_GATEWAY=False):
+            response = self.client.get(reverse('fake-pay', args=[payment.transaction_id]))
+        self.assertEqual(response.status_code, 404)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+    @override_settings(PAYMENT_GATEWAYS={}, PAYMENT_GATEWAY='')
+    def test_no_default_gateway(self):
+        with self.assertRaises(GatewayError):
+            get_gateway()
+
+    def test_reconcile_sees_payments_settled_in_another_process(self):
+        payment = self.checkout()
+        self.client.get(reverse('fake-pay', args=[payment.transaction_id]))
+        # The worker shares no cache with the web process.
+        cache.clear()
+        self.assertEqual(FakeGateway().fetch_statuses([payment.transaction_id]), {payment.transaction_id: 'completed'})
+
+    def test_reconcile_expires_unpaid_payments(self):
+        payment = self.checkout()
+        PaymentHistory.objects.filter(pk=payment.pk).update(created_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(reconcile()['expired'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import WebhookView, PaymentStatusView, FakePayView
+
+urlpatterns = [
+    path('webhook/<str:gateway>/', WebhookView.as_view(), name='payment-webhook'),
+    # 404s unless PAYMENT_FAKE_GATEWAY is on.
+    path('fake/<str:transaction_id>/', FakePayView.as_view(), name='fake-pay'),
+    path('<str:transaction_id>/', PaymentStatusView.as_view(), name='payment-status'),
+]
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.models import PaymentHistory
+from .gateways import FakeGateway, GatewayError, get_gateway
+from .services import apply_status
+
+
+class WebhookView(APIView):
+    """Gateway callbacks; authenticated by the gateway's signature, keyed on (gateway, transaction_id)."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = []
+
+    def post(self, request, gateway):
+        try:
+            transaction_id, result = get_gateway(gateway).parse_webhook(request)
+        except GatewayError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        payment = apply_status(gateway, transaction_id, result)
+        if payment is None:
+            return Response({'detail': 'Unknown transaction.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'transaction_id': transaction_id, 'status': payment.status})
+
+
+class PaymentStatusView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, transaction_id):
+        payment = get_object_or_404(
+            PaymentHistory.objects.select_related('order'),
+            transaction_id=transaction_id, order__user=request.user,
+        )
+        return Response({
+            'transaction_id': payment.transaction_id,
+            'order_id': payment.order_id,
+            'amount': str(payment.amount),
+            'status': payment.status,
+            'paid_at': payment.paid_at,
+        })
+
+
+class FakePayView(APIView):
+    """Hosted page of the fake gateway: ``?result=failed`` declines, anything else pays.
+
+    Answers only with ``PAYMENT_FAKE_GATEWAY``; settles fake-gateway payments only.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, transaction_id):
+        if not getattr(settings, 'PAYMENT_FAKE_GATEWAY', False) or 'fake' not in settings.PAYMENT_GATEWAYS:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        result = 'failed' if request.query_params.get('result') == 'failed' else 'completed'
+        payment = apply_status(FakeGateway.name, transaction_id, result)
+        if payment is None:
+            return Response({'detail': 'Unknown transaction.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'transaction_id': transaction_id, 'status': payment.status})
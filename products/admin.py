@@ -1,4 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError
+from django.template.response import TemplateResponse
+from django.urls import path
+from .importer import ManifestError, import_manifest
 from .models import Category, Product, CourseFile, Instructor, Chapter, Video
 
 
@@ -33,8 +39,14 @@ class VideoInline(admin.TabularInline):
 
 
 
+class ManifestImportForm(forms.Form):
+    manifest = forms.FileField(label='فایل مانیفست (JSON یا CSV)')
+    dry_run = forms.BooleanField(label='فقط اعتبارسنجی', required=False)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/products/product/change_list.html'
     list_display = (
         'title', 'instructors_display', 'price', 'course_type', 
         'category', 'start_date', 'registration_deadline', 'is_registration_open'
@@ -67,6 +79,37 @@ class ProductAdmin(admin.ModelAdmin):
             inlines = [CourseFileInline]
         return [inline(self.model, self.admin_site) for inline in inlines]
 
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_manifest_view), name='products_product_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_manifest_view(self, request):
+        # Importing both adds products and changes existing ones.
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        report = None
+        form = ManifestImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            try:
+                report = import_manifest(form.cleaned_data['manifest'], dry_run=form.cleaned_data['dry_run'])
+            except ManifestError as exc:
+                for error in exc.errors:
+                    self.message_user(request, error, messages.ERROR)
+            except IntegrityError as exc:
+                self.message_user(request, f'درون‌ریزی انجام نشد: {exc}', messages.ERROR)
+            else:
+                self.message_user(request, 'مانیفست با موفقیت پردازش شد.')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'درون‌ریزی دوره‌ها',
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/products/product/import_manifest.html', context)
+
     def instructors_display(self, obj):
         return obj.get_instructors_display()
     instructors_display.short_description = 'مدرس(ها)'
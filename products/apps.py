@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import catalog, signals  # noqa: F401
+        if catalog.enabled():
+            catalog.store.refresh(force=True)
@@ -0,0 +1,384 @@
+"""
+Precompiled catalog snapshot.
+
+``build()`` compiles categories, products, instructors and course outlines
+into one versioned file::
+
+    MAGIC | header length (8 bytes) | header JSON | sections...
+
+The header lists each section's offset, length and type. ``records`` is the
+JSON list of products in the default (newest first) order. Every other
+section is a uint32 array of positions into that list (sorted by price,
+or a posting list per course type, category and instructor), plus an int64
+array of prices in cents parallel to the price order. ``SnapshotStore``
+memory-maps the file; the arrays are read in place and only the records are
+decoded.
+
+With ``CATALOG_SNAPSHOT`` on, the product list, product detail and course
+page views answer from the current snapshot without touching the database,
+and fall back to the ORM for any request the snapshot cannot answer exactly
+as the ORM would (unknown filter values, multi-field ordering, products newer
+than the snapshot). ``current()`` re-checks the file at most every
+``CATALOG_SNAPSHOT_CHECK_SECONDS`` and swaps in a rebuilt one.
+
+``rebuild()`` announces the new version on the invalidation bus. Each node
+keeps its own file at ``CATALOG_SNAPSHOT_PATH``, so a node that does not have
+that version yet builds it from the primary (``sync()``); one worker per
+node builds it while the others wait for the file.
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from kelaasor_advance import invalidation
+from .models import Category, Chapter, Instructor, Product, Video
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'KCATALOG1\n'
+ORDERING_FIELDS = ('price', 'created_at')
+COURSE_TYPES = {value for value, _ in Product.COURSE_TYPE_CHOICES}
+
+
+def enabled():
+    return getattr(settings, 'CATALOG_SNAPSHOT', False)
+
+
+def snapshot_path():
+    return str(settings.CATALOG_SNAPSHOT_PATH)
+
+
+def _cents(price):
+    return int(price * 100)
+
+
+def compile_catalog():
+    """Return ``(records, arrays)`` for the current catalog."""
+    from .serializers import ProductListProjection, ProductSerializer
+    from .views import course_page_static
+
+    products = list(
+        Product.objects.select_related('category').prefetch_related('instructors', 'files')
+        .order_by('-created_at', '-pk')
+    )
+    chapters, videos = {}, {}
+    for chapter in Chapter.objects.all():
+        chapters.setdefault(chapter.product_id, []).append(chapter)
+    for video in Video.objects.all():
+        videos.setdefault(video.product_id, []).append(video)
+    list_rows = {
+        row['id']: row for row in ProductListProjection(expand=['category']).project(Product.objects.all())
+    }
+
+    records, arrays = [], {}
+    for position, product in enumerate(products):
+        instructors = list(product.instructors.all())
+        records.append({
+            'id': product.pk,
+            'list': list_rows[product.pk],
+            'detail': ProductSerializer(product, expand=['category', 'files']).data,
+            'page': course_page_static(product, chapters.get(product.pk, []), videos.get(product.pk, [])),
+            'course_type': product.course_type,
+            'registration_deadline': product.registration_deadline,
+            'search': '\x00'.join([product.title, product.description] + [i.name for i in instructors]).lower(),
+        })
+        for key in [f'type:{product.course_type}', f'category:{product.category_id}'] + [
+            f'instructor:{i.pk}' for i in instructors
+        ]:
+            arrays.setdefault(key, array('I')).append(position)
+
+    by_price = sorted(range(len(products)), key=lambda position: (products[position].price, position))
+    arrays['order:price'] = array('I', by_price)
+    arrays['price:cents'] = array('q', [_cents(products[position].price) for position in by_price])
+    for category_id in Category.objects.values_list('pk', flat=True):
+        arrays.setdefault(f'category:{category_id}', array('I'))
+    for instructor_id in Instructor.objects.values_list('pk', flat=True):
+        arrays.setdefault(f'instructor:{instructor_id}', array('I'))
+    return records, arrays
+
+
+def build(path=None):
+    """Compile the catalog and atomically replace the snapshot file. Returns the header."""
+    path = path or snapshot_path()
+    # In a transaction the router reads from the primary, so the change that triggered
+    # the rebuild is in it, and all the queries see the same catalog.
+    with transaction.atomic():
+        records, arrays = compile_catalog()
+    blobs = [('records', 'json', json.dumps(records, cls=DjangoJSONEncoder, separators=(',', ':')).encode())]
+    blobs += [(name, values.typecode, values.tobytes()) for name, values in sorted(arrays.items())]
+
+    digest = hashlib.sha256()
+    sections, offset = {}, 0
+    for name, kind, blob in blobs:
+        digest.update(name.encode())
+        digest.update(blob)
+        # Keep every section 8-byte aligned so the arrays can be cast in place.
+        padding = -offset % 8
+        offset += padding
+        sections[name] = [offset, len(blob), kind]
+        offset += len(blob)
+    header = {
+        'version': digest.hexdigest()[:16],
+        'built_at': timezone.now().isoformat(),
+        'products': len(records),
+        'sections': sections,
+    }
+    header_bytes = json.dumps(header).encode()
+    base = len(MAGIC) + 8 + len(header_bytes)
+    base_padding = -base % 8
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(MAGIC + (len(header_bytes) + base_padding).to_bytes(8, 'little') + header_bytes + b' ' * base_padding)
+        written = 0
+        for name, _, blob in blobs:
+            start = sections[name][0]
+            fh.write(b'\0' * (start - written))
+            fh.write(blob)
+            written = start + len(blob)
+    os.replace(tmp_path, path)
+    return header
+
+
+class CatalogSnapshot:
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a catalog snapshot.')
+        header_length = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], 'little')
+        base = len(MAGIC) + 8 + header_length
+        header = json.loads(bytes(view[len(MAGIC) + 8:base]))
+        self.buffer = buffer
+        self.version = header['version']
+        self.built_at = header['built_at']
+        self.arrays = {}
+        for name, (offset, length, kind) in header['sections'].items():
+            section = view[base + offset:base + offset + length]
+            if kind == 'json':
+                self.records = json.loads(bytes(section))
+            else:
+                self.arrays[name] = section.cast(kind)
+        self.by_id = {record['id']: record for record in self.records}
+
+    # Filtering and ordering
+
+    def _positions(self, filters, price_gte, price_lte, search_terms):
+        selected = None
+        for key in filters:
+            posting = set(self.arrays[key])
+            selected = posting if selected is None else selected & posting
+        if price_gte is not None or price_lte is not None:
+            cents = self.arrays['price:cents']
+            low = 0 if price_gte is None else bisect_left(cents, math.ceil(price_gte * 100))
+            high = len(cents) if price_lte is None else bisect_right(cents, math.floor(price_lte * 100))
+            in_range = set(self.arrays['order:price'][low:high])
+            selected = in_range if selected is None else selected & in_range
+        if search_terms:
+            pool = range(len(self.records)) if selected is None else selected
+            selected = {
+                position for position in pool
+                if all(term in self.records[position]['search'] for term in search_terms)
+            }
+        return selected
+
+    def select(self, filters=(), price_gte=None, price_lte=None, search_terms=(), ordering=None):
+        """Positions matching every filter, in ``ordering`` (default: newest first)."""
+        selected = self._positions(filters, price_gte, price_lte, search_terms)
+        if ordering in ('price', '-price'):
+            order = self.arrays['order:price']
+            positions = [p for p in order if selected is None or p in selected]
+            return positions[::-1] if ordering == '-price' else positions
+        positions = range(len(self.records)) if selected is None else sorted(selected)
+        return list(positions)[::-1] if ordering == 'created_at' else list(positions)
+
+    # Requests
+
+    def parse_list_params(self, params, search_terms):
+        """Translate list query params into ``select()`` kwargs, or None to defer to the ORM."""
+        filters = []
+        single = {
+            'course_type': lambda v: f'type:{v}' if v in COURSE_TYPES else None,
+            'category': lambda v: f'category:{v}' if f'category:{v}' in self.arrays else None,
+            'instructors': lambda v: f'instructor:{v}' if f'instructor:{v}' in self.arrays else None,
+        }
+        for name, to_key in single.items():
+            if len(params.getlist(name)) > 1:
+                return None
+            value = params.get(name, '')
+            if value == '':
+                continue
+            key = to_key(value) if value.isdigit() or name == 'course_type' else None
+            if key is None:
+                return None
+            filters.append(key)
+
+        bounds = {}
+        for name in ('price__gte', 'price__lte'):
+            value = params.get(name, '')
+            if value == '':
+                bounds[name] = None
+                continue
+            try:
+                bounds[name] = Decimal(value)
+            except InvalidOperation:
+                return None
+            if not bounds[name].is_finite():
+                return None
+
+        terms = [t.strip() for t in params.get('ordering', '').split(',') if t.strip()]
+        terms = [t for t in terms if t.lstrip('-') in ORDERING_FIELDS]
+        if len(terms) > 1:
+            return None
+        return {
+            'filters': filters,
+            'price_gte': bounds['price__gte'],
+            'price_lte': bounds['price__lte'],
+            'search_terms': [term.lower() for term in search_terms],
+            'ordering': terms[0] if terms else None,
+        }
+
+    def product_list(self, positions, fields=None, expand=None):
+        from .serializers import ProductListSerializer
+        expand = ProductListSerializer.default_expand if expand is None else expand
+        rows = []
+        for position in positions:
+            row = dict(self.records[position]['list'])
+            if 'category' not in expand:
+                row['category'] = row['category']['id']
+            rows.append(row if fields is None else {k: v for k, v in row.items() if k in fields})
+        return rows
+
+    def product_detail(self, pk, request, fields=None, expand=None):
+        from .serializers import ProductSerializer
+        record = self.by_id.get(pk)
+        if record is None:
+            return None
+        expand = ProductSerializer.default_expand if expand is None else expand
+        data = dict(record['detail'])
+        if data.get('image'):
+            data['image'] = request.build_absolute_uri(data['image'])
+        if 'category' not in expand:
+            data['category'] = data['category']['id']
+        if 'files' in expand:
+            data['files'] = [
+                {**f, 'file': request.build_absolute_uri(f['file']) if f['file'] else f['file']} for f in data['files']
+            ]
+        else:
+            data['files'] = [f['id'] for f in data['files']]
+        return data if fields is None else {k: v for k, v in data.items() if k in fields}
+
+    def course_page(self, pk):
+        """``(static page dict, unsaved Product carrying what has_access needs)`` or None."""
+        record = self.by_id.get(pk)
+        if record is None:
+            return None
+        product = Product(
+            pk=pk, course_type=record['course_type'],
+            registration_deadline=parse_date(record['registration_deadline'] or ''),
+        )
+        return dict(record['page']), product
+
+
+class SnapshotStore:
+    """Holds the current snapshot and swaps it when the file on disk changes."""
+
+    def __init__(self):
+        self.snapshot = None
+        self.file_id = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self, force=False):
+        interval = getattr(settings, 'CATALOG_SNAPSHOT_CHECK_SECONDS', 2)
+        if not force and time.monotonic() - self.checked_at < interval:
+            return self.snapshot
+        with self.lock:
+            self.checked_at = time.monotonic()
+            path = snapshot_path()
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.snapshot, self.file_id = None, None
+                return None
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if file_id != self.file_id:
+                try:
+                    with open(path, 'rb') as fh:
+                        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                    snapshot = CatalogSnapshot(buffer)
+                except (OSError, ValueError) as exc:
+                    logger.warning('Could not load catalog snapshot %s: %s', path, exc)
+                    self.snapshot, self.file_id = None, None
+                    return None
+                self.snapshot, self.file_id = snapshot, file_id
+                logger.info('Loaded catalog snapshot %s (%s products)', snapshot.version, len(snapshot.records))
+        return self.snapshot
+
+
+store = SnapshotStore()
+
+
+def current():
+    if not enabled():
+        return None
+    return store.refresh()
+
+
+def rebuild(announce=True):
+    """Rebuild the snapshot and load it in this process, if snapshots are enabled."""
+    if not enabled():
+        return None
+    header = build()
+    store.refresh(force=True)
+    if announce:
+        invalidation.publish('products.catalog', fields={'version': header['version']})
+    return header
+
+
+@contextmanager
+def _node_lock(path):
+    """Hold ``<path>.lock``, shared by the workers of this node."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'a') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def sync(version=None):
+    """Load snapshot ``version``, building it here if the local file is another one.
+    Without a version (missed events) it always rebuilds, unless another worker
+    of this node replaced the file meanwhile."""
+    if not enabled():
+        return None
+    snapshot = store.refresh(force=True)
+    if version is not None and snapshot is not None and snapshot.version == version:
+        return
+    seen = store.file_id
+    with _node_lock(snapshot_path()):
+        snapshot = store.refresh(force=True)
+        if snapshot is not None and (snapshot.version == version if version else store.file_id != seen):
+            return
+        rebuild(announce=False)
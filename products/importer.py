@@ -0,0 +1,379 @@
+"""
+Bulk import of products with their instructors, chapters, videos and files.
+
+A manifest is either JSON::
+
+    {"products": [{
+        "title": "...", "category": "...", "description": "...", "price": "1200000",
+        "duration": "40h", "course_type": "offline",
+        "instructors": [{"name": "...", "email": "..."}],
+        "chapters": [{"title": "...", "order": 1,
+                      "videos": [{"title": "...", "order": 1, "video_url": "..."}],
+                      "files": [{"title": "...", "file": "course_files/a.pdf"}]}],
+        "videos": [...], "files": [...]
+    }]}
+
+or CSV with a ``record`` column (product, instructor, chapter, video, file).
+Child rows name their parent in the ``product`` (product title) and ``chapter``
+(chapter title) columns and must come after the product row. When two products
+share a title, their child rows also need the ``category`` column.
+
+Rows are keyed by natural keys (category + title for products, title within
+a product for chapters, videos and files, email or name for instructors), so
+importing the same manifest again updates rows in place; a video or file
+listed under another chapter is moved there. Updates only touch the fields
+the manifest gives, so values entered in the admin are kept.
+"""
+import csv
+import io
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import catalog
+from .models import Category, Product, Instructor, Chapter, Video, CourseFile
+
+
+BATCH_SIZE = 500
+
+PRODUCT_FIELDS = [
+    'description', 'price', 'instructor', 'duration', 'course_type', 'start_date',
+    'end_date', 'image', 'registration_deadline', 'access_expiration',
+]
+INSTRUCTOR_FIELDS = ['bio', 'image']
+CHAPTER_FIELDS = ['description', 'order']
+VIDEO_FIELDS = ['description', 'video_file', 'video_url', 'duration', 'order', 'is_preview']
+FILE_FIELDS = ['file', 'file_type', 'description']
+
+CSV_BOOLEANS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+
+class ManifestError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+
+def parse_manifest(fh, fmt=None):
+    name = getattr(fh, 'name', '') or ''
+    fmt = fmt or ('csv' if name.endswith('.csv') else 'json')
+    content = fh.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if fmt == 'csv':
+        return _products_from_csv(content)
+    try:
+        data = json.loads(content)
+    except ValueError as exc:
+        raise ManifestError([f"Invalid JSON: {exc}"])
+    products = data.get('products', []) if isinstance(data, dict) else data
+    if not isinstance(products, list):
+        raise ManifestError(["Manifest must contain a list of products."])
+    errors = [
+        f"product #{index}: expected an object, got {type(p).__name__}"
+        for index, p in enumerate(products, start=1) if not isinstance(p, dict)
+    ]
+    if errors:
+        raise ManifestError(errors)
+    return [_flatten_product(p, index) for index, p in enumerate(products, start=1)]
+
+
+def _objects(items, label):
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ManifestError([f"{label}: expected a list of objects"])
+    return items
+
+
+def _flatten_product(product, index=1):
+    product = dict(product)
+    label = f"product #{index} ({product.get('title') or '?'})"
+    for name in ('chapters', 'videos', 'files'):
+        _objects(product.get(name, []), f"{label} {name}")
+    for chapter in product.get('chapters', []):
+        for name in ('videos', 'files'):
+            _objects(chapter.get(name, []), f"{label} chapter {chapter.get('title') or '?'} {name}")
+    videos = list(product.get('videos', []))
+    files = list(product.get('files', []))
+    for chapter in product.get('chapters', []):
+        for video in chapter.get('videos', []):
+            videos.append(dict(video, chapter=chapter.get('title')))
+        for course_file in chapter.get('files', []):
+            files.append(dict(course_file, chapter=chapter.get('title')))
+    product['chapters'] = [
+        {k: v for k, v in chapter.items() if k not in ('videos', 'files')}
+        for chapter in product.get('chapters', [])
+    ]
+    product['instructors'] = [
+        {'name': i} if isinstance(i, str) else i for i in product.get('instructors', [])
+    ]
+    _objects(product['instructors'], f"{label} instructors")
+    product['videos'] = videos
+    product['files'] = files
+    return product
+
+
+def _products_from_csv(content):
+    products = {}
+    by_title = {}
+    errors = []
+    for line, row in enumerate(csv.DictReader(io.StringIO(content)), start=2):
+        row = {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+        if 'is_preview' in row:
+            row['is_preview'] = CSV_BOOLEANS.get(row['is_preview'].lower(), row['is_preview'])
+        record = row.pop('record', '')
+        if record == 'product':
+            key = (row.get('category'), row.get('title'))
+            if key in products:
+                errors.append(f"line {line}: duplicate product '{key[1]}' in category '{key[0]}'")
+                continue
+            products[key] = dict(row, instructors=[], chapters=[], videos=[], files=[])
+            by_title.setdefault(key[1], []).append(key)
+            continue
+        title, category = row.pop('product', None), row.pop('category', None)
+        keys = [(category, title)] if category else by_title.get(title, [])
+        product = products.get(keys[0]) if len(keys) == 1 else None
+        if len(keys) > 1:
+            errors.append(f"line {line}: product '{title}' exists in several categories; fill in the category column")
+        elif product is None:
+            errors.append(f"line {line}: {record or 'row'} refers to an unknown product")
+        elif record == 'instructor':
+            product['instructors'].append(row)
+        elif record == 'chapter':
+            product['chapters'].append(row)
+        elif record == 'video':
+            product['videos'].append(row)
+        elif record == 'file':
+            product['files'].append(row)
+        else:
+            errors.append(f"line {line}: unknown record type '{record}'")
+    if errors:
+        raise ManifestError(errors)
+    return list(products.values())
+
+
+def _instructor_key(data):
+    return ('email', data['email']) if data.get('email') else ('name', data.get('name'))
+
+
+def _given(data, fields):
+    """The fields a manifest row actually sets; only these are written on update."""
+    return [f for f in fields if f in data]
+
+
+class CourseImporter:
+    def __init__(self, products):
+        self.products = products
+        self.timings = {}
+        self.counts = {}
+        self.validated = None
+
+    def _timed(self, stage, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        self.timings[stage] = round(time.perf_counter() - started, 4)
+        return result
+
+    def run(self, dry_run=False):
+        self._timed('validate', self.validate)
+        if not dry_run:
+            with transaction.atomic():
+                self.write()
+        return self.report()
+
+    def report(self):
+        return {'timings': self.timings, 'counts': self.counts}
+
+    def _clean(self, model, data, fields, exclude, label, errors):
+        obj = model(**{f: data[f] for f in fields if f in data})
+        try:
+            obj.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            for field, messages in exc.message_dict.items():
+                errors.append(f"{label}: {field}: {' '.join(messages)}")
+        return obj
+
+    def validate(self):
+        errors = []
+        products = {}
+        instructors = {}
+        for index, data in enumerate(self.products, start=1):
+            label = f"product #{index} ({data.get('title') or '?'})"
+            if not data.get('category'):
+                errors.append(f"{label}: category is required")
+            key = (data.get('category'), data.get('title'))
+            if key in products:
+                errors.append(f"{label}: duplicate product in manifest")
+            product = self._clean(
+                Product, data, ['title'] + PRODUCT_FIELDS, ['category'], label, errors
+            )
+            offline = product.course_type == 'offline'
+            if not offline and (data['chapters'] or data['videos']):
+                errors.append(f"{label}: chapters and videos are only allowed for offline courses")
+
+            instructor_keys = []
+            for item in data['instructors']:
+                instructor = self._clean(
+                    Instructor, item, ['name', 'email'] + INSTRUCTOR_FIELDS, [],
+                    f"{label} instructor {item.get('name') or '?'}", errors
+                )
+                instructors.setdefault(_instructor_key(item), (instructor, _given(item, ['name'] + INSTRUCTOR_FIELDS)))
+                instructor_keys.append(_instructor_key(item))
+
+            chapters = {}
+            for item in data['chapters']:
+                chapter_label = f"{label} chapter {item.get('title') or '?'}"
+                if item.get('title') in chapters:
+                    errors.append(f"{chapter_label}: duplicate chapter title")
+                chapters[item.get('title')] = (self._clean(
+                    Chapter, item, ['title'] + CHAPTER_FIELDS, ['product'], chapter_label, errors
+                ), _given(item, CHAPTER_FIELDS))
+
+            children = {}
+            for model, items, fields in (
+                (Video, data['videos'], VIDEO_FIELDS),
+                (CourseFile, data['files'], FILE_FIELDS),
+            ):
+                rows = []
+                seen = set()
+                for item in items:
+                    child_label = f"{label} {model._meta.model_name} {item.get('title') or '?'}"
+                    chapter = item.get('chapter')
+                    if item.get('title') in seen:
+                        errors.append(f"{child_label}: duplicate title")
+                    seen.add(item.get('title'))
+                    if chapter and chapter not in chapters:
+                        errors.append(f"{child_label}: unknown chapter '{chapter}'")
+                    obj = self._clean(
+                        model, item, ['title'] + fields, ['product', 'chapter'], child_label, errors
+                    )
+                    # The chapter always comes from where the row is listed.
+                    rows.append((chapter, obj, _given(item, fields) + ['chapter']))
+                children[model] = rows
+
+            products[key] = {
+                'product': product,
+                'fields': _given(data, PRODUCT_FIELDS),
+                'instructors': instructor_keys,
+                'chapters': chapters,
+                'videos': children[Video],
+                'files': children[CourseFile],
+            }
+        if errors:
+            raise ManifestError(errors)
+        self.validated = {'products': products, 'instructors': instructors}
+
+    def _upsert(self, model, items, existing):
+        """``items`` is ``[(key, obj, fields given)]``; existing rows only get the given fields."""
+        created, updated = [], []
+        written = set()
+        result = {}
+        for key, obj, fields in items:
+            current = existing.get(key)
+            if current is None:
+                created.append(obj)
+                result[key] = obj
+            else:
+                for field in fields:
+                    setattr(current, field, getattr(obj, field))
+                written.update(fields)
+                updated.append(current)
+                result[key] = current
+        model.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        if updated and written:
+            # Rows that did not give a field write back the value they already have.
+            model.objects.bulk_update(updated, sorted(written), batch_size=BATCH_SIZE)
+        self.counts[model._meta.model_name] = {'created': len(created), 'updated': len(updated)}
+        return result
+
+    def write(self):
+        products = self.validated['products']
+        categories = self._timed('categories', self._write_categories, products)
+        instructors = self._timed('instructors', self._write_instructors)
+        saved = self._timed('products', self._write_products, products, categories, instructors)
+        chapters = self._timed('chapters', self._write_chapters, products, saved)
+        self._timed('videos', self._write_children, Video, 'videos', products, saved, chapters)
+        self._timed('files', self._write_children, CourseFile, 'files', products, saved, chapters)
+
+    def _write_categories(self, products):
+        names = {category for category, _ in products}
+        existing = {c.name: c for c in Category.objects.filter(name__in=names)}
+        return self._upsert(Category, [(n, Category(name=n), []) for n in names], existing)
+
+    def _write_instructors(self):
+        instructors = self.validated['instructors']
+        emails = [value for kind, value in instructors if kind == 'email']
+        names = [value for kind, value in instructors if kind == 'name']
+        existing = {}
+        for obj in Instructor.objects.filter(name__in=names, email__isnull=True):
+            existing.setdefault(('name', obj.name), obj)
+        for obj in Instructor.objects.filter(email__in=emails):
+            existing[('email', obj.email)] = obj
+        return self._upsert(
+            Instructor, [(key, obj, fields) for key, (obj, fields) in instructors.items()], existing,
+        )
+
+    def _write_products(self, products, categories, instructors):
+        items = []
+        for (category, title), entry in products.items():
+            entry['product'].category = categories[category]
+            items.append(((entry['product'].category_id, title), entry['product'], entry['fields']))
+        existing = {
+            (p.category_id, p.title): p
+            for p in Product.objects.filter(
+                category_id__in={c.pk for c in categories.values()},
+                title__in={title for _, title in products},
+            )
+        }
+        saved = self._upsert(Product, items, existing)
+        saved = {key: saved[(categories[key[0]].pk, key[1])] for key in products}
+
+        through = Product.instructors.through
+        with_instructors = [key for key, entry in products.items() if entry['instructors']]
+        through.objects.filter(product_id__in=[saved[key].pk for key in with_instructors]).delete()
+        through.objects.bulk_create([
+            through(product_id=saved[key].pk, instructor_id=instructors[instructor_key].pk)
+            for key in with_instructors
+            for instructor_key in dict.fromkeys(products[key]['instructors'])
+        ], batch_size=BATCH_SIZE)
+        return saved
+
+    def _write_chapters(self, products, saved):
+        items = []
+        for key, entry in products.items():
+            product = saved[key]
+            for title, (chapter, fields) in entry['chapters'].items():
+                chapter.product = product
+                items.append(((product.pk, title), chapter, fields))
+        existing = {}
+        for chapter in Chapter.objects.filter(product_id__in=[p.pk for p in saved.values()]):
+            existing.setdefault((chapter.product_id, chapter.title), chapter)
+        return self._upsert(Chapter, items, existing)
+
+    def _write_children(self, model, name, products, saved, chapters):
+        items = []
+        for key, entry in products.items():
+            product = saved[key]
+            for chapter_title, obj, fields in entry[name]:
+                obj.product = product
+                obj.chapter = chapters[(product.pk, chapter_title)] if chapter_title else None
+                items.append(((product.pk, obj.title), obj, fields))
+        existing = {}
+        for obj in model.objects.filter(product_id__in=[p.pk for p in saved.values()]):
+            existing.setdefault((obj.product_id, obj.title), obj)
+        return self._upsert(model, items, existing)
+
+
+def import_manifest(fh, fmt=None, dry_run=False):
+    started = time.perf_counter()
+    products = parse_manifest(fh, fmt)
+    parse_time = round(time.perf_counter() - started, 4)
+    importer = CourseImporter(products)
+    importer.timings['parse'] = parse_time
+    report = importer.run(dry_run=dry_run)
+    if not dry_run:
+        # bulk_create/bulk_update send no signals, so rebuild and announce the snapshot here.
+        catalog.rebuild()
+    report['timings']['total'] = round(time.perf_counter() - started, 4)
+    return report
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products.catalog import build, snapshot_path
+
+
+class Command(BaseCommand):
+    help = "Compile the catalog into the snapshot file served by the product endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', help="Write here instead of CATALOG_SNAPSHOT_PATH.")
+
+    def handle(self, *args, output, **options):
+        path = output or snapshot_path()
+        header = build(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Catalog snapshot {header['version']} with {header['products']} products written to {path}."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import ManifestError, import_manifest
+
+
+class Command(BaseCommand):
+    help = "Import products with instructors, chapters, videos and files from a JSON/CSV manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest')
+        parser.add_argument('--format', dest='fmt', choices=['json', 'csv'])
+        parser.add_argument('--dry-run', action='store_true', help="Validate the manifest without writing.")
+
+    def handle(self, *args, manifest, fmt, dry_run, **options):
+        try:
+            with open(manifest, 'rb') as fh:
+                report = import_manifest(fh, fmt=fmt or ('csv' if manifest.endswith('.csv') else 'json'), dry_run=dry_run)
+        except OSError as exc:
+            raise CommandError(exc)
+        except ManifestError as exc:
+            raise CommandError(f"Manifest is invalid:\n{exc}")
+
+        for model, counts in report['counts'].items():
+            self.stdout.write(f"{model}: {counts['created']} created, {counts['updated']} updated")
+        for stage, seconds in report['timings'].items():
+            self.stdout.write(f"{stage:>12}: {seconds * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS("Manifest is valid." if dry_run else "Import finished."))
@@ -39,10 +39,10 @@ class Product(models.Model):
     instructor = models.CharField(max_length=100, blank=True, null=True)
     duration = models.CharField(max_length=50)
     course_type = models.CharField(max_length=10, choices=COURSE_TYPE_CHOICES)
-    start_date = models.DateField(null=True, blank=True)
+    start_date = models.DateField(null=True, blank=True, db_index=True)
     end_date = models.DateField(null=True, blank=True)
     image = models.ImageField(upload_to='products/images/', null=True, blank=True)
-    registration_deadline = models.DateField(null=True, blank=True)
+    registration_deadline = models.DateField(null=True, blank=True, db_index=True)
     access_expiration = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -1,6 +1,26 @@
 from rest_framework import serializers
+from kelaasor_advance.projections import Column, Nested, Projection, decimal_string
 from .models import Category, Product, CourseFile
 
+class DynamicFieldsMixin:
+    """
+    Accepts ``fields`` (names to keep) and ``expand`` (relations to nest) keyword
+    arguments. Relations listed in ``expandable_fields`` render in their declared,
+    collapsed form unless expanded; ``default_expand`` applies when ``expand`` is None.
+    """
+    expandable_fields = {}
+    default_expand = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.default_expand if expand is None else expand
+        for name, factory in self.expandable_fields.items():
+            if name in expand and name in self.fields:
+                self.fields[name] = factory()
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -11,9 +31,15 @@ class CourseFileSerializer(serializers.ModelSerializer):
         model = CourseFile
         fields = ['id', 'title', 'file']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
-    files = CourseFileSerializer(many=True, read_only=True)
+    files = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    expandable_fields = {
+        'category': lambda: CategorySerializer(read_only=True),
+        'files': lambda: CourseFileSerializer(many=True, read_only=True),
+    }
+    default_expand = ('files',)
 
     class Meta:
         model = Product
@@ -23,9 +49,31 @@ class ProductSerializer(serializers.ModelSerializer):
             'access_expiration', 'category', 'files', 'created_at'
         ]
 
-class ProductListSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
+class ProductListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    category = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    expandable_fields = {
+        'category': lambda: CategorySerializer(read_only=True),
+    }
+    default_expand = ('category',)
 
     class Meta:
         model = Product
-        fields = ['id', 'title', 'price', 'instructor', 'duration', 'course_type', 'category']
\ No newline at end of file
+        fields = ['id', 'title', 'price', 'instructor', 'duration', 'course_type', 'category']
+
+
+class ProductListProjection(Projection):
+    """``values()`` twin of ProductListSerializer used by the list endpoint."""
+    fields = {
+        'id': Column('id'),
+        'title': Column('title'),
+        'price': Column('price', decimal_string),
+        'instructor': Column('instructor'),
+        'duration': Column('duration'),
+        'course_type': Column('course_type'),
+        'category': Column('category_id'),
+    }
+    expandable_fields = {
+        'category': Nested(id='category__id', name='category__name', description='category__description'),
+    }
+    default_expand = ProductListSerializer.default_expand
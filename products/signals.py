@@ -0,0 +1,25 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from kelaasor_advance import invalidation
+from . import catalog
+from .models import Category, Chapter, CourseFile, Instructor, Product, Video
+
+
+@invalidation.receiver('products.catalog')
+def sync_catalog(change):
+    catalog.sync(change.fields.get('version'))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Instructor)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Chapter)
+@receiver([post_save, post_delete], sender=Video)
+@receiver([post_save, post_delete], sender=CourseFile)
+@receiver(m2m_changed, sender=Product.instructors.through)
+def schedule_catalog_rebuild(sender, **kwargs):
+    if not catalog.enabled():
+        return
+    # One rebuild per transaction, however many catalog rows it touched.
+    invalidation.on_commit_once(catalog.rebuild)
@@ -1,3 +1,147 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Permission
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from kelaasor_advance import invalidation
+from users.models import CustomUser
+from . import catalog
+from .importer import ManifestError, import_manifest
+from .models import Category, Instructor, Product, Video
+
+
+class CatalogSyncTests(TestCase):
+    """Each node keeps its own snapshot file; the bus tells it which version to have."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            CATALOG_SNAPSHOT=True, CATALOG_SNAPSHOT_PATH=os.path.join(self.folder, 'catalog.snapshot'),
+        )
+        self.settings_override.enable()
+        self.store_patch = mock.patch.object(catalog, 'store', catalog.SnapshotStore())
+        self.store_patch.start()
+        self.category = Category.objects.create(name='برنامه‌نویسی')
+        self.product('جنگو')
+        catalog.build()
+        catalog.store.refresh(force=True)
+
+    def tearDown(self):
+        self.store_patch.stop()
+        self.settings_override.disable()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def product(self, title):
+        # bulk_create sends no signals, like an edit made on another node.
+        return Product.objects.bulk_create([Product(
+            category=self.category, title=title, description='-', price=Decimal('0'), duration='1h',
+            course_type='offline',
+        )])[0]
+
+    def announce(self, **fields):
+        invalidation._dispatch('products.catalog', None, None, fields)
+
+    def test_node_without_the_version_rebuilds(self):
+        self.product('فلسک')
+        version = catalog.build(os.path.join(self.folder, 'other-node.snapshot'))['version']
+        self.announce(version=version)
+        snapshot = catalog.current()
+        self.assertEqual(snapshot.version, version)
+        self.assertEqual(len(snapshot.records), 2)
+
+    def test_node_with_the_version_only_reloads(self):
+        version = catalog.current().version
+        with mock.patch.object(catalog, 'build') as build:
+            self.announce(version=version)
+        build.assert_not_called()
+
+    def test_missed_events_rebuild(self):
+        self.product('فلسک')
+        self.announce()
+        self.assertEqual(len(catalog.current().records), 2)
+
+    def test_worker_waiting_for_the_lock_keeps_the_file_built_meanwhile(self):
+        self.product('فلسک')
+        node_lock = catalog._node_lock
+
+        def other_worker_builds_first(path):
+            catalog.build()
+            return node_lock(path)
+
+        with mock.patch.object(catalog, '_node_lock', other_worker_builds_first):
+            with mock.patch.object(catalog, 'rebuild') as rebuild:
+                self.announce()
+        rebuild.assert_not_called()
+        self.assertEqual(len(catalog.current().records), 2)
+
+    def test_rebuild_announces_its_version(self):
+        with mock.patch.object(invalidation, 'publish') as publish:
+            header = catalog.rebuild()
+        publish.assert_called_once_with('products.catalog', fields={'version': header['version']})
+
+
+class ImporterTests(TestCase):
+    def manifest(self, products, fmt='json'):
+        if fmt == 'json':
+            return import_manifest(io.StringIO(json.dumps({'products': products})), fmt='json')
+        return import_manifest(io.StringIO(products), fmt='csv')
+
+    def course(self, **fields):
+        return {
+            'title': 'جنگو', 'category': 'برنامه‌نویسی', 'description': '-', 'price': '1000', 'duration': '10h',
+            'course_type': 'offline', **fields,
+        }
+
+    def test_reimport_keeps_fields_the_manifest_leaves_out(self):
+        self.manifest([self.course(instructors=[{'name': 'علی', 'email': 'ali@example.com'}])])
+        Product.objects.update(image='products/cover.png', start_date='2026-01-01')
+        Instructor.objects.update(bio='از ادمین')
+        self.manifest([self.course(price='2000', instructors=[{'name': 'علی', 'email': 'ali@example.com'}])])
+        product = Product.objects.get()
+        self.assertEqual((product.price, product.image.name, str(product.start_date)), (
+            Decimal('2000'), 'products/cover.png', '2026-01-01',
+        ))
+        self.assertEqual(Instructor.objects.get().bio, 'از ادمین')
+
+    def test_video_moved_to_another_chapter_is_updated(self):
+        chapters = [{'title': 'فصل ۱'}, {'title': 'فصل ۲'}]
+        self.manifest([self.course(chapters=[dict(chapters[0], videos=[{'title': 'نصب'}]), chapters[1]])])
+        self.manifest([self.course(chapters=[chapters[0], dict(chapters[1], videos=[{'title': 'نصب'}])])])
+        video = Video.objects.get()
+        self.assertEqual(video.chapter.title, 'فصل ۲')
+
+    def test_csv_products_are_keyed_by_category_and_title(self):
+        self.manifest(
+            'record,title,category,description,price,duration,course_type,product\n'
+            'product,جنگو,وب,-,1000,10h,offline,\n'
+            'product,جنگو,پایتون,-,2000,10h,offline,\n'
+            'chapter,فصل ۱,پایتون,,,,,جنگو\n',
+            fmt='csv',
+        )
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Product.objects.get(category__name='پایتون').chapters.get().title, 'فصل ۱')
+        self.assertFalse(Product.objects.get(category__name='وب').chapters.exists())
+
+    def test_csv_child_of_an_ambiguous_title_is_rejected(self):
+        with self.assertRaises(ManifestError):
+            self.manifest(
+                'record,title,category,description,price,duration,course_type,product\n'
+                'product,جنگو,وب,-,1000,10h,offline,\n'
+                'product,جنگو,پایتون,-,2000,10h,offline,\n'
+                'chapter,فصل ۱,,,,,,جنگو\n',
+                fmt='csv',
+            )
+        self.assertFalse(Product.objects.exists())
+
+    def test_admin_import_needs_change_permission(self):
+        staff = CustomUser.objects.create_user('09120000300', is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='add_product'))
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('admin:products_product_import')).status_code, 403)
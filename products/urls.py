@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     CategoryListCreateView, CategoryDetailView,
-    ProductListView, ProductCreateView, ProductDetailView
+    ProductListView, ProductCreateView, ProductDetailView,
+    CoursePageView, AsyncCoursePageView, RelatedProductsView
 )
 
 urlpatterns = [
@@ -10,4 +11,7 @@ urlpatterns = [
     path('products/', ProductListView.as_view(), name='product-list'),
     path('products/create/', ProductCreateView.as_view(), name='product-create'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
+    path('products/<int:pk>/related/', RelatedProductsView.as_view(), name='product-related'),
+    path('products/<int:pk>/page/', CoursePageView.as_view(), name='course-page'),
+    path('products/<int:pk>/page/async/', AsyncCoursePageView.as_view(), name='course-page-async'),
 ]
\ No newline at end of file
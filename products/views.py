@@ -1,7 +1,19 @@
+import asyncio
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
 from rest_framework import generics, permissions, filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Category, Product
-from .serializers import CategorySerializer, ProductSerializer, ProductListSerializer
+from kelaasor_advance.throttling import CatalogThrottle, athrottle
+from users.authentication import aauthenticate
+from users.models import CourseEnrollment
+from . import catalog
+from .models import Category, Product, Chapter, Video, CourseFile
+from .serializers import CategorySerializer, ProductSerializer, ProductListSerializer, ProductListProjection
 
 
 class CategoryListCreateView(generics.ListCreateAPIView):
@@ -23,14 +35,92 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
 
 
-class ProductListView(generics.ListAPIView):
+class SparseFieldsetMixin:
+    """
+    ``?fields=a,b`` limits the serialized fields and the columns loaded with
+    ``only()``; ``?expand=category,files`` nests those relations and is the only
+    thing that triggers their join or prefetch. Applies to GET requests.
+    """
+
+    def _param_list(self, name):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def get_sparse_params(self):
+        if self.request.method != 'GET':
+            return None, None
+        if not hasattr(self, '_sparse_params'):
+            serializer_class = self.get_serializer_class()
+            fields = self._param_list('fields')
+            expand = self._param_list('expand')
+            errors = {}
+            if fields is not None:
+                unknown = set(fields) - set(serializer_class.Meta.fields)
+                if unknown:
+                    errors['fields'] = f"Unknown fields: {', '.join(sorted(unknown))}"
+            if expand is not None:
+                unknown = set(expand) - set(serializer_class.expandable_fields)
+                if unknown:
+                    errors['expand'] = f"Cannot expand: {', '.join(sorted(unknown))}"
+            if errors:
+                raise ValidationError(errors)
+            self._sparse_params = fields, expand
+        return self._sparse_params
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_params()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        fields, expand = self.get_sparse_params()
+        serializer_class = self.get_serializer_class()
+        fields = serializer_class.Meta.fields if fields is None else fields
+        expand = serializer_class.default_expand if expand is None else expand
+
+        model_fields = {f.name for f in queryset.model._meta.concrete_fields}
+        columns = ['id'] + [f for f in fields if f in model_fields]
+        queryset = queryset.select_related(None)
+        if 'category' in fields and 'category' in expand:
+            queryset = queryset.select_related('category')
+            columns += ['category__id', 'category__name', 'category__description']
+        if 'files' in fields:
+            if 'files' in expand:
+                queryset = queryset.prefetch_related('files')
+            else:
+                queryset = queryset.prefetch_related(
+                    Prefetch('files', queryset=CourseFile.objects.only('id', 'product_id'))
+                )
+        return queryset.only(*columns)
+
+
+class ProductListView(SparseFieldsetMixin, generics.ListAPIView):
     queryset = Product.objects.all().select_related('category')
     serializer_class = ProductListSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['course_type', 'category', 'instructors']
+    filterset_fields = {
+        'course_type': ['exact'], 'category': ['exact'], 'instructors': ['exact'], 'price': ['gte', 'lte'],
+    }
     search_fields = ['title', 'description', 'instructors__name']
     ordering_fields = ['price', 'created_at']
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [CatalogThrottle]
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = self.get_sparse_params()
+        snapshot = catalog.current()
+        if snapshot is not None:
+            params = snapshot.parse_list_params(request.query_params, filters.SearchFilter().get_search_terms(request))
+            if params is not None:
+                return Response(snapshot.product_list(snapshot.select(**params), fields, expand))
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(ProductListProjection(fields=fields, expand=expand).project(queryset))
 
     
 class ProductCreateView(generics.CreateAPIView):
@@ -39,11 +129,123 @@ class ProductCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAdminUser]
 
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ProductDetailView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = catalog.current()
+        if snapshot is not None:
+            fields, expand = self.get_sparse_params()
+            data = snapshot.product_detail(kwargs['pk'], request, fields, expand)
+            if data is not None:
+                return Response(data)
+        return super().retrieve(request, *args, **kwargs)
     
     def get_permissions(self):
         if self.request.method in ['PUT', 'PATCH', 'DELETE']:
             return [permissions.IsAdminUser()]
         return [permissions.AllowAny()]
+
+
+def course_page_static(product, chapters, videos):
+    """The part of the course page that only depends on the catalog."""
+    outline = {chapter.id: {'id': chapter.id, 'title': chapter.title, 'order': chapter.order, 'videos': []}
+               for chapter in chapters}
+    loose_videos = []
+    for video in videos:
+        entry = {
+            'id': video.id, 'title': video.title, 'duration': video.duration,
+            'order': video.order, 'is_preview': video.is_preview,
+        }
+        if video.chapter_id in outline:
+            outline[video.chapter_id]['videos'].append(entry)
+        else:
+            loose_videos.append(entry)
+    data = ProductListSerializer(product).data
+    data.update({
+        'description': product.description,
+        'start_date': product.start_date,
+        'end_date': product.end_date,
+        'chapters': list(outline.values()),
+        'videos': loose_videos,
+    })
+    return data
+
+
+def course_page_data(product, chapters, videos, enrollment, static=None):
+    if enrollment is not None:
+        enrollment.product = product
+    data = course_page_static(product, chapters, videos) if static is None else static
+    data.update({
+        'registration_open': product.is_registration_open(),
+        'enrollment': {
+            'enrolled': enrollment is not None,
+            'has_access': enrollment.has_access() if enrollment is not None else False,
+        },
+    })
+    return data
+
+
+class RelatedProductsView(APIView):
+    """Students also bought: precomputed neighbours (analytics/related.py), best first."""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        queryset = Product.objects.filter(recommended_for__product_id=pk).order_by('recommended_for__rank')
+        return Response(ProductListProjection().project(queryset))
+
+
+class CoursePageView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        enrollment = None
+        if request.user.is_authenticated:
+            enrollment = CourseEnrollment.objects.filter(user=request.user, product_id=pk).first()
+        snapshot = catalog.current()
+        page = snapshot.course_page(pk) if snapshot is not None else None
+        if page is not None:
+            static, product = page
+            return Response(course_page_data(product, None, None, enrollment, static=static))
+        product = get_object_or_404(Product.objects.select_related('category'), pk=pk)
+        chapters = list(Chapter.objects.filter(product_id=pk))
+        videos = list(Video.objects.filter(product_id=pk))
+        return Response(course_page_data(product, chapters, videos, enrollment))
+
+
+class AsyncCoursePageView(View):
+    """Async course page: product, outline and enrollment are fetched concurrently."""
+
+    async def get(self, request, pk):
+        user = await aauthenticate(request)
+        if throttled := await athrottle(request, user):
+            return throttled
+        snapshot = catalog.current()
+        page = snapshot.course_page(pk) if snapshot is not None else None
+        if page is not None:
+            static, product = page
+            enrollment = None
+            if user is not None:
+                enrollment = await CourseEnrollment.objects.filter(user_id=user.pk, product_id=pk).afirst()
+            return JsonResponse(course_page_data(product, None, None, enrollment, static=static))
+
+        async def enrollment():
+            if user is None:
+                return None
+            return await CourseEnrollment.objects.filter(user_id=user.pk, product_id=pk).afirst()
+
+        product, chapters, videos, enrollment = await asyncio.gather(
+            Product.objects.select_related('category').filter(pk=pk).afirst(),
+            _alist(Chapter.objects.filter(product_id=pk)),
+            _alist(Video.objects.filter(product_id=pk)),
+            enrollment(),
+        )
+        if product is None:
+            return JsonResponse({'detail': 'No Product matches the given query.'}, status=404)
+        return JsonResponse(course_page_data(product, chapters, videos, enrollment))
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import VideoProgress
+
+
+@admin.register(VideoProgress)
+class VideoProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'video', 'product', 'position', 'max_position', 'completed', 'updated_at')
+    list_filter = ('completed',)
+    list_select_related = ('user', 'video', 'product')
+    raw_id_fields = ('user', 'video', 'product')
+    readonly_fields = ('updated_at',)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from progress.services import buffered, flush
+
+
+class Command(BaseCommand):
+    help = "Write buffered video progress heartbeats of finished flush windows to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help="Keep running, sleeping this long between passes.")
+
+    def handle(self, *args, **options):
+        if not buffered():
+            # This process would see its own empty cache, not the web workers'.
+            raise CommandError(
+                "The default cache is per process, so heartbeats are written directly and there is nothing "
+                "to flush. Use a shared cache (Redis or Memcached) to buffer them."
+            )
+        while True:
+            counts = flush(batch_size=options['batch_size'])
+            if counts is None:
+                self.stdout.write("Another flush is running; skipped.")
+            else:
+                self.stdout.write(f"windows: {counts['windows']}, rows: {counts['rows']}")
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
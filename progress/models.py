@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import models
+from products.models import Product, Video
+
+
+class VideoProgress(models.Model):
+    """Durable copy of a student's position in a video; the live value is in the cache (progress/services.py)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='video_progress')
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='progress')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='video_progress')
+    position = models.PositiveIntegerField(default=0)
+    max_position = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'video']
+        indexes = [models.Index(fields=['user', 'product'])]
+        verbose_name = 'پیشرفت ویدیو'
+        verbose_name_plural = 'پیشرفت ویدیوها'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.video_id}: {self.position}s"
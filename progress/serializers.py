@@ -0,0 +1,7 @@
+from rest_framework import serializers
+
+
+class HeartbeatSerializer(serializers.Serializer):
+    video = serializers.IntegerField(min_value=1)
+    position = serializers.IntegerField(min_value=0, help_text='ثانیه')
+    ended = serializers.BooleanField(default=False)
@@ -0,0 +1,293 @@
+"""
+Video watch progress with write-coalesced heartbeats.
+
+The player posts a heartbeat every few seconds. A heartbeat only touches the
+cache: the live state of a (user, video) pair lives under ``progress:<user>:<video>``,
+and the first heartbeat for a pair in each flush window (``PROGRESS_FLUSH_SECONDS``)
+appends the pair to that window's dirty list. ``flush()`` (the
+``flush_video_progress`` command) upserts every pair of each finished window
+with one ``INSERT ... ON CONFLICT`` per batch, so the database sees at most one
+write per active viewer per window, however often the player reports.
+
+Resume positions are read from the cache; the ``VideoProgress`` row is only
+read when the cached state has been evicted. Heartbeats re-check course
+access every ``PROGRESS_ACCESS_RECHECK_SECONDS``, not on every call.
+
+The cache must be shared between workers (Redis or Memcached) and sized to
+keep the states of active viewers; an evicted state loses at most the
+heartbeats of the current window. With a per-process cache (LocMemCache, the
+default) the flusher, running in its own process, would see none of it, so
+every heartbeat is written straight to the database instead and
+``flush_video_progress`` refuses to run.
+
+The player is not trusted with what was watched: ``max_position`` grows no
+faster than ``PROGRESS_MAX_PLAYBACK_RATE`` times the time since the last
+heartbeat (seeking ahead moves only ``position``), and ``ended`` counts only
+once ``max_position`` has reached the end of the video.
+"""
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404
+
+from kelaasor_advance.checks import per_process_cache
+from products import catalog
+from products.models import Chapter, Video
+from users.models import CourseEnrollment
+from .models import VideoProgress
+
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'progress:{}:{}'
+VIDEO_KEY = 'progress-video:{}'
+MARK_KEY = 'progress-mark:{}:{}:{}'
+SEQ_KEY = 'progress-seq:{}'
+DIRTY_KEY = 'progress-dirty:{}:{}'
+WATERMARK_KEY = 'progress-flushed'
+FLUSH_LOCK_KEY = 'progress-flush-lock'
+# Windows kept in the cache for a flusher that fell behind.
+KEEP_WINDOWS = 10
+# Heartbeats still being written when a window closes get this long to land.
+FLUSH_GRACE_SECONDS = 5
+# Allowance on top of the playback rate for heartbeat jitter and the first heartbeat of a video.
+HEARTBEAT_SLACK_SECONDS = 15
+# ``ended`` is accepted this close to the end.
+ENDED_TOLERANCE_SECONDS = 5
+
+
+def _interval():
+    return getattr(settings, 'PROGRESS_FLUSH_SECONDS', 60)
+
+
+def buffered():
+    """Whether heartbeats are buffered in the cache; only a cache shared with the flusher can do that."""
+    return not per_process_cache(DEFAULT_CACHE_ALIAS)
+
+
+def _incr(key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+def video_meta(video_id):
+    meta = cache.get(VIDEO_KEY.format(video_id))
+    if meta is None:
+        meta = Video.objects.filter(pk=video_id).values('product_id', 'duration', 'is_preview').first()
+        if meta is None:
+            raise Http404('No Video matches the given query.')
+        cache.set(VIDEO_KEY.format(video_id), meta, 300)
+    return meta
+
+
+def can_watch(user, meta):
+    if meta['is_preview']:
+        return True
+    enrollment = (
+        CourseEnrollment.objects.select_related('product')
+        .filter(user=user, product_id=meta['product_id']).first()
+    )
+    return enrollment is not None and enrollment.has_access()
+
+
+def _state_from_row(user_id, video_id):
+    row = (
+        VideoProgress.objects.filter(user_id=user_id, video_id=video_id)
+        .values('product_id', 'position', 'max_position', 'completed', 'updated_at', 'video__duration').first()
+    )
+    if row is None:
+        return None
+    return {
+        'product': row['product_id'],
+        'duration': row['video__duration'],
+        'position': row['position'],
+        'max_position': row['max_position'],
+        'completed': row['completed'],
+        'updated_at': row['updated_at'].timestamp(),
+        'checked_at': 0,
+    }
+
+
+def get_state(user_id, video_id):
+    """The resume state of a pair, or None if the user never watched the video."""
+    key = STATE_KEY.format(user_id, video_id)
+    state = cache.get(key)
+    if state is None:
+        state = _state_from_row(user_id, video_id)
+        if state is not None:
+            cache.add(key, state, getattr(settings, 'PROGRESS_STATE_TTL', 7 * 86400))
+    return state
+
+
+def record(user, video_id, position, ended=False):
+    """Apply a heartbeat and return the new state; raises Http404 / PermissionDenied."""
+    key = STATE_KEY.format(user.pk, video_id)
+    now = time.time()
+    state = cache.get(key)
+    if state is None or now - state['checked_at'] > getattr(settings, 'PROGRESS_ACCESS_RECHECK_SECONDS', 600):
+        meta = video_meta(video_id)
+        if not can_watch(user, meta):
+            raise PermissionDenied('شما به این ویدیو دسترسی ندارید.')
+        if state is None:
+            state = _state_from_row(user.pk, video_id) or {
+                'position': 0, 'max_position': 0, 'completed': False,
+            }
+        state.update(product=meta['product_id'], duration=meta['duration'], checked_at=now)
+
+    duration = state['duration']
+    if duration:
+        position = min(position, duration)
+    state['position'] = position
+    last = state.get('updated_at')
+    elapsed = max(now - last, 0) if last is not None else 0
+    reach = state['max_position'] + elapsed * getattr(settings, 'PROGRESS_MAX_PLAYBACK_RATE', 2.0) + HEARTBEAT_SLACK_SECONDS
+    state['max_position'] = max(state['max_position'], min(position, int(reach)))
+    state['completed'] = state['completed'] or bool(duration and (
+        state['max_position'] >= duration * getattr(settings, 'PROGRESS_COMPLETE_RATIO', 0.9)
+        or (ended and state['max_position'] >= duration - ENDED_TOLERANCE_SECONDS)
+    ))
+    state['updated_at'] = now
+    cache.set(key, state, getattr(settings, 'PROGRESS_STATE_TTL', 7 * 86400))
+    if not buffered():
+        _upsert([(user.pk, video_id)], 1)
+        return state
+
+    interval = _interval()
+    window = int(now // interval)
+    if cache.add(MARK_KEY.format(window, user.pk, video_id), 1, interval * 2):
+        seq = _incr(SEQ_KEY.format(window), interval * KEEP_WINDOWS)
+        cache.set(DIRTY_KEY.format(window, seq), (user.pk, video_id), interval * KEEP_WINDOWS)
+    return state
+
+
+def _upsert(pairs, batch_size):
+    written = 0
+    pairs = sorted(pairs)
+    for start in range(0, len(pairs), batch_size):
+        chunk = pairs[start:start + batch_size]
+        states = cache.get_many([STATE_KEY.format(user_id, video_id) for user_id, video_id in chunk])
+        existing = set(Video.objects.filter(pk__in={video_id for _, video_id in chunk}).values_list('pk', flat=True))
+        rows = []
+        for user_id, video_id in chunk:
+            state = states.get(STATE_KEY.format(user_id, video_id))
+            if state is None or video_id not in existing:
+                continue
+            rows.append(VideoProgress(
+                user_id=user_id, video_id=video_id, product_id=state['product'],
+                position=state['position'], max_position=state['max_position'], completed=state['completed'],
+                updated_at=datetime.fromtimestamp(state['updated_at'], tz=dt_timezone.utc),
+            ))
+        with transaction.atomic():
+            VideoProgress.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['user', 'video'],
+                update_fields=['position', 'max_position', 'completed', 'updated_at'],
+            )
+        written += len(rows)
+    return written
+
+
+def flush(batch_size=500):
+    """Write the pairs of every finished window to the database.
+
+    Returns ``{'windows': ..., 'rows': ...}``, or None when another flusher holds the lock.
+    """
+    interval = _interval()
+    if not cache.add(FLUSH_LOCK_KEY, 1, max(interval, 60)):
+        return None
+    try:
+        now = time.time()
+        current = int(now // interval)
+        last = cache.get(WATERMARK_KEY)
+        if last is None or last < current - KEEP_WINDOWS:
+            last = current - KEEP_WINDOWS
+        counts = {'windows': 0, 'rows': 0}
+        window = last + 1
+        while (window + 1) * interval + FLUSH_GRACE_SECONDS <= now:
+            total = cache.get(SEQ_KEY.format(window)) or 0
+            dirty_keys = [DIRTY_KEY.format(window, seq) for seq in range(1, total + 1)]
+            pairs = set()
+            for start in range(0, len(dirty_keys), 1000):
+                pairs.update(tuple(pair) for pair in cache.get_many(dirty_keys[start:start + 1000]).values())
+            counts['rows'] += _upsert(pairs, batch_size)
+            cache.delete_many(dirty_keys + [SEQ_KEY.format(window)])
+            cache.set(WATERMARK_KEY, window, None)
+            counts['windows'] += 1
+            window += 1
+        return counts
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _outline(product_id):
+    """``[(chapter_id, title, [(video_id, duration), ...]), ...]``; loose videos under chapter None."""
+    snapshot = catalog.current()
+    page = snapshot.course_page(product_id) if snapshot is not None else None
+    if page is not None:
+        data = page[0]
+        outline = [
+            (chapter['id'], chapter['title'], [(v['id'], v['duration']) for v in chapter['videos']])
+            for chapter in data['chapters']
+        ]
+        loose = [(v['id'], v['duration']) for v in data['videos']]
+    else:
+        chapters = {chapter.id: (chapter.id, chapter.title, []) for chapter in Chapter.objects.filter(product_id=product_id)}
+        outline, loose = list(chapters.values()), []
+        for video in Video.objects.filter(product_id=product_id):
+            target = chapters[video.chapter_id][2] if video.chapter_id in chapters else loose
+            target.append((video.id, video.duration))
+    if loose:
+        outline.append((None, None, loose))
+    return outline
+
+
+def _summary(videos, progress):
+    total_videos = len(videos)
+    completed = sum(1 for video_id, _ in videos if progress.get(video_id, {}).get('completed'))
+    total_seconds = sum(duration or 0 for _, duration in videos)
+    watched_seconds = sum(
+        min(progress.get(video_id, {}).get('max_position', 0), duration or 0) for video_id, duration in videos
+    )
+    # Time-weighted when every video has a duration, otherwise by completed videos.
+    if total_videos and all(duration for _, duration in videos):
+        percent = 100 * watched_seconds / total_seconds
+    else:
+        percent = 100 * completed / total_videos if total_videos else 0
+    return {
+        'completed_videos': completed,
+        'total_videos': total_videos,
+        'watched_seconds': watched_seconds,
+        'total_seconds': total_seconds,
+        'percent': round(percent, 1),
+    }
+
+
+def course_completion(user_id, product_id):
+    outline = _outline(product_id)
+    video_ids = [video_id for _, _, videos in outline for video_id, _ in videos]
+    progress = {
+        row['video_id']: row for row in VideoProgress.objects.filter(user_id=user_id, product_id=product_id)
+        .values('video_id', 'max_position', 'completed')
+    }
+    # Unflushed heartbeats are newer than the rows.
+    cached = cache.get_many([STATE_KEY.format(user_id, video_id) for video_id in video_ids])
+    for video_id in video_ids:
+        state = cached.get(STATE_KEY.format(user_id, video_id))
+        if state is not None:
+            progress[video_id] = state
+
+    data = {'product': product_id}
+    data.update(_summary([video for _, _, videos in outline for video in videos], progress))
+    data['chapters'] = [
+        {'id': chapter_id, 'title': title, **_summary(videos, progress)}
+        for chapter_id, title, videos in outline
+    ]
+    return data
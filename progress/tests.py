@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from products.models import Category, Product, Video
+from users.models import CourseEnrollment, CustomUser
+from . import services
+from .models import VideoProgress
+
+
+@override_settings(API_THROTTLING=False, PROGRESS_COMPLETE_RATIO=0.9, PROGRESS_MAX_PLAYBACK_RATE=2.0)
+class ProgressTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('09120000001')
+        category = Category.objects.create(name='ویدیو')
+        product = Product.objects.create(
+            category=category, title='دوره', description='-', price=Decimal('0'), duration='1h', course_type='offline',
+        )
+        self.video = Video.objects.create(product=product, title='جلسه ۱', duration=600)
+        CourseEnrollment.objects.create(user=self.user, product=product, is_active=True)
+        self.now = 1_000_000.0
+
+    def beat(self, position, ended=False, after=0):
+        self.now += after
+        with mock.patch.object(services.time, 'time', return_value=self.now):
+            return services.record(self.user, self.video.pk, position, ended=ended)
+
+
+class CompletionTests(ProgressTestCase):
+    def test_ended_is_ignored_far_from_the_end(self):
+        state = self.beat(10, ended=True)
+        self.assertFalse(state['completed'])
+
+    def test_skipping_ahead_does_not_count_as_watched(self):
+        self.beat(0)
+        state = self.beat(590, after=10)
+        self.assertEqual(state['position'], 590)
+        self.assertLess(state['max_position'], 60)
+        self.assertFalse(state['completed'])
+
+    def test_watching_to_the_end_completes(self):
+        position = 0
+        for _ in range(60):
+            position += 10
+            state = self.beat(position, after=10)
+        self.assertTrue(state['completed'])
+
+    def test_ended_near_the_end_completes(self):
+        with override_settings(PROGRESS_COMPLETE_RATIO=1.0):
+            position = 0
+            while position < 597:
+                position = min(position + 10, 597)
+                state = self.beat(position, after=10)
+            self.assertFalse(state['completed'])
+            self.assertTrue(self.beat(597, ended=True, after=1)['completed'])
+
+
+class WriteThroughTests(ProgressTestCase):
+    """The default LocMemCache is not shared with the flusher, so heartbeats go straight to the database."""
+
+    def test_heartbeat_is_written_directly(self):
+        self.beat(0)
+        self.beat(20, after=10)
+        row = VideoProgress.objects.get(user=self.user, video=self.video)
+        self.assertEqual((row.position, row.max_position), (20, 20))
+
+    def test_flush_command_refuses_to_run(self):
+        with self.assertRaises(CommandError):
+            call_command('flush_video_progress')
+
+
+class BufferedTests(ProgressTestCase):
+    """A file-based cache stands in for a shared one (Redis/Memcached)."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir,
+        }}, PROGRESS_FLUSH_SECONDS=60)
+        self.settings_override.enable()
+        super().setUp()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_heartbeats_are_flushed_once_the_window_closes(self):
+        self.beat(0)
+        self.beat(20, after=10)
+        self.assertFalse(VideoProgress.objects.exists())
+        with mock.patch.object(services.time, 'time', return_value=self.now + 120):
+            counts = services.flush()
+        self.assertEqual(counts['rows'], 1)
+        row = VideoProgress.objects.get(user=self.user, video=self.video)
+        self.assertEqual((row.position, row.max_position), (20, 20))
@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import HeartbeatView, VideoProgressView, CourseProgressView
+
+urlpatterns = [
+    path('heartbeat/', HeartbeatView.as_view(), name='progress-heartbeat'),
+    path('videos/<int:video_id>/', VideoProgressView.as_view(), name='video-progress'),
+    path('courses/<int:product_id>/', CourseProgressView.as_view(), name='course-progress'),
+]
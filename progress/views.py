@@ -0,0 +1,47 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.models import CourseEnrollment
+from .serializers import HeartbeatSerializer
+from .services import course_completion, get_state, record
+
+
+def state_data(video_id, state):
+    if state is None:
+        return {'video': video_id, 'position': 0, 'max_position': 0, 'completed': False}
+    return {
+        'video': video_id,
+        'position': state['position'],
+        'max_position': state['max_position'],
+        'completed': state['completed'],
+    }
+
+
+class HeartbeatView(APIView):
+    """Player heartbeat; buffered in the cache and written to the database in batches (see progress/services.py)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = HeartbeatSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        state = record(request.user, data['video'], data['position'], ended=data['ended'])
+        return Response(state_data(data['video'], state))
+
+
+class VideoProgressView(APIView):
+    """Resume position of a video, served from the cache."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, video_id):
+        return Response(state_data(video_id, get_state(request.user.pk, video_id)))
+
+
+class CourseProgressView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, product_id):
+        get_object_or_404(CourseEnrollment, user=request.user, product_id=product_id)
+        return Response(course_completion(request.user.pk, product_id))
@@ -1,11 +1,39 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.http import StreamingHttpResponse
+from .exports import FORMATS, export_filename, stream_export
 from .models import (
     CustomUser, UserProfile, OTP, Cart, CartItem, Order, OrderItem,
     DiscountCode, Notification, PaymentHistory, CourseEnrollment
 )
 
 
+class StreamingExportMixin:
+    export_name = None
+    actions = ['export_as_csv', 'export_as_jsonl', 'export_as_csv_gzip']
+
+    def _export_response(self, queryset, fmt, compress=False):
+        response = StreamingHttpResponse(
+            stream_export(self.export_name, fmt, compress=compress, queryset=queryset),
+            content_type='application/gzip' if compress else FORMATS[fmt],
+        )
+        filename = export_filename(self.export_name, fmt, compress)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def export_as_csv(self, request, queryset):
+        return self._export_response(queryset, 'csv')
+    export_as_csv.short_description = 'خروجی CSV'
+
+    def export_as_jsonl(self, request, queryset):
+        return self._export_response(queryset, 'jsonl')
+    export_as_jsonl.short_description = 'خروجی JSONL'
+
+    def export_as_csv_gzip(self, request, queryset):
+        return self._export_response(queryset, 'csv', compress=True)
+    export_as_csv_gzip.short_description = 'خروجی CSV فشرده (gzip)'
+
+
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -65,7 +93,9 @@ class CartItemAdmin(admin.ModelAdmin):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(StreamingExportMixin, admin.ModelAdmin):
+    export_name = 'orders'
+    date_hierarchy = 'created_at'
     list_display = ('id', 'user', 'total', 'created_at', 'items_count', 'discount_code')
     list_filter = ('created_at',)
     search_fields = ('user__phone', 'user__email')
@@ -78,7 +108,7 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('order', 'product', 'price')
+    list_display = ('order', 'product', 'price', 'discount')
     list_filter = ('product__course_type',)
     search_fields = ('order__user__phone', 'product__title')
 
@@ -100,7 +130,9 @@ class NotificationAdmin(admin.ModelAdmin):
 
 
 @admin.register(PaymentHistory)
-class PaymentHistoryAdmin(admin.ModelAdmin):
+class PaymentHistoryAdmin(StreamingExportMixin, admin.ModelAdmin):
+    export_name = 'payments'
+    date_hierarchy = 'created_at'
     list_display = ('order', 'amount', 'status', 'payment_method', 'paid_at', 'created_at')
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('order__user__phone', 'transaction_id')
@@ -108,8 +140,10 @@ class PaymentHistoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(CourseEnrollment)
-class CourseEnrollmentAdmin(admin.ModelAdmin):
-    list_display = ('user', 'product', 'enrolled_at', 'is_active')
+class CourseEnrollmentAdmin(StreamingExportMixin, admin.ModelAdmin):
+    export_name = 'enrollments'
+    date_hierarchy = 'enrolled_at'
+    list_display = ('user', 'product', 'enrolled_at', 'is_active', 'expired_at')
     list_filter = ('is_active', 'product__course_type', 'enrolled_at')
     search_fields = ('user__phone', 'product__title')
     readonly_fields = ('enrolled_at',)
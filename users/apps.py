@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from kelaasor_advance import checks, invalidation  # noqa: F401
+        from . import authentication, signals  # noqa: F401
+        invalidation.watch()
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from kelaasor_advance import invalidation
+from .models import CustomUser
+from .tokens import USER_CLAIMS
+
+
+CACHED_USER_FIELDS = [api_settings.USER_ID_FIELD, 'is_active'] + USER_CLAIMS
+_generation = 0
+
+
+def cached_user_key(user_id):
+    return f'auth:user:{_generation}:{user_id}'
+
+
+@invalidation.receiver('users.customuser')
+def drop_cached_user(change):
+    global _generation
+    if change.pk is None:
+        _generation += 1
+    else:
+        cache.delete(cached_user_key(change.pk))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that builds the user from a cached copy of its row on read-only requests.
+
+    The copy holds the token claims and ``is_active``. It is read from the
+    primary at most every ``AUTH_USER_CACHE_SECONDS`` and dropped whenever the
+    user is saved or deleted (``kelaasor_advance.invalidation``), so inactive
+    and deleted users are refused and ``/me/`` shows current values. The user
+    is a ``CustomUser`` instance whose other fields are deferred, so it works
+    in queryset filters and only touches the database if another field is
+    read: ``is_staff`` and ``is_superuser`` are not cached, so admin-only views
+    check the stored values. Unsafe methods load the user from the database
+    as usual.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if request.method in SAFE_METHODS:
+            user = self.get_claims_user(validated_token)
+            if user is not None:
+                return user, validated_token
+        return self.get_user(validated_token), validated_token
+
+    def _user_id(self, validated_token):
+        # simplejwt writes the user id claim as a string; give the user its real pk type.
+        id_field = CustomUser._meta.get_field(api_settings.USER_ID_FIELD)
+        try:
+            return id_field.to_python(validated_token.get(api_settings.USER_ID_CLAIM))
+        except ValidationError:
+            return None
+
+    def _row(self, user_id):
+        return CustomUser.objects.using(DEFAULT_DB_ALIAS).filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values(*CACHED_USER_FIELDS)
+
+    def _build(self, row):
+        if not row:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not row['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        fields = [f.attname for f in CustomUser._meta.concrete_fields if f.attname in row]
+        return CustomUser.from_db(DEFAULT_DB_ALIAS, fields, [row[f] for f in fields])
+
+    def get_claims_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        if user_id is None:
+            return None
+        key = cached_user_key(user_id)
+        row = cache.get(key)
+        if row is None:
+            # A missing user is cached as {}, so it is refused without a query too.
+            row = self._row(user_id).first() or {}
+            cache.set(key, row, settings.AUTH_USER_CACHE_SECONDS)
+        return self._build(row)
+
+    async def aget_claims_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        if user_id is None:
+            return None
+        key = cached_user_key(user_id)
+        row = await cache.aget(key)
+        if row is None:
+            row = await self._row(user_id).afirst() or {}
+            await cache.aset(key, row, settings.AUTH_USER_CACHE_SECONDS)
+        return self._build(row)
+
+
+async def aauthenticate(request, query_param=None):
+    """Resolve the user for a plain Django async view: bearer token first, then the session.
+
+    ``query_param`` also accepts the access token from the query string, for
+    clients such as EventSource that cannot set headers. Returns ``None`` for
+    anonymous requests, invalid tokens and inactive or deleted users.
+    """
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    try:
+        raw_token = auth.get_raw_token(header) if header is not None else None
+        if raw_token is None and query_param and request.GET.get(query_param):
+            raw_token = request.GET[query_param].encode()
+        if raw_token is not None:
+            return await auth.aget_claims_user(auth.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+    user = await request.auser()
+    return user if user.is_authenticated else None
@@ -0,0 +1,75 @@
+"""
+Per-request view of the signed-in user's profile and cart.
+
+``user_context(request)`` loads the user with the profile and cart joined in,
+and the cart items with their products in one prefetch, on first use. The
+views and serializers handling one request then share that result instead of
+each running its own ``get_or_create``. A missing profile or cart, for users
+created before ``VerifyOTPSerializer`` made them eagerly, is created then.
+"""
+from functools import cached_property
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Cart, CartItem, CustomUser, UserProfile
+
+
+def _items():
+    return CartItem.objects.select_related('product').order_by('pk')
+
+
+class UserContext:
+    def __init__(self, user):
+        self.user_id = user.pk
+
+    @cached_property
+    def user(self):
+        return CustomUser.objects.select_related('profile', 'cart').prefetch_related(
+            Prefetch('cart__items', queryset=_items())
+        ).get(pk=self.user_id)
+
+    @cached_property
+    def profile(self):
+        try:
+            return self.user.profile
+        except UserProfile.DoesNotExist:
+            profile, _ = UserProfile.objects.get_or_create(user_id=self.user_id)
+            return profile
+
+    @cached_property
+    def profile_complete(self):
+        return self.profile.is_complete()
+
+    @cached_property
+    def cart(self):
+        try:
+            return self.user.cart
+        except Cart.DoesNotExist:
+            cart, _ = Cart.objects.get_or_create(user_id=self.user_id)
+            prefetch_related_objects([cart], Prefetch('items', queryset=_items()))
+            return cart
+
+    @property
+    def cart_items(self):
+        """The cart's items with their products, oldest first."""
+        cart = self.cart
+        if 'items' not in getattr(cart, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([cart], Prefetch('items', queryset=_items()))
+        return list(cart.items.all())
+
+    @property
+    def product_ids(self):
+        return {item.product_id for item in self.cart_items}
+
+    def forget_cart(self):
+        """Call after changing the cart's items; the next read loads them again."""
+        getattr(self.__dict__.get('cart'), '_prefetched_objects_cache', {}).pop('items', None)
+
+
+def user_context(request):
+    """The ``UserContext`` of ``request.user``, shared by everything handling this request."""
+    request = getattr(request, '_request', request)
+    context = getattr(request, 'user_context', None)
+    if context is None or context.user_id != request.user.pk:
+        context = request.user_context = UserContext(request.user)
+    return context
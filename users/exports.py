@@ -0,0 +1,133 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Order, PaymentHistory, CourseEnrollment
+
+
+DEFAULT_CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+# name -> (model, indexed date field used for range filters, exported columns)
+EXPORT_SPECS = {
+    'orders': (Order, 'created_at', [
+        'id', 'user_id', 'user__phone', 'total', 'discount_code__code', 'created_at',
+    ]),
+    'payments': (PaymentHistory, 'created_at', [
+        'id', 'order_id', 'order__user__phone', 'amount', 'status', 'payment_method',
+        'transaction_id', 'paid_at', 'created_at',
+    ]),
+    'enrollments': (CourseEnrollment, 'enrolled_at', [
+        'id', 'user_id', 'user__phone', 'product_id', 'product__title', 'order_id',
+        'enrolled_at', 'access_expires_at', 'is_active',
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the csv writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def parse_bound(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(name, queryset=None, since=None, until=None):
+    model, date_field, fields = EXPORT_SPECS[name]
+    if queryset is None:
+        queryset = model.objects.all()
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{date_field}__lt': until})
+    return queryset.order_by(date_field).values_list(*fields)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_lines(name, fmt='csv', queryset=None, since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    fields = EXPORT_SPECS[name][2]
+    rows = export_queryset(name, queryset, since, until).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([_csv_value(v) for v in row])
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), default=_json_default, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def _buffered(lines, size=BUFFER_SIZE):
+    buffer = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, fmt='csv', compress=False, **kwargs):
+    chunks = _buffered(iter_lines(name, fmt, **kwargs))
+    if compress:
+        return _gzipped(chunks)
+    return chunks
+
+
+def export_filename(name, fmt, compress=False):
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+    return filename + '.gz' if compress else filename
@@ -0,0 +1,118 @@
+"""
+Sections of the home feed endpoint.
+
+Each builder runs at most two queries. ``courses``, ``orders`` and the
+global ``products`` section are cached; the per-user ones are dropped by the
+signal handlers in ``users.signals`` whenever an order or enrollment changes.
+A change that names no user (a missed invalidation event) bumps the feed
+generation in every key instead, which drops all cached sections at once.
+"""
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from products.models import Product
+from products.serializers import ProductListProjection
+from .models import CartItem, CourseEnrollment, Notification, Order
+from .serializers import NotificationProjection, OrderProjection, UserSerializer
+
+
+SECTIONS = ['user', 'cart', 'courses', 'orders', 'notifications', 'products']
+CACHED_SECTIONS = {'courses': 300, 'orders': 300, 'products': 60}
+RECENT_ORDERS = 10
+RECENT_NOTIFICATIONS = 10
+LATEST_PRODUCTS = 10
+GENERATION_KEY = 'home:generation'
+
+
+def feed_generation():
+    # Time-based, so a generation evicted from the cache never comes back.
+    return cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+
+
+def section_cache_key(section, user_id=None, generation=None):
+    generation = feed_generation() if generation is None else generation
+    if section == 'products':
+        return f'home:{generation}:products'
+    return f'home:{generation}:{section}:{user_id}'
+
+
+def invalidate_user_sections(user_id, sections=('courses', 'orders')):
+    generation = feed_generation()
+    cache.delete_many([section_cache_key(section, user_id, generation) for section in sections])
+
+
+def invalidate_all_sections():
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def build_user(user):
+    return UserSerializer(user).data
+
+
+def build_cart(user):
+    items = list(CartItem.objects.filter(cart__user=user).select_related('product'))
+    return {
+        'items': [
+            {'id': item.id, 'product': {
+                'id': item.product.id, 'title': item.product.title, 'price': str(item.product.price),
+            }}
+            for item in items
+        ],
+        'total': str(sum((item.product.price for item in items), Decimal('0.00'))),
+    }
+
+
+def build_courses(user):
+    enrollments = CourseEnrollment.objects.filter(user=user, is_active=True).select_related('product')
+    return [{
+        'product_id': e.product.id,
+        'title': e.product.title,
+        'course_type': e.product.course_type,
+        'has_access': e.has_access(),
+        'enrolled_at': e.enrolled_at,
+    } for e in enrollments]
+
+
+def build_orders(user):
+    return OrderProjection().project(Order.objects.filter(user=user).order_by('-created_at')[:RECENT_ORDERS])
+
+
+def build_notifications(user):
+    notifications = Notification.objects.filter(user=user).newest_first()[:RECENT_NOTIFICATIONS]
+    return {
+        'unread_count': Notification.objects.filter(user=user, is_read=False).count(),
+        'items': NotificationProjection().project(notifications),
+    }
+
+
+def build_products(user):
+    products = Product.objects.order_by('-created_at')[:LATEST_PRODUCTS]
+    return ProductListProjection().project(products)
+
+
+BUILDERS = {
+    'user': build_user,
+    'cart': build_cart,
+    'courses': build_courses,
+    'orders': build_orders,
+    'notifications': build_notifications,
+    'products': build_products,
+}
+
+
+def build_feed(user, sections):
+    data, generation = {}, feed_generation()
+    for section in sections:
+        timeout = CACHED_SECTIONS.get(section)
+        if timeout is None:
+            data[section] = BUILDERS[section](user)
+            continue
+        key = section_cache_key(section, user.pk, generation)
+        value = cache.get(key)
+        if value is None:
+            value = BUILDERS[section](user)
+            cache.set(key, value, timeout)
+        data[section] = value
+    return data
@@ -0,0 +1,161 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+_running = Counter()
+_running_lock = threading.Lock()
+_heartbeat = None
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str) if request.data else ''
+    return hashlib.sha256(f"{request.method}:{request.path}:{body}".encode()).hexdigest()[:32]
+
+
+def _claim(user_id, digest, fingerprint):
+    """Insert the in-flight row for this key. Returns ``(row, True)`` when this request owns it,
+    or the existing row and False."""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user_id=user_id, key=digest, fingerprint=fingerprint, created_at=now,
+                ), True
+        except IntegrityError:
+            pass
+        row = IdempotencyKey.objects.filter(user_id=user_id, key=digest).first()
+        if row is None:
+            continue
+        expired = row.created_at < now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_TTL', 86400))
+        # A running request keeps refreshing created_at (_beat()); once that stops
+        # (its worker died) the key stops being blocked.
+        abandoned = row.status_code is None and row.created_at < now - timedelta(
+            seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 30)
+        )
+        if not (expired or abandoned):
+            return row, False
+        taken = IdempotencyKey.objects.filter(pk=row.pk, created_at=row.created_at).update(
+            fingerprint=fingerprint, status_code=None, response=None, created_at=now,
+        )
+        if taken:
+            row.fingerprint, row.status_code, row.response, row.created_at = fingerprint, None, None, now
+            return row, True
+    return IdempotencyKey.objects.get(user_id=user_id, key=digest), False
+
+
+def _beat():
+    """Refresh ``created_at`` of the keys whose requests are running in this process."""
+    with _running_lock:
+        running = list(_running)
+    if running:
+        IdempotencyKey.objects.filter(pk__in=running, status_code=None).update(created_at=timezone.now())
+
+
+def _run_heartbeat():
+    # One thread per process beats for every running request, three times per lock
+    # period, and ends once none is left.
+    global _heartbeat
+    interval = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 30) / 3
+    try:
+        while True:
+            time.sleep(interval)
+            with _running_lock:
+                if not _running:
+                    _heartbeat = None
+                    return
+            try:
+                _beat()
+            except Exception:
+                logger.exception('Idempotency heartbeat failed')
+    finally:
+        connections.close_all()
+
+
+def _hold(pk):
+    global _heartbeat
+    with _running_lock:
+        _running[pk] += 1
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_run_heartbeat, name='idempotency-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+def _release(pk):
+    with _running_lock:
+        _running[pk] -= 1
+        if _running[pk] <= 0:
+            del _running[pk]
+
+
+def idempotent(handler):
+    """Replay the stored response for a repeated ``Idempotency-Key`` on an authenticated POST.
+
+    Keys are rows of ``IdempotencyKey``, unique per user, so every worker sees
+    them. Results are kept for ``IDEMPOTENCY_TTL`` seconds; 5xx responses are
+    not stored, so those can be retried. A duplicate arriving while the first
+    request is still running gets 409 instead of running the handler twice,
+    and reusing a key with a different body gets 422. A running request
+    refreshes its row every third of ``IDEMPOTENCY_LOCK_SECONDS``; only a key
+    left that long without a refresh is taken over.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'{HEADER} طولانی‌تر از حد مجاز است.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        fingerprint = _fingerprint(request)
+        row, owner = _claim(request.user.pk, digest, fingerprint)
+
+        if owner:
+            response = None
+            _hold(row.pk)
+            try:
+                response = handler(self, request, *args, **kwargs)
+            finally:
+                _release(row.pk)
+                if response is not None and response.status_code < 500:
+                    IdempotencyKey.objects.filter(pk=row.pk).update(
+                        status_code=response.status_code, response=response.data,
+                    )
+                else:
+                    IdempotencyKey.objects.filter(pk=row.pk, status_code=None).delete()
+            return response
+
+        if row.fingerprint != fingerprint:
+            return Response(
+                {'detail': f'{HEADER} قبلاً برای درخواست دیگری استفاده شده است.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if row.status_code is None:
+            return Response(
+                {'detail': 'درخواستی با همین کلید در حال پردازش است.'},
+                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+            )
+        return Response(row.response, status=row.status_code, headers={'Idempotent-Replayed': 'true'})
+
+    return wrapper
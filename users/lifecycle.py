@@ -0,0 +1,121 @@
+"""
+Time-driven enrollment changes, run every minute by ``run_course_lifecycle``.
+
+* Enrollments whose access has ended are switched to ``is_active=False`` with
+  chunked set-based UPDATEs, so ``is_active`` can be trusted by reads: offline
+  courses when ``access_expires_at`` has passed, online courses once the
+  product's ``registration_deadline`` is over (the same rules as
+  ``CourseEnrollment.has_access``). ``expired_at`` records why.
+* Enrollments switched off that way whose window was extended since (a later
+  ``access_expires_at`` or ``registration_deadline``) are switched back on.
+  Enrollments inactive for other reasons (unpaid orders, an admin) are left alone.
+* Active enrollments of courses starting within ``COURSE_REMINDER_LEAD_HOURS``
+  get one ``course_started`` notification each; ``start_reminded_at`` marks
+  the enrollments already reminded.
+
+Both steps only look at rows that still need work, through partial indexes,
+so running them again, or from two machines at once, does nothing twice.
+"""
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from kelaasor_advance import invalidation
+from products.models import Product
+from .models import CourseEnrollment, Notification
+from .realtime import publish_unread
+
+
+def _switch(queryset, chunk_size, active, now):
+    count = 0
+    while True:
+        rows = list(queryset.order_by('pk').values_list('pk', 'user_id')[:chunk_size])
+        if not rows:
+            return count
+        with transaction.atomic():
+            CourseEnrollment.objects.filter(pk__in=[pk for pk, _ in rows], is_active=not active).update(
+                is_active=active, expired_at=None if active else now,
+            )
+            for user_id in {user_id for _, user_id in rows}:
+                invalidation.publish('users.courseenrollment', fields={'user_id': user_id})
+        count += len(rows)
+
+
+def deactivate_expired(now=None, chunk_size=1000):
+    now = now or timezone.now()
+    offline = CourseEnrollment.objects.filter(
+        is_active=True, access_expires_at__lte=now, product__course_type='offline',
+    )
+    online = CourseEnrollment.objects.filter(
+        is_active=True,
+        product__in=Product.objects.filter(course_type='online', registration_deadline__lt=timezone.localdate(now)),
+    )
+    return {
+        'offline_expired': _switch(offline, chunk_size, False, now),
+        'online_closed': _switch(online, chunk_size, False, now),
+    }
+
+
+def reactivate_extended(now=None, chunk_size=1000):
+    now = now or timezone.now()
+    expired = CourseEnrollment.objects.filter(is_active=False, expired_at__isnull=False)
+    offline = expired.filter(product__course_type='offline').filter(
+        Q(access_expires_at__isnull=True) | Q(access_expires_at__gt=now)
+    )
+    online = expired.filter(product__course_type='online').filter(
+        Q(product__registration_deadline__isnull=True) | Q(product__registration_deadline__gte=timezone.localdate(now))
+    )
+    return _switch(offline, chunk_size, True, now) + _switch(online, chunk_size, True, now)
+
+
+def _publish(notifications):
+    for notification in notifications:
+        publish_unread(notification.user_id, notification)
+
+
+def send_start_reminders(now=None, chunk_size=500):
+    now = now or timezone.now()
+    lead = timedelta(hours=getattr(settings, 'COURSE_REMINDER_LEAD_HOURS', 24))
+    products = {
+        pk: (title, start_date) for pk, title, start_date in Product.objects.filter(
+            start_date__gte=timezone.localdate(now), start_date__lte=timezone.localdate(now + lead),
+        ).values_list('pk', 'title', 'start_date')
+    }
+    if not products:
+        return 0
+    due = CourseEnrollment.objects.filter(
+        is_active=True, start_reminded_at__isnull=True, product_id__in=list(products),
+    ).order_by('pk')
+
+    sent = 0
+    while True:
+        with transaction.atomic():
+            # Rows another runner is working on are skipped, not waited for.
+            rows = list(due.select_for_update(skip_locked=True).values_list('pk', 'user_id', 'product_id')[:chunk_size])
+            if not rows:
+                return sent
+            notifications = Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    title='شروع دوره',
+                    message=f'دوره «{products[product_id][0]}» در تاریخ {products[product_id][1]} شروع می‌شود.',
+                    notification_type='course_started',
+                    related_url=f'/products/{product_id}/',
+                )
+                for _, user_id, product_id in rows
+            ])
+            CourseEnrollment.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(start_reminded_at=now)
+            # bulk_create sends no post_save, so push the notifications here.
+            transaction.on_commit(partial(_publish, notifications), robust=True)
+        sent += len(rows)
+
+
+def run(now=None, chunk_size=1000):
+    counts = deactivate_expired(now, chunk_size)
+    counts['reactivated'] = reactivate_extended(now, chunk_size)
+    counts['reminders_sent'] = send_start_reminders(now, chunk_size)
+    return counts
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.exports import (
+    DEFAULT_CHUNK_SIZE, EXPORT_SPECS, FORMATS, export_filename, parse_bound, stream_export
+)
+
+
+class Command(BaseCommand):
+    help = "Stream orders, payments or enrollments to a CSV/JSONL file with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORT_SPECS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--since', help="Inclusive lower bound (YYYY-MM-DD or ISO datetime).")
+        parser.add_argument('--until', help="Exclusive upper bound (YYYY-MM-DD or ISO datetime).")
+        parser.add_argument('--gzip', action='store_true', help="Gzip-compress the output.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('-o', '--output', help="Output path, '-' for stdout. Defaults to a timestamped file.")
+
+    def handle(self, *args, name, fmt, since, until, gzip, chunk_size, output, **options):
+        try:
+            since, until = parse_bound(since), parse_bound(until)
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        chunks = stream_export(
+            name, fmt, compress=gzip, since=since, until=until, chunk_size=chunk_size
+        )
+        output = output or export_filename(name, fmt, compress=gzip)
+        written = 0
+        if output == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+                written += len(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(output, 'wb') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {output}"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kelaasor_advance import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly partitions of the append-only tables and archive the ones past retention "
+        "(kelaasor_advance/partitioning.py). Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models', metavar='APP.MODEL',
+                            help="Only this model (repeatable). Default: all partitioned models.")
+        parser.add_argument('--convert', action='store_true',
+                            help="First turn plain tables into partitioned ones. Locks each table while copying.")
+        parser.add_argument('--no-archive', action='store_true', help="Only create partitions.")
+        parser.add_argument('--restore', metavar='MANIFEST', help="Load an archived partition back and exit.")
+
+    def handle(self, *args, **options):
+        try:
+            if options['restore']:
+                manifest = partitioning.restore(options['restore'])
+                self.stdout.write(self.style.SUCCESS(f"Restored {manifest['partition']} ({manifest['rows']} rows)."))
+                return
+            for model in partitioning.get_models(options['models']):
+                table = model._meta.db_table
+                if options['convert'] and partitioning.convert(model):
+                    self.stdout.write(f"{table}: converted to a partitioned table.")
+                for name in partitioning.ensure(model):
+                    self.stdout.write(f"{table}: created {name}.")
+                if not options['no_archive']:
+                    for archived in partitioning.archive(model):
+                        self.stdout.write(f"{table}: archived {archived['partition']} ({archived['rows']} rows) to {archived['manifest']}.")
+        except (partitioning.PartitioningError, LookupError) as exc:
+            raise CommandError(exc)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.lifecycle import run
+
+
+class Command(BaseCommand):
+    help = "Deactivate enrollments whose access has ended, reactivate extended ones and send course start reminders. Safe to run every minute."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help="Keep running, sleeping this long between passes.")
+
+    def handle(self, *args, **options):
+        while True:
+            counts = run(chunk_size=options['chunk_size'])
+            self.stdout.write(", ".join(f"{key}: {value}" for key, value in counts.items()))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -1,3 +1,5 @@
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
@@ -115,7 +117,7 @@ class Order(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="orders")
     total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     discount_code = models.ForeignKey('DiscountCode', on_delete=models.SET_NULL, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
@@ -129,7 +131,9 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # What was charged for the item: the items of an order add up to Order.total.
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
     class Meta:
         verbose_name = "آیتم سفارش"
@@ -174,16 +178,6 @@ class DiscountCode(models.Model):
             return False
         return True
 
-    def apply_discount_for_item(self, price, product=None):
-        if self.product and product and self.product != product:
-            return price
-        if self.discount_type == 'percent':
-            discount_amount = (self.value / Decimal(100)) * price
-            return max(price - discount_amount, Decimal('0.00'))
-        if self.discount_type == 'amount':
-            return max(price - self.value, Decimal('0.00'))
-        return price
-
 
 class PaymentHistory(models.Model):
     PAYMENT_STATUS_CHOICES = [
@@ -198,7 +192,9 @@ class PaymentHistory(models.Model):
     payment_method = models.CharField(max_length=50, null=True, blank=True)
     transaction_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
     paid_at = models.DateTimeField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Watermark of the analytics rollups; save(update_fields=...) must list it.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["-created_at"]
@@ -209,6 +205,18 @@ class PaymentHistory(models.Model):
         return f"Payment {self.id} for order {self.order.id} - {self.status}"
 
 
+class NotificationQuerySet(models.QuerySet):
+    def newest_first(self, before=None, before_id=None):
+        """Newest first, starting after the notification ``(before, before_id)``. The bound on
+        ``created_at`` keeps each page on the partitions it needs."""
+        queryset = self.order_by('-created_at', '-pk')
+        if before is not None and before_id is not None:
+            queryset = queryset.filter(created_at__lte=before).filter(
+                models.Q(created_at__lt=before) | models.Q(pk__lt=before_id)
+            )
+        return queryset
+
+
 class Notification(models.Model):
     NOTIFICATION_TYPE_CHOICES = [
         ("ticket_response", "پاسخ تیکت"),
@@ -225,8 +233,11 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     related_url = models.URLField(null=True, blank=True)
 
+    objects = NotificationQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=['user', '-created_at'], name='notification_user_recent')]
         verbose_name = "اطلاع‌رسانی"
         verbose_name_plural = "اطلاع‌رسانی‌ها"
 
@@ -238,13 +249,26 @@ class CourseEnrollment(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="enrollments")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="enrollments")
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="enrollments", null=True, blank=True)
-    enrolled_at = models.DateTimeField(auto_now_add=True)
+    enrolled_at = models.DateTimeField(auto_now_add=True, db_index=True)
     access_expires_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Set when users/lifecycle.py switched the enrollment off because access ran out;
+    # such enrollments are switched back on if the access window is extended.
+    expired_at = models.DateTimeField(null=True, blank=True)
+    start_reminded_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ["user", "product"]
         ordering = ["-enrolled_at"]
+        # Scanned every minute by users/lifecycle.py.
+        indexes = [
+            models.Index(fields=["access_expires_at"], condition=models.Q(is_active=True), name="enrollment_active_expiry"),
+            models.Index(
+                fields=["product"], condition=models.Q(is_active=True, start_reminded_at__isnull=True),
+                name="enrollment_reminder_due",
+            ),
+            models.Index(fields=["product"], condition=models.Q(expired_at__isnull=False), name="enrollment_expired"),
+        ]
         verbose_name = "ثبت‌نام کاربر"
         verbose_name_plural = "ثبت‌نام کاربران"
 
@@ -261,4 +285,45 @@ class CourseEnrollment(models.Model):
         return True
 
 
+class CacheVersion(models.Model):
+    """Change counter per model, bumped by kelaasor_advance/invalidation.py."""
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "نسخه کش"
+        verbose_name_plural = "نسخه‌های کش"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class RevokedToken(models.Model):
+    """Refresh tokens that were used or logged out (users/tokens.py); rows go once the token expires."""
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "توکن باطل‌شده"
+        verbose_name_plural = "توکن‌های باطل‌شده"
+
+    def __str__(self):
+        return self.jti
 
+
+class IdempotencyKey(models.Model):
+    """An ``Idempotency-Key`` of a user (users/idempotency.py); no status yet while the request runs."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="+")
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "key"], name="idempotency_key_unique")]
+        verbose_name = "کلید یکتایی درخواست"
+        verbose_name_plural = "کلیدهای یکتایی درخواست"
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
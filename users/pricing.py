@@ -0,0 +1,228 @@
+"""
+Cart pricing with discount codes.
+
+Active codes are held in a per-process index keyed by code and by owning
+user. Changes to codes reach every worker through the invalidation bus
+(kelaasor_advance/invalidation.py), which bumps ``_generation``; each pricing
+call compares generations, so once a worker has loaded the index, pricing a
+cart runs no queries and no cache reads. Code changed with
+``update()``/``bulk_create()`` calls ``invalidate()``. The index is also
+reloaded after ``PRICING_INDEX_MAX_AGE`` seconds, as a backstop.
+
+Rules:
+
+* One code per order (``Order.discount_code``); an item gets at most one discount.
+* A product-scoped code discounts only that product and needs it in the cart.
+* A percent code discounts each eligible item, rounded half-up to the rial cent.
+* A fixed-amount code without a product is a cart-level amount, split across
+  the items in proportion to their price; a product-scoped one comes off that item.
+* No item goes below zero.
+
+Usage limits are checked here against the indexed ``used_count``; checkout
+claims a use with a conditional UPDATE, which has the final say.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Q
+from django.utils import timezone
+
+from kelaasor_advance import invalidation
+from .models import DiscountCode
+
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+class PricingError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: int
+    code: str
+    discount_type: str
+    value: Decimal
+    start_date: object
+    end_date: object
+    max_usage: int
+    used_count: int
+    user_id: int
+    product_id: int
+
+    def usable(self, user_id, now):
+        if (self.start_date and self.start_date > now) or (self.end_date and self.end_date < now):
+            return False
+        if self.max_usage and self.used_count >= self.max_usage:
+            return False
+        return self.user_id is None or self.user_id == user_id
+
+
+@dataclass
+class PricedItem:
+    product_id: int
+    title: str
+    price: Decimal
+    discount: Decimal = ZERO
+
+    @property
+    def final_price(self):
+        return self.price - self.discount
+
+
+@dataclass
+class Quote:
+    items: list
+    rule: Rule = None
+    available_codes: list = field(default_factory=list)
+
+    @property
+    def subtotal(self):
+        return sum((item.price for item in self.items), ZERO)
+
+    @property
+    def discount(self):
+        return sum((item.discount for item in self.items), ZERO)
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount
+
+    def as_dict(self):
+        return {
+            'items': [
+                {
+                    'product_id': item.product_id,
+                    'title': item.title,
+                    'price': str(item.price),
+                    'discount': str(item.discount),
+                    'final_price': str(item.final_price),
+                }
+                for item in self.items
+            ],
+            'discount_code': self.rule.code if self.rule else None,
+            'subtotal': str(self.subtotal),
+            'discount': str(self.discount),
+            'total': str(self.total),
+            'available_codes': self.available_codes,
+        }
+
+
+class RuleIndex:
+    def __init__(self, rules, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_code = {rule.code: rule for rule in rules}
+        self.by_user = {}
+        for rule in rules:
+            if rule.user_id is not None:
+                self.by_user.setdefault(rule.user_id, []).append(rule)
+
+    @classmethod
+    def load(cls, version):
+        # Always from the primary: a lagging replica would be cached as the new version
+        # and priced from at checkout until the next change.
+        rules = [
+            Rule(**row) for row in DiscountCode.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True).exclude(end_date__lt=timezone.now()).values(
+                'id', 'code', 'discount_type', 'value', 'start_date', 'end_date',
+                'max_usage', 'used_count', 'user_id', 'product_id',
+            )
+        ]
+        return cls(rules, version)
+
+
+_index = None
+_index_lock = threading.Lock()
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+@invalidation.receiver('users.discountcode')
+def _discount_codes_changed(change):
+    global _generation
+    # Runs on the listener thread and on request threads.
+    with _generation_lock:
+        _generation += 1
+
+
+def invalidate():
+    """Reload the index in every worker once the current transaction commits."""
+    invalidation.publish('users.discountcode')
+
+
+def get_index():
+    global _index
+    # Read before loading: a change that lands during the load triggers another one.
+    version = _generation
+    index = _index
+    max_age = getattr(settings, 'PRICING_INDEX_MAX_AGE', 300)
+    if index is None or index.version != version or time.monotonic() - index.loaded_at > max_age:
+        with _index_lock:
+            if _index is None or _index is index:
+                _index = RuleIndex.load(version)
+            index = _index
+    return index
+
+
+def _percent(rule, item):
+    return min((item.price * rule.value / 100).quantize(CENT, rounding=ROUND_HALF_UP), item.price)
+
+
+def _apply(rule, items):
+    eligible = [item for item in items if rule.product_id is None or item.product_id == rule.product_id]
+    if not eligible:
+        raise PricingError('کد تخفیف برای دوره‌های سبد خرید شما معتبر نیست.')
+    if rule.discount_type == 'percent':
+        for item in eligible:
+            item.discount = _percent(rule, item)
+    elif rule.discount_type == 'amount':
+        base = sum((item.price for item in eligible), ZERO)
+        amount = min(rule.value.quantize(CENT, rounding=ROUND_HALF_UP), base)
+        if not base:
+            return
+        for item in eligible:
+            item.discount = (amount * item.price / base).quantize(CENT, rounding=ROUND_DOWN)
+        # Rounding leftovers go to the most expensive items, a cent at a time.
+        leftover = amount - sum(item.discount for item in eligible)
+        for item in sorted(eligible, key=lambda item: item.price, reverse=True):
+            if leftover <= 0:
+                break
+            step = min(leftover, item.price - item.discount)
+            item.discount += step
+            leftover -= step
+
+
+def price_cart(user_id, products, code=None, now=None):
+    """Price ``products`` for a user with an optional code; raises PricingError for an unusable code."""
+    now = now or timezone.now()
+    index = get_index()
+    items = [PricedItem(product.pk, product.title, product.price) for product in products]
+    quote = Quote(items)
+    product_ids = {item.product_id for item in items}
+    quote.available_codes = sorted(
+        rule.code for rule in index.by_user.get(user_id, ())
+        if rule.usable(user_id, now) and (rule.product_id is None or rule.product_id in product_ids)
+    )
+    if code:
+        rule = index.by_code.get(code)
+        if rule is None:
+            raise PricingError('کد تخفیف نامعتبر است.')
+        if not rule.usable(user_id, now):
+            raise PricingError('کد تخفیف منقضی یا نامعتبر است.')
+        _apply(rule, items)
+        quote.rule = rule
+    return quote
+
+
+def claim_use(rule):
+    """Count one use of the code unless it ran out meanwhile. Call inside the checkout transaction."""
+    claimed = DiscountCode.objects.filter(pk=rule.id, is_active=True).filter(
+        Q(max_usage__isnull=True) | Q(max_usage=0) | Q(used_count__lt=F('max_usage'))
+    ).update(used_count=F('used_count') + 1)
+    return bool(claimed)
@@ -0,0 +1,184 @@
+"""
+Push of new notifications and unread counts to open connections.
+
+Committed ``Notification`` changes are published on the user's channel
+(``users/signals.py``). The SSE and long-poll views subscribe to it and wait
+on an ``asyncio.Queue``, so an idle connection is one suspended coroutine
+and holds no database connection or thread. They only work served through
+``kelaasor_advance/asgi.py``; under WSGI every open stream would pin a worker.
+
+The broker is pluggable (``NOTIFICATION_BROKER``):
+
+* ``LocalBroker`` delivers within the publishing process only, which is
+  enough for a single ASGI worker.
+* ``RedisBroker`` publishes through Redis pub/sub, and each process runs a
+  single listener that fans messages out to its local subscribers. Needs the
+  ``redis`` package and ``NOTIFICATION_BROKER_URL``.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'notifications:{user_id}'
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # The client stopped reading; it catches up from Last-Event-ID on reconnect.
+        pass
+
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.broker.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker.remove(self)
+
+    async def get(self, timeout):
+        """The next message, or None after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """In-process pub/sub; ``publish`` may be called from any thread."""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        return Subscription(self, channel)
+
+    def add(self, subscription):
+        with self.lock:
+            self.subscriptions[subscription.channel].add(subscription)
+
+    def remove(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.channel]
+
+    def subscriber_count(self):
+        with self.lock:
+            return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(_offer, subscription.queue, message)
+            except RuntimeError:
+                # Event loop already closed.
+                self.remove(subscription)
+
+
+class RedisBroker(LocalBroker):
+    prefix = 'kelaasor:'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the redis package.')
+        self.url = getattr(settings, 'NOTIFICATION_BROKER_URL', '')
+        if not self.url:
+            raise ImproperlyConfigured('RedisBroker requires NOTIFICATION_BROKER_URL.')
+        self.client = redis.Redis.from_url(self.url)
+        self.async_from_url = redis.asyncio.from_url
+        self.listeners = {}
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def add(self, subscription):
+        super().add(subscription)
+        with self.lock:
+            listener = self.listeners.get(subscription.loop)
+            if listener is None or listener.done():
+                self.listeners[subscription.loop] = subscription.loop.create_task(self.listen())
+
+    async def listen(self):
+        """One pattern subscription per event loop, fanned out to the local subscribers."""
+        while True:
+            client = self.async_from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(self.prefix + '*')
+                    async for item in pubsub.listen():
+                        if item['type'] != 'pmessage':
+                            continue
+                        channel = item['channel'].decode()[len(self.prefix):]
+                        self.deliver(channel, json.loads(item['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Notification listener lost its Redis connection; reconnecting.')
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', 'users.realtime.LocalBroker'))()
+    return _broker
+
+
+def publish_unread(user_id, notification=None):
+    """Publish the user's unread count, with the notification when one was just created."""
+    from .models import Notification
+    from .serializers import NotificationSerializer
+
+    message = {
+        'event': 'unread',
+        'unread': Notification.objects.filter(user_id=user_id, is_read=False).count(),
+    }
+    if notification is not None:
+        message.update(event='notification', id=notification.pk, notification=NotificationSerializer(notification).data)
+    try:
+        get_broker().publish(user_channel(user_id), message)
+    except Exception:
+        # Push is best effort; clients still see the notification on their next fetch.
+        logger.exception('Could not publish notification event for user %s', user_id)
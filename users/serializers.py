@@ -1,13 +1,18 @@
-from django.db import transaction
-from django.db.models import F
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from .models import (
     CustomUser, OTP, Cart, CartItem, Order, OrderItem, CourseEnrollment,
-    UserProfile, DiscountCode, PaymentHistory, Notification
+    UserProfile, Notification
 )
+from .context import user_context
+from .tokens import UserRefreshToken
+from kelaasor_advance.projections import Column, Projection, datetime_string
 from products.models import Product
 from django.utils import timezone
-from decimal import Decimal
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,6 +35,38 @@ class NotificationSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
 
+class NotificationProjection(Projection):
+    """``values()`` twin of NotificationSerializer for list endpoints."""
+    fields = {
+        "id": Column("id"),
+        "title": Column("title"),
+        "message": Column("message"),
+        "notification_type": Column("notification_type"),
+        "is_read": Column("is_read"),
+        "created_at": Column("created_at", datetime_string),
+        "related_url": Column("related_url"),
+    }
+
+
+class OrderProjection(Projection):
+    """Orders with their item titles and prices, in two queries."""
+    fields = {
+        "id": Column("id"),
+        "total": Column("total", str),
+        "created_at": Column("created_at"),
+    }
+
+    def project(self, queryset):
+        orders = super().project(queryset)
+        items = {}
+        rows = OrderItem.objects.filter(order_id__in=[o["id"] for o in orders]).values("order_id", "product__title", "price")
+        for row in rows:
+            items.setdefault(row["order_id"], []).append({"product": row["product__title"], "price": str(row["price"])})
+        for order in orders:
+            order["items"] = items.get(order["id"], [])
+        return orders
+
+
 class SendOTPSerializer(serializers.Serializer):
     phone = serializers.CharField(max_length=15)
 
@@ -49,13 +86,48 @@ class VerifyOTPSerializer(serializers.Serializer):
         otp = OTP.objects.filter(phone=phone).order_by("-created_at").first()
         if not otp or not otp.is_valid() or otp.code != code:
             raise serializers.ValidationError("کد وارد شده نادرست یا منقضی است.")
-        user, created = CustomUser.objects.get_or_create(phone=phone)
-        user.is_phone_verified = True
-        user.save()
+        with transaction.atomic():
+            user, created = CustomUser.objects.get_or_create(phone=phone, defaults={"is_phone_verified": True})
+            if created:
+                # Every user has a profile and a cart from the start (see users/context.py).
+                UserProfile.objects.create(user=user)
+                Cart.objects.create(user=user)
+        if not user.is_phone_verified:
+            user.is_phone_verified = True
+            user.save(update_fields=["is_phone_verified"])
         attrs["user"] = user
         return attrs
 
 
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = UserRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = CustomUser.objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}, is_active=True
+        ).first()
+        if user is None:
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        # The used refresh token is denylisted; a second use (or a concurrent replay) fails here.
+        if not refresh.denylist():
+            raise InvalidToken("Token is denylisted")
+        # A new pair from the user as it is now, not a copy of the old claims.
+        refresh = self.token_class.for_user(user)
+        return {"access": str(refresh.access_token), "refresh": str(refresh)}
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def save(self, **kwargs):
+        try:
+            UserRefreshToken(self.validated_data["refresh"]).denylist()
+        except TokenError:
+            raise InvalidToken("Token is invalid or expired")
+        return {}
+
+
 class ProductSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
@@ -97,15 +169,20 @@ class AddToCartSerializer(serializers.Serializer):
             raise serializers.ValidationError('You have already purchased this course.')
         if product.course_type == 'online' and product.registration_deadline and timezone.now().date() > product.registration_deadline:
             raise serializers.ValidationError('Registration deadline has passed for this course.')
+        self.product = product
         return value
 
     def create(self, validated_data):
-        user = self.context['request'].user
-        product = Product.objects.get(pk=validated_data['product_id'])
-        cart, _ = Cart.objects.get_or_create(user=user)
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
+        context = user_context(self.context['request'])
+        if self.product.pk in context.product_ids:
             raise serializers.ValidationError('This course is already in your cart.')
+        try:
+            with transaction.atomic():
+                item = CartItem.objects.create(cart=context.cart, product=self.product)
+        except IntegrityError:
+            # Added by a concurrent request.
+            raise serializers.ValidationError('This course is already in your cart.')
+        context.forget_cart()
         return item
 
 
@@ -120,81 +197,8 @@ class RemoveFromCartSerializer(serializers.Serializer):
         return value
 
     def save(self, **kwargs):
-        user = self.context['request'].user
-        cart = Cart.objects.filter(user=user).first()
-        if not cart:
-            raise serializers.ValidationError('Cart not found.')
-        product = Product.objects.get(pk=self.validated_data['product_id'])
-        CartItem.objects.filter(cart=cart, product=product).delete()
+        context = user_context(self.context['request'])
+        if self.validated_data['product_id'] in context.product_ids:
+            CartItem.objects.filter(cart=context.cart, product_id=self.validated_data['product_id']).delete()
+            context.forget_cart()
         return {}
-
-
-class CheckoutSerializer(serializers.Serializer):
-    discount_code = serializers.CharField(max_length=50, required=False, allow_blank=True)
-    payment_method = serializers.CharField(max_length=50, required=False, allow_blank=True)
-
-    def validate(self, attrs):
-        user = self.context['request'].user
-        cart = Cart.objects.filter(user=user).first()
-        if not cart or not cart.items.exists():
-            raise serializers.ValidationError('Cart is empty.')
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        if not profile.is_complete():
-            raise serializers.ValidationError('Please complete your profile before checkout.')
-        discount_code = attrs.get('discount_code') or None
-        if discount_code:
-            try:
-                dc = DiscountCode.objects.get(code=discount_code)
-            except DiscountCode.DoesNotExist:
-                raise serializers.ValidationError('Invalid discount code.')
-            if not dc.is_valid(user=user):
-                raise serializers.ValidationError('Discount code is not valid or expired.')
-            attrs['discount_obj'] = dc
-        return attrs
-
-    def create(self, validated_data):
-        user = self.context['request'].user
-        cart = Cart.objects.get(user=user)
-        discount_obj = validated_data.get('discount_obj', None)
-        with transaction.atomic():
-            total = Decimal('0.00')
-            items = list(cart.items.select_related('product').all())
-            for item in items:
-                price = item.product.price
-                if discount_obj:
-                    price = discount_obj.apply_discount_for_item(price, product=item.product)
-                total += price
-
-            order = Order.objects.create(user=user, total=total, discount_code=discount_obj if discount_obj else None)
-
-            from django.utils import timezone as _tz, datetime as _dt
-            for item in items:
-                OrderItem.objects.create(order=order, product=item.product, price=item.product.price)
-
-                access_expires_at = None
-                if item.product.course_type == 'offline' and item.product.access_expiration:
-                    access_expires_at = _tz.make_aware(_dt.datetime.combine(item.product.access_expiration, _dt.datetime.min.time()))
-                CourseEnrollment.objects.create(user=user, product=item.product, order=order, access_expires_at=access_expires_at, is_active=True)
-
-            cart.items.all().delete()
-
-            if discount_obj:
-                DiscountCode.objects.filter(pk=discount_obj.pk).update(used_count=F('used_count') + 1)
-
-            ph = PaymentHistory.objects.create(
-                order=order,
-                amount=total,
-                status='pending',
-                payment_method=validated_data.get('payment_method', ''),
-                transaction_id=None
-            )
-
-            Notification.objects.create(
-                user=user,
-                title="سفارش ثبت شد",
-                message=f"سفارش {order.id} با موفقیت ثبت شد.",
-                notification_type='order_confirmed',
-                related_url=f"/orders/{order.id}/"
-            )
-
-            return {'order': order, 'payment': ph}
@@ -0,0 +1,34 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from kelaasor_advance import invalidation
+from .feed import invalidate_all_sections, invalidate_user_sections, section_cache_key
+from .models import Notification
+from .realtime import publish_unread
+
+
+@invalidation.receiver('users.order', 'users.courseenrollment')
+def drop_user_feed_sections(change):
+    if 'user_id' in change.fields:
+        invalidate_user_sections(change.fields['user_id'])
+    elif change.pk is None:
+        invalidate_all_sections()
+
+
+@invalidation.receiver('products.product', 'products.category')
+def drop_products_feed_section(change):
+    cache.delete(section_cache_key('products'))
+
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, **kwargs):
+    transaction.on_commit(partial(publish_unread, instance.user_id, instance if created else None), robust=True)
+
+
+@receiver(post_delete, sender=Notification)
+def push_unread_count(sender, instance, **kwargs):
+    transaction.on_commit(partial(publish_unread, instance.user_id), robust=True)
@@ -1,3 +1,423 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from kelaasor_advance import invalidation
+from products.models import Category, Product
+from . import idempotency, pricing, realtime, views
+from .authentication import ClaimsJWTAuthentication, aauthenticate
+from .feed import build_feed, section_cache_key
+from .lifecycle import run
+from .models import CacheVersion, CartItem, CourseEnrollment, CustomUser, DiscountCode, IdempotencyKey, Notification
+from .tokens import UserRefreshToken
+
+
+class LifecycleTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000002')
+        self.category = Category.objects.create(name='دوره‌ها')
+
+    def product(self, course_type, **fields):
+        return Product.objects.create(
+            category=self.category, title=course_type, description='-', price=Decimal('0'),
+            duration='1h', course_type=course_type, **fields,
+        )
+
+    def test_offline_expiry_is_undone_when_access_is_extended(self):
+        now = timezone.now()
+        enrollment = CourseEnrollment.objects.create(
+            user=self.user, product=self.product('offline'), access_expires_at=now - timedelta(days=1),
+        )
+        self.assertEqual(run(now)['offline_expired'], 1)
+        enrollment.refresh_from_db()
+        self.assertFalse(enrollment.is_active)
+        self.assertIsNotNone(enrollment.expired_at)
+
+        CourseEnrollment.objects.filter(pk=enrollment.pk).update(access_expires_at=now + timedelta(days=30))
+        self.assertEqual(run(now)['reactivated'], 1)
+        enrollment.refresh_from_db()
+        self.assertTrue(enrollment.is_active)
+        self.assertIsNone(enrollment.expired_at)
+        self.assertTrue(enrollment.has_access())
+
+    def test_online_expiry_is_undone_when_the_deadline_moves(self):
+        now = timezone.now()
+        product = self.product('online', registration_deadline=timezone.localdate(now) - timedelta(days=1))
+        enrollment = CourseEnrollment.objects.create(user=self.user, product=product)
+        self.assertEqual(run(now)['online_closed'], 1)
+
+        Product.objects.filter(pk=product.pk).update(registration_deadline=timezone.localdate(now) + timedelta(days=7))
+        self.assertEqual(run(now)['reactivated'], 1)
+        enrollment.refresh_from_db()
+        self.assertTrue(enrollment.is_active)
+
+    def test_unpaid_enrollments_are_not_activated(self):
+        now = timezone.now()
+        enrollment = CourseEnrollment.objects.create(user=self.user, product=self.product('offline'), is_active=False)
+        self.assertEqual(run(now)['reactivated'], 0)
+        enrollment.refresh_from_db()
+        self.assertFalse(enrollment.is_active)
+
+
+class FeedInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation._versions.pop('users.order', None)
+        self.user = CustomUser.objects.create_user('09120000003')
+        self.other = CustomUser.objects.create_user('09120000004')
+        build_feed(self.user, ['courses', 'orders'])
+
+    def cached(self):
+        return cache.get(section_cache_key('orders', self.user.pk)) is not None
+
+    def test_change_for_another_user_keeps_the_section(self):
+        invalidation._dispatch('users.order', 1, 1, {'user_id': self.other.pk})
+        self.assertTrue(self.cached())
+
+    def test_change_for_the_user_drops_the_section(self):
+        invalidation._dispatch('users.order', 1, 1, {'user_id': self.user.pk})
+        self.assertFalse(self.cached())
+
+    def test_missed_events_drop_every_section(self):
+        invalidation._dispatch('users.order', 1, 1, {'user_id': self.other.pk})
+        invalidation._dispatch('users.order', 2, 5, {'user_id': self.other.pk})
+        self.assertFalse(self.cached())
+        self.assertIsNone(cache.get(section_cache_key('courses', self.user.pk)))
+
+    def test_polled_change_drops_every_section(self):
+        invalidation._dispatch('users.order', None, 3, {})
+        self.assertFalse(self.cached())
+
+
+class InvalidationBusTests(TestCase):
+    def setUp(self):
+        self.received = []
+        patches = [
+            mock.patch.dict(invalidation._receivers, {'users.order': [self.received.append]}),
+            mock.patch.dict(invalidation._versions),
+            # Changes other tests left unflushed, since their transactions never commit.
+            mock.patch.dict(invalidation._pending.__dict__, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_one_flush_per_transaction_even_after_a_rollback(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    invalidation.publish('users.order', 1)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            invalidation.publish('users.order', 2)
+            invalidation.publish('users.order', 3)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_versions_are_spread_over_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for pk in range(1, 41):
+                invalidation.publish('users.order', pk)
+        rows = dict(CacheVersion.objects.filter(name__startswith='users.order').values_list('name', 'version'))
+        self.assertGreater(len(rows), 1)
+        self.assertNotIn('users.order', rows)
+        self.assertEqual(sum(rows.values()), 40)
+        self.assertEqual(sorted(change.pk for change in self.received), list(range(1, 41)))
+
+    def test_poll_reports_a_moved_row_as_a_whole_model_change(self):
+        CacheVersion.objects.create(name='users.order#3', version=1)
+        table = connection.ops.quote_name(CacheVersion._meta.db_table)
+        with connection.cursor() as cursor:
+            invalidation.poll(cursor, table)
+            CacheVersion.objects.filter(name='users.order#3').update(version=4)
+            invalidation.poll(cursor, table)
+        self.assertEqual(self.received, [invalidation.Change('users.order', None, 4, {})])
+
+    def test_listener_closes_its_connections(self):
+        listener = invalidation.Listener('default')
+        listener.stop()
+        with mock.patch.object(invalidation.connections, 'close_all') as close_all:
+            listener.run()
+        close_all.assert_called_once_with()
+
+
+@override_settings(API_THROTTLING=False)
+class ClaimsUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Flush the creation now, so the changes below schedule their own flush.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = CustomUser.objects.create_user('09120000005', first_name='سارا')
+        self.token = str(UserRefreshToken.for_user(self.user).access_token)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+
+    def me(self):
+        return self.client.get(reverse('me'), **self.auth)
+
+    def change(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(self.user, name, value)
+            self.user.save()
+
+    def test_read_only_requests_are_served_from_the_cache(self):
+        auth = ClaimsJWTAuthentication()
+        validated = auth.get_validated_token(self.token.encode())
+        with self.assertNumQueries(1):
+            auth.get_claims_user(validated)
+        with self.assertNumQueries(0):
+            user = auth.get_claims_user(validated)
+        self.assertEqual((user.pk, user.first_name), (self.user.pk, 'سارا'))
+        self.assertIn('is_staff', user.get_deferred_fields())
+
+    def test_me_shows_current_values(self):
+        self.assertEqual(self.me().json()['first_name'], 'سارا')
+        self.change(first_name='مریم')
+        self.assertEqual(self.me().json()['first_name'], 'مریم')
+
+    def test_deactivated_user_is_refused(self):
+        self.assertEqual(self.me().status_code, 200)
+        self.change(is_active=False)
+        self.assertEqual(self.me().status_code, 401)
+        request = RequestFactory().get('/', **self.auth)
+        self.assertIsNone(async_to_sync(aauthenticate)(request))
+
+    def test_deleted_user_is_refused(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_unsafe_methods_load_the_user(self):
+        request = RequestFactory().post('/', **self.auth)
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertEqual(user.get_deferred_fields(), set())
+
+
+@override_settings(API_THROTTLING=False, IDEMPOTENCY_LOCK_SECONDS=30)
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000006')
+        category = Category.objects.create(name='دوره‌ها')
+        self.products = [
+            Product.objects.create(
+                category=category, title=f'دوره {n}', description='-', price=Decimal('0'), duration='1h',
+                course_type='offline',
+            )
+            for n in range(2)
+        ]
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {UserRefreshToken.for_user(self.user).access_token}'}
+
+    def add(self, product, key='key-1'):
+        return self.client.post(
+            reverse('cart-add'), {'product_id': product.pk}, content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key, **self.auth,
+        )
+
+    def running_key(self, product, age, key='key-1'):
+        request = SimpleNamespace(method='POST', path=reverse('cart-add'), data={'product_id': product.pk})
+        return IdempotencyKey.objects.create(
+            user=self.user, key=hashlib.sha256(key.encode()).hexdigest()[:32],
+            fingerprint=idempotency._fingerprint(request), created_at=timezone.now() - timedelta(seconds=age),
+        )
+
+    def test_repeat_is_replayed(self):
+        first = self.add(self.products[0])
+        second = self.add(self.products[0])
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_key_reused_for_another_body_gets_422(self):
+        self.add(self.products[0])
+        self.assertEqual(self.add(self.products[1]).status_code, 422)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_running_request_gets_409(self):
+        self.running_key(self.products[0], age=0)
+        self.assertEqual(self.add(self.products[0]).status_code, 409)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_expired_result_runs_again(self):
+        self.add(self.products[0])
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        CartItem.objects.all().delete()
+        response = self.add(self.products[0])
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_key_without_heartbeat_is_taken_over(self):
+        self.running_key(self.products[0], age=60)
+        self.assertEqual(self.add(self.products[0]).status_code, 201)
+
+    def test_heartbeat_keeps_a_slow_request_its_key(self):
+        row = self.running_key(self.products[0], age=60)
+        with mock.patch.dict(idempotency._running, {row.pk: 1}):
+            idempotency._beat()
+        self.assertEqual(self.add(self.products[0]).status_code, 409)
+        self.assertFalse(CartItem.objects.exists())
+
+
+@override_settings(API_THROTTLING=False, NOTIFICATION_PAGE_SIZE=2)
+class NotificationListTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000007')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {UserRefreshToken.for_user(self.user).access_token}'}
+        now = timezone.now()
+        for n, age in enumerate([0, 1, 1, 200]):
+            notification = Notification.objects.create(user=self.user, title=f'اعلان {n}', message='-')
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(days=age))
+
+    def test_pages_cover_every_notification_the_unread_count_does(self):
+        url, titles = reverse('notifications-list'), []
+        while url:
+            response = self.client.get(url, **self.auth)
+            titles += [row['title'] for row in response.json()]
+            url = response.get('Link', '').partition('>')[0][1:]
+        self.assertEqual(titles, ['اعلان 0', 'اعلان 2', 'اعلان 1', 'اعلان 3'])
+        unread = self.client.get(reverse('me'), **self.auth).json()['unread_notifications']
+        self.assertEqual(unread, len(titles))
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('notifications-list'), {'before': '2026-13-01T00:00:00'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000008')
+        category = Category.objects.create(name='دوره‌ها')
+        self.products = [
+            Product.objects.create(
+                category=category, title=f'دوره {n}', description='-', price=price, duration='1h',
+                course_type='offline',
+            )
+            for n, price in enumerate([Decimal('1000.00'), Decimal('500.00'), Decimal('500.00')])
+        ]
+
+    def price(self, products, code=None):
+        # Codes created here are never committed, so load the index afresh.
+        with mock.patch.object(pricing, '_index', None):
+            return pricing.price_cart(self.user.pk, products, code)
+
+    def code(self, code, discount_type='percent', value='10', **fields):
+        return DiscountCode.objects.create(code=code, discount_type=discount_type, value=Decimal(value), **fields)
+
+    def test_product_code_discounts_only_its_product(self):
+        self.code('ONE', product=self.products[0])
+        quote = self.price(self.products[:2], 'ONE')
+        self.assertEqual([item.discount for item in quote.items], [Decimal('100.00'), Decimal('0.00')])
+        with self.assertRaises(pricing.PricingError):
+            self.price(self.products[1:], 'ONE')
+
+    def test_amount_is_split_by_price_and_capped_at_the_cart(self):
+        self.code('CART', 'amount', '100')
+        self.code('BIG', 'amount', '5000')
+        quote = self.price(self.products, 'CART')
+        self.assertEqual([item.discount for item in quote.items], [Decimal('50.00'), Decimal('25.00'), Decimal('25.00')])
+        quote = self.price(self.products, 'BIG')
+        self.assertEqual((quote.discount, quote.total), (Decimal('2000.00'), Decimal('0.00')))
+
+    def test_code_is_refused_once_its_uses_are_claimed(self):
+        self.code('ONCE', max_usage=1)
+        rule = self.price(self.products[:1], 'ONCE').rule
+        self.assertTrue(pricing.claim_use(rule))
+        self.assertFalse(pricing.claim_use(rule))
+        with self.assertRaises(pricing.PricingError):
+            self.price(self.products[:1], 'ONCE')
+
+    def test_code_outside_its_dates_is_refused(self):
+        now = timezone.now()
+        self.code('OLD', end_date=now - timedelta(days=1))
+        self.code('SOON', start_date=now + timedelta(days=1))
+        for code in ['OLD', 'SOON']:
+            with self.assertRaises(pricing.PricingError):
+                self.price(self.products[:1], code)
+
+
+@override_settings(API_THROTTLING=False, NOTIFICATION_STREAM_MAX_SECONDS=5, NOTIFICATION_STREAM_KEEPALIVE=5)
+class NotificationPushTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('09120000009')
+        self.auth = {'Authorization': f'Bearer {UserRefreshToken.for_user(self.user).access_token}'}
+        self.notifications = [Notification.objects.create(user=self.user, title=f'اعلان {n}', message='-') for n in range(2)]
+        self.broker = realtime.LocalBroker()
+        patch = mock.patch.object(realtime, '_broker', self.broker)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def live(self, pk, unread=2):
+        return {'event': 'notification', 'id': pk, 'notification': {'id': pk}, 'unread': unread}
+
+    async def stream(self, until, last_event_id):
+        """The stream's text up to and including the event with id ``until``."""
+        response = await self.async_client.get(
+            reverse('notifications-stream'), headers={**self.auth, 'Last-Event-ID': str(last_event_id)},
+        )
+        text = ''
+        async for chunk in response.streaming_content:
+            text += chunk.decode()
+            if f'id: {until}\n' in text:
+                break
+        await response.streaming_content.aclose()
+        return text
+
+    async def test_publish_after_subscribe_reaches_the_queue(self):
+        async with self.broker.subscribe('c') as subscription:
+            await asyncio.to_thread(self.broker.publish, 'c', {'event': 'unread', 'unread': 1})
+            self.assertEqual(await subscription.get(1), {'event': 'unread', 'unread': 1})
+            self.assertIsNone(await subscription.get(0.01))
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    async def test_stream_replays_what_came_after_the_last_event_id(self):
+        first, second = self.notifications
+        text = await self.stream(second.pk, first.pk)
+        self.assertIn(f'id: {second.pk}\n', text)
+        self.assertNotIn(f'id: {first.pk}\n', text)
+
+    async def test_stream_skips_live_copies_of_the_backlog(self):
+        first, second = self.notifications
+        backlog = views.notification_backlog
+
+        def published_while_reading_the_backlog(user_id, after):
+            # ``second`` is in the backlog too; the next one is only live.
+            self.broker.publish(realtime.user_channel(user_id), self.live(second.pk))
+            self.broker.publish(realtime.user_channel(user_id), self.live(second.pk + 1))
+            return backlog(user_id, after)
+
+        with mock.patch.object(views, 'notification_backlog', published_while_reading_the_backlog):
+            text = await self.stream(second.pk + 1, first.pk)
+        self.assertEqual((text.count(f'id: {second.pk}\n'), text.count(f'id: {second.pk + 1}\n')), (1, 1))
+
+    async def test_poll_answers_on_publish(self):
+        poll = asyncio.create_task(self.async_client.get(
+            reverse('notifications-poll'), {'after': self.notifications[1].pk, 'timeout': 5}, headers=self.auth,
+        ))
+        while not self.broker.subscriber_count():
+            await asyncio.sleep(0.01)
+        pk = self.notifications[1].pk + 1
+        self.broker.publish(realtime.user_channel(self.user.pk), self.live(pk, unread=3))
+        response = await poll
+        self.assertEqual(response.json(), {'notifications': [{'id': pk}], 'unread': 3})
+
+    async def test_poll_times_out_empty(self):
+        response = await self.async_client.get(
+            reverse('notifications-poll'), {'after': self.notifications[1].pk, 'timeout': 1}, headers=self.auth,
+        )
+        self.assertEqual(response.json(), {'notifications': [], 'unread': 2})
+
+    async def test_anonymous_requests_get_401(self):
+        for name in ['notifications-stream', 'notifications-poll']:
+            response = await self.async_client.get(reverse(name))
+            self.assertEqual(response.status_code, 401)
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+
+
+# Copied into every token for clients. The server reads their current values
+# (users/authentication.py). Permission flags are left out.
+USER_CLAIMS = ['phone', 'first_name', 'last_name', 'email', 'is_phone_verified']
+
+
+class UserRefreshToken(RefreshToken):
+    """Refresh token carrying user claims, with a denylist of jtis in ``RevokedToken``.
+
+    The denylist is a table rather than the cache so every worker sees it.
+    Entries are needed only until the token itself expires;
+    ``manage.py flush_revoked_tokens`` deletes them after that.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+    def verify(self):
+        super().verify()
+        if RevokedToken.objects.filter(jti=self.payload['jti']).exists():
+            raise TokenError("Token is denylisted")
+
+    def denylist(self):
+        """Add the token to the denylist. Returns False if it was already there."""
+        expires_at = datetime.fromtimestamp(self.payload['exp'], tz=timezone.utc)
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=self.payload['jti'], expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
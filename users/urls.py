@@ -1,20 +1,28 @@
 from django.urls import path
 from .views import (
-    SendOTPView, VerifyOTPView, MeView, CartView,
-    AddToCartView, RemoveFromCartView, CheckoutView, OrdersListView,
-    UserProfileView, NotificationsListView, NotificationMarkReadView
+    SendOTPView, VerifyOTPView, MeView, AsyncMeView, CartView,
+    AddToCartView, RemoveFromCartView, CheckoutView, CartPricePreviewView, OrdersListView,
+    UserProfileView, NotificationsListView, NotificationMarkReadView,
+    TokenRotateView, LogoutView, HomeFeedView, NotificationStreamView, NotificationPollView
 )
 
 urlpatterns = [
     path("send-otp/", SendOTPView.as_view(), name="send-otp"),
     path("verify-otp/", VerifyOTPView.as_view(), name="verify-otp"),
+    path("token/refresh/", TokenRotateView.as_view(), name="token-refresh"),
+    path("logout/", LogoutView.as_view(), name="logout"),
     path("me/", MeView.as_view(), name="me"),
+    path("me/async/", AsyncMeView.as_view(), name="me-async"),
+    path("home/", HomeFeedView.as_view(), name="home-feed"),
     path("profile/", UserProfileView.as_view(), name="user-profile"),
     path("cart/", CartView.as_view(), name="cart"),
     path("cart/add/", AddToCartView.as_view(), name="cart-add"),
     path("cart/remove/", RemoveFromCartView.as_view(), name="cart-remove"),
     path("cart/checkout/", CheckoutView.as_view(), name="checkout"),
+    path("cart/price-preview/", CartPricePreviewView.as_view(), name="cart-price-preview"),
     path("orders/", OrdersListView.as_view(), name="orders-list"),
     path("notifications/", NotificationsListView.as_view(), name="notifications-list"),
+    path("notifications/stream/", NotificationStreamView.as_view(), name="notifications-stream"),
+    path("notifications/poll/", NotificationPollView.as_view(), name="notifications-poll"),
     path("notifications/<int:pk>/read/", NotificationMarkReadView.as_view(), name="notification-mark-read"),
 ]
\ No newline at end of file
@@ -1,34 +1,80 @@
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenRefreshView
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import (
-    Cart, CartItem, Order, OrderItem, CourseEnrollment, Notification,
-    UserProfile, DiscountCode, PaymentHistory
+    CartItem, Order, OrderItem, CourseEnrollment, Notification, PaymentHistory
 )
 from .serializers import (
     SendOTPSerializer, VerifyOTPSerializer, UserSerializer, CartSerializer,
-    AddToCartSerializer, RemoveFromCartSerializer, CheckoutSerializer,
-    UserProfileSerializer, NotificationSerializer
+    AddToCartSerializer, RemoveFromCartSerializer,
+    UserProfileSerializer, NotificationSerializer, RotatingTokenRefreshSerializer,
+    LogoutSerializer, NotificationProjection, OrderProjection
 )
+from .tokens import UserRefreshToken
+from .context import user_context
+from .idempotency import idempotent
+from . import pricing
+from kelaasor_advance.throttling import OTPIPThrottle, OTPSendPhoneThrottle, OTPVerifyPhoneThrottle, athrottle
+from payments.gateways import GatewayError
+from payments.services import new_transaction_id, start_payment
+from .feed import SECTIONS, build_feed
+import asyncio
+import datetime
+import json
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
+from .authentication import aauthenticate
+from .realtime import get_broker, user_channel
 from products.models import Product
 
 
 class SendOTPView(generics.CreateAPIView):
     serializer_class = SendOTPSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPIPThrottle, OTPSendPhoneThrottle]
 
 
 class VerifyOTPView(generics.CreateAPIView):
     serializer_class = VerifyOTPSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [OTPIPThrottle, OTPVerifyPhoneThrottle]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
-        return Response({"message": "ورود موفق", "user_id": user.id, "phone": user.phone})
+        refresh = UserRefreshToken.for_user(user)
+        return Response({
+            "message": "ورود موفق",
+            "user_id": user.id,
+            "phone": user.phone,
+            "access": str(refresh.access_token),
+            "refresh": str(refresh),
+        })
+
+
+class TokenRotateView(TokenRefreshView):
+    serializer_class = RotatingTokenRefreshSerializer
+
+
+class LogoutView(generics.CreateAPIView):
+    serializer_class = LogoutSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"message": "خروج موفق"})
 
 
 class MeView(APIView):
@@ -42,21 +88,46 @@ class MeView(APIView):
         return Response(data)
 
 
+class AsyncMeView(View):
+    async def get(self, request):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        if throttled := await athrottle(request, user):
+            return throttled
+        data = UserSerializer(user).data
+        data['unread_notifications'] = await Notification.objects.filter(user_id=user.pk, is_read=False).acount()
+        return JsonResponse(data)
+
+
+class HomeFeedView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        fields = request.query_params.get('fields')
+        sections = [f.strip() for f in fields.split(',') if f.strip()] if fields else SECTIONS
+        unknown = [s for s in sections if s not in SECTIONS]
+        if unknown:
+            return Response(
+                {'detail': f"Unknown sections: {', '.join(unknown)}", 'sections': SECTIONS},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(build_feed(request.user, sections))
+
+
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
-        return profile
+        return user_context(self.request).profile
 
 
 class CartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(user_context(request).cart)
         return Response(serializer.data)
 
 
@@ -64,6 +135,7 @@ class AddToCartView(generics.CreateAPIView):
     serializer_class = AddToCartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
@@ -75,6 +147,7 @@ class RemoveFromCartView(generics.CreateAPIView):
     serializer_class = RemoveFromCartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
@@ -85,72 +158,105 @@ class RemoveFromCartView(generics.CreateAPIView):
 class CheckoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        if not profile.is_complete():
+        if settings.PAYMENT_GATEWAY not in settings.PAYMENT_GATEWAYS:
+            return Response({'detail': 'پرداخت در حال حاضر امکان‌پذیر نیست.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        # The gateway is only contacted after the order is committed, so its
+        # latency never holds the transaction open.
+        with transaction.atomic():
+            result = self.place_order(request)
+        if isinstance(result, Response):
+            return result
+        order, payment = result
+        try:
+            redirect_url = start_payment(payment).redirect_url
+        except GatewayError:
+            redirect_url = None
+
+        return Response({
+            'message': 'سفارش ثبت شد؛ پس از تایید پرداخت، دوره‌ها فعال می‌شوند.',
+            'order_id': order.id,
+            'total': str(order.total),
+            'transaction_id': payment.transaction_id,
+            'payment_status': payment.status,
+            'redirect_url': redirect_url,
+        }, status=status.HTTP_201_CREATED)
+
+    def place_order(self, request):
+        context = user_context(request)
+        if not context.profile_complete:
             return Response({
                 'detail': 'لطفاً اطلاعات پروفایل خود را تکمیل کنید.'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        if not cart.items.exists():
+        items = context.cart_items
+        if not items:
             return Response({'detail': 'سبد خرید خالی است.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        for item in cart.items.all():
-            if CourseEnrollment.objects.filter(user=request.user, product=item.product).exists():
+        purchased = set(CourseEnrollment.objects.filter(
+            user=request.user, product_id__in=[item.product_id for item in items]
+        ).values_list('product_id', flat=True))
+        for item in items:
+            if item.product_id in purchased:
                 return Response({'detail': f'دوره "{item.product.title}" قبلاً خریداری شده است.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total = sum(item.product.price for item in cart.items.all())
-
-        discount_code_str = request.data.get('discount_code')
-        discount_code = None
-        if discount_code_str:
-            try:
-                discount_code = DiscountCode.objects.get(code=discount_code_str)
-            except DiscountCode.DoesNotExist:
-                return Response({'detail': 'کد تخفیف نامعتبر است.'}, status=status.HTTP_400_BAD_REQUEST)
-            if not discount_code.is_valid(user=request.user):
+        try:
+            quote = pricing.price_cart(
+                request.user.pk, [item.product for item in items], request.data.get('discount_code') or None
+            )
+        except pricing.PricingError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if quote.rule is not None:
+            if not pricing.claim_use(quote.rule):
                 return Response({'detail': 'کد تخفیف منقضی یا نامعتبر است.'}, status=status.HTTP_400_BAD_REQUEST)
-            total = discount_code.apply_discount_for_item(total)
-            discount_code.used_count += 1
-            discount_code.save()
+            if quote.rule.max_usage:
+                pricing.invalidate()
+        total = quote.total
 
-        order = Order.objects.create(user=request.user, total=total, discount_code=discount_code)
+        order = Order.objects.create(
+            user=request.user, total=total, discount_code_id=quote.rule.id if quote.rule else None
+        )
 
-        for item in cart.items.all():
-            OrderItem.objects.create(order=order, product=item.product, price=item.product.price)
+        for item, priced in zip(items, quote.items):
+            OrderItem.objects.create(order=order, product=item.product, price=priced.final_price, discount=priced.discount)
             access_expires_at = None
             if item.product.course_type == 'offline' and item.product.access_expiration:
-                access_expires_at = timezone.make_aware(item.product.access_expiration)
+                access_expires_at = timezone.make_aware(
+                    datetime.datetime.combine(item.product.access_expiration, datetime.time.min)
+                )
             CourseEnrollment.objects.create(
                 user=request.user,
                 product=item.product,
                 order=order,
                 access_expires_at=access_expires_at,
-                is_active=True
+                is_active=False
             )
 
-        PaymentHistory.objects.create(
+        payment = PaymentHistory.objects.create(
             order=order,
             amount=total,
-            status='completed',
-            payment_method='manual'
+            status='pending',
+            payment_method=settings.PAYMENT_GATEWAY,
+            transaction_id=new_transaction_id()
         )
 
-        Notification.objects.create(
-            user=request.user,
-            title='سفارش ثبت شد',
-            message=f'سفارش شماره {order.id} با موفقیت ثبت شد.',
-            notification_type='order_confirmed'
-        )
+        CartItem.objects.filter(cart=context.cart).delete()
+        context.forget_cart()
+        return order, payment
 
-        cart.items.all().delete()
 
-        return Response({
-            'message': 'سفارش با موفقیت ثبت شد.',
-            'order_id': order.id,
-            'total': str(total)
-        }, status=status.HTTP_201_CREATED)
+class CartPricePreviewView(APIView):
+    """What checkout would charge for the current cart, optionally with ``?discount_code=``."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        products = [item.product for item in CartItem.objects.filter(cart__user=request.user).select_related('product')]
+        try:
+            quote = pricing.price_cart(request.user.pk, products, request.query_params.get('discount_code') or None)
+        except pricing.PricingError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(quote.as_dict())
 
 
 class MyCoursesView(APIView):
@@ -173,19 +279,35 @@ class OrdersListView(APIView):
 
     def get(self, request):
         orders = Order.objects.filter(user=request.user).order_by('-created_at')
-        data = []
-        for o in orders:
-            items = [{'product': it.product.title, 'price': str(it.price)} for it in o.items.all()]
-            data.append({'id': o.id, 'total': str(o.total), 'created_at': o.created_at, 'items': items})
-        return Response(data)
+        return Response(OrderProjection().project(orders))
 
 
 class NotificationsListView(generics.ListAPIView):
+    """Newest first, ``NOTIFICATION_PAGE_SIZE`` at a time; the ``Link`` header points to the next page."""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        try:
+            before = parse_datetime(self.request.query_params.get('before', ''))
+        except ValueError:
+            raise ValidationError({'before': 'Invalid datetime.'})
+        before_id = self.request.query_params.get('before_id', '')
+        return Notification.objects.filter(user=self.request.user).newest_first(
+            before, int(before_id) if before_id.isdigit() else None,
+        )
+
+    def list(self, request, *args, **kwargs):
+        size = settings.NOTIFICATION_PAGE_SIZE
+        rows = NotificationProjection().project(self.get_queryset()[:size + 1])
+        if len(rows) <= size:
+            return Response(rows)
+        rows = rows[:size]
+        query = request.query_params.copy()
+        query.setlist('before', [rows[-1]['created_at']])
+        query.setlist('before_id', [str(rows[-1]['id'])])
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        return Response(rows, headers={'Link': f'<{next_url}>; rel="next"'})
 
 
 class NotificationMarkReadView(APIView):
@@ -197,3 +319,94 @@ class NotificationMarkReadView(APIView):
         notif.save(update_fields=['is_read'])
         return Response({'message': 'Marked as read'})
 
+
+def notification_backlog(user_id, after, limit=50):
+    """Notifications newer than ``after`` (oldest first) and the unread count."""
+    missed = []
+    if after is not None:
+        queryset = Notification.objects.filter(user_id=user_id, pk__gt=after).order_by('pk')[:limit]
+        missed = NotificationProjection().project(queryset)
+    return missed, Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+
+def parse_event_id(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def sse_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, cls=DjangoJSONEncoder)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class NotificationStreamView(View):
+    """Server-sent events: ``notification`` and ``unread`` events for the current user.
+
+    Reconnecting clients send ``Last-Event-ID`` (or ``?after=``) and get what
+    they missed first. Streams end after ``NOTIFICATION_STREAM_MAX_SECONDS``
+    and EventSource reconnects, which also re-checks the access token.
+    """
+
+    async def get(self, request):
+        user = await aauthenticate(request, query_param='token')
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        if throttled := await athrottle(request, user):
+            return throttled
+        after = parse_event_id(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+        response = StreamingHttpResponse(self.events(user.pk, after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, user_id, after):
+        loop = asyncio.get_running_loop()
+        keepalive = getattr(settings, 'NOTIFICATION_STREAM_KEEPALIVE', 15)
+        deadline = loop.time() + getattr(settings, 'NOTIFICATION_STREAM_MAX_SECONDS', 300)
+        # Subscribe before reading the backlog so nothing created in between is lost;
+        # what the backlog already sent is then skipped when it also arrives live.
+        async with get_broker().subscribe(user_channel(user_id)) as subscription:
+            yield "retry: 3000\n\n"
+            missed, unread = await sync_to_async(notification_backlog)(user_id, after)
+            for row in missed:
+                yield sse_event('notification', row, row['id'])
+            yield sse_event('unread', {'unread': unread})
+            sent = missed[-1]['id'] if missed else after
+            while (remaining := deadline - loop.time()) > 0:
+                message = await subscription.get(min(keepalive, remaining))
+                if message is None:
+                    yield ": keepalive\n\n"
+                elif message['event'] == 'notification':
+                    if sent is None or message['id'] > sent:
+                        yield sse_event('notification', message['notification'], message['id'])
+                    yield sse_event('unread', {'unread': message['unread']})
+                else:
+                    yield sse_event('unread', {'unread': message['unread']})
+
+
+class NotificationPollView(View):
+    """Long poll: answers as soon as there is something newer than ``?after=``, or after ``?timeout=`` seconds."""
+
+    async def get(self, request):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        if throttled := await athrottle(request, user):
+            return throttled
+        after = parse_event_id(request.GET.get('after'))
+        limit = getattr(settings, 'NOTIFICATION_LONGPOLL_TIMEOUT', 25)
+        timeout = parse_event_id(request.GET.get('timeout'))
+        timeout = limit if timeout is None else min(timeout, limit)
+
+        async with get_broker().subscribe(user_channel(user.pk)) as subscription:
+            missed, unread = await sync_to_async(notification_backlog)(user.pk, after)
+            if missed or not timeout:
+                return JsonResponse({'notifications': missed, 'unread': unread})
+            message = await subscription.get(timeout)
+        if message is None:
+            return JsonResponse({'notifications': [], 'unread': unread})
+        # A notification the client already has (``after``) only updates the count.
+        seen = message['event'] != 'notification' or (after is not None and message['id'] <= after)
+        notifications = [] if seen else [message['notification']]
+        return JsonResponse({'notifications': notifications, 'unread': message['unread']})
+